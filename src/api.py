@@ -3,14 +3,45 @@ FastAPI REST API for ML Reasoning System
 Exposes the pipeline as a web service
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional
+import asyncio
+import csv
+import hmac
+import io
+import json
+import os
 import uvicorn
 from datetime import datetime
 
 from main import MLReasoningPipeline
+from scheduler import SolveScheduler, QueueFullError
+from jobs import JobStore, JobRunner
+from data_loader import iter_problem_chunks
+from llm_transport import llm_transport
+from config import (
+    ADMIN_TOKEN, PROFILE_DIR, PROFILE_MAX_SECONDS, ASYNC_VERIFICATION, LOAD_SHEDDING,
+    FAST_JSON_RESPONSES, RESPONSE_COMPRESSION, RESPONSE_COMPRESSION_MIN_SIZE
+)
+from profiler import SamplingProfiler
+from records import ReasoningResult
+from tracing import tracer, extract_traceparent
+from usage_ledger import UsageBudget, usage_ledger
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli-asgi is optional; gzip is used instead
+    BrotliMiddleware = None
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,11 +61,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large bodies (batch results, job pages) for clients that accept it
+if RESPONSE_COMPRESSION:
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Server span per request, continuing the caller's W3C traceparent if present"""
+    if not tracer.enabled:
+        return await call_next(request)
+    
+    parent = extract_traceparent(request.headers.get("traceparent"))
+    with tracer.span(f"{request.method} {request.url.path}", parent=parent) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"  # Template, not the raw path
+        span.set_attributes({
+            "http.method": request.method,
+            "http.target": request.url.path,
+            "http.status_code": response.status_code
+        })
+    if span.recording:
+        response.headers["traceparent"] = span.context.traceparent()
+    return response
+
+
 # Request/Response Models
 class ReasoningRequest(BaseModel):
     """Request model for reasoning endpoint"""
     question: str = Field(..., description="The problem statement or question to solve", min_length=10)
     options: List[str] = Field(..., description="List of exactly 5 answer options", min_items=5, max_items=5)
+    max_cost: Optional[float] = Field(None, ge=0, description="USD budget; near it, a cheaper prompt is used, and past it no LLM call")
+    max_tokens: Optional[int] = Field(None, gt=0, description="Token budget; near it, a cheaper prompt is used, and past it no LLM call")
     
     class Config:
         schema_extra = {
@@ -54,6 +116,17 @@ class ReasoningResponse(BaseModel):
     category: str = Field(..., description="Detected problem category")
     category_confidence: float = Field(..., description="Category classification confidence")
     timestamp: str = Field(..., description="Processing timestamp")
+    queue_wait_ms: Optional[float] = Field(None, description="Time spent waiting for a solver worker")
+    solve_ms: Optional[float] = Field(None, description="Time spent solving once scheduled")
+    tokens_used: Optional[int] = Field(None, description="Tokens spent on this request (all LLM calls)")
+    cost_usd: Optional[float] = Field(None, description="Priced cost of this request")
+    budget_degraded: bool = Field(False, description="True if the budget forced a cheaper prompt")
+    verification: Optional[str] = Field(
+        None, description="pending while a background re-check runs; confirmed, revised or unresolved after it"
+    )
+    degraded: Optional[str] = Field(
+        None, description="Set when load shedding answered below full quality: near_duplicate, short or fallback"
+    )
     
     class Config:
         schema_extra = {
@@ -64,11 +137,49 @@ class ReasoningResponse(BaseModel):
                 "reasoning": "This is an arithmetic sequence with a common difference of 2. Starting from 2, we add 2 each time: 2+2=4, 4+2=6, 6+2=8, 8+2=10.",
                 "category": "Sequence solving",
                 "category_confidence": 0.92,
-                "timestamp": "2025-10-08T12:34:56"
+                "timestamp": "2025-10-08T12:34:56",
+                "queue_wait_ms": 3.2,
+                "solve_ms": 1840.5,
+                "tokens_used": 612,
+                "cost_usd": 0.00018,
+                "budget_degraded": False,
+                "verification": None,
+                "degraded": None
             }
         }
 
 
+RESPONSE_FIELDS = tuple(ReasoningResponse.model_fields)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (compact stdlib json without it)"""
+    
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class JobStatusResponse(BaseModel):
+    """Progress and partial results of an asynchronous job"""
+    id: str
+    status: str = Field(..., description="queued, running, completed or failed")
+    total: int
+    completed: int
+    failed: int
+    progress: float = Field(..., description="Fraction of items finished (0.0-1.0)")
+    max_cost: Optional[float] = None
+    max_tokens: Optional[int] = None
+    spent_cost: float = 0.0
+    spent_tokens: int = 0
+    error: Optional[str] = Field(None, description="Why the job failed, when status is failed")
+    callback_url: Optional[str] = Field(None, description="URL POSTed the job status when it finishes")
+    created_at: str
+    updated_at: str
+    results: List[dict] = Field(default_factory=list, description="Page of finished item results")
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
@@ -76,30 +187,51 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 
-# Global pipeline instance (loaded on startup)
+# Global pipeline instance and solve scheduler (created on startup)
 pipeline: Optional[MLReasoningPipeline] = None
+scheduler: Optional[SolveScheduler] = None
+job_store: Optional[JobStore] = None
+job_runner: Optional[JobRunner] = None
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize pipeline on startup"""
-    global pipeline
+    global pipeline, scheduler, job_store, job_runner
     print("Initializing ML Reasoning Pipeline...")
     try:
         # Try to load existing model first (faster)
-        pipeline = MLReasoningPipeline(train_model=False)
+        pipeline = MLReasoningPipeline(train_model=False, verify=ASYNC_VERIFICATION)
         print("✓ Pipeline loaded successfully (using cached model)")
     except:
         # If no cached model, train from scratch
         print("No cached model found. Training new model...")
-        pipeline = MLReasoningPipeline(train_model=True)
+        pipeline = MLReasoningPipeline(train_model=True, verify=ASYNC_VERIFICATION)
         print("✓ Pipeline initialized successfully (new model trained)")
+    
+    scheduler = SolveScheduler()
+    if LOAD_SHEDDING:
+        pipeline.enable_load_shedding(scheduler)
+    
+    # Jobs persisted by a previous run continue from their pending items
+    job_store = JobStore()
+    job_runner = JobRunner(job_store, scheduler, pipeline.process_single_problem, verifier=pipeline.verifier)
+    resumed = job_runner.resume()
+    if resumed:
+        print(f"✓ Resumed {len(resumed)} unfinished job(s)")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("Shutting down ML Reasoning Pipeline...")
+    if scheduler is not None:
+        scheduler.shutdown()
+    if pipeline is not None and pipeline.verifier is not None:
+        pipeline.verifier.shutdown()
+    usage_ledger.flush()
+    llm_transport.flush()
+    tracer.flush()
 
 
 @app.get("/", response_model=dict)
@@ -112,7 +244,12 @@ async def root():
         "health": "/health",
         "endpoints": {
             "solve": "POST /solve - Solve a reasoning problem",
-            "health": "GET /health - Health check"
+            "health": "GET /health - Health check",
+            "metrics": "GET /metrics - Routing, hedging, token/cost, scheduler, verification and load metrics",
+            "jobs": "POST /jobs - Submit a large batch or CSV as an asynchronous job",
+            "job_status": "GET /jobs/{id} - Job progress and partial results",
+            "job_results": "GET /jobs/{id}/results?format=csv|jsonl - Download results",
+            "profile": "POST /admin/profile?seconds=N - Capture a sampling profile (admin token)"
         }
     }
 
@@ -127,8 +264,105 @@ async def health_check():
     }
 
 
+@app.get("/metrics", response_model=dict)
+async def metrics():
+    """LLM routing, request-hedging, token/cost usage, scheduler queue, verification and load-shedding metrics"""
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    metrics = {
+        **pipeline.reasoning_system.metrics(),
+        'scheduler': scheduler.snapshot()
+    }
+    if pipeline.verifier is not None:
+        metrics['verification'] = pipeline.verifier.snapshot()
+    if pipeline.load_monitor is not None:
+        metrics['load'] = pipeline.load_monitor.snapshot()
+    return metrics
+
+
+def _client_id(http_request: Request) -> str:
+    """Identify the caller for per-client fairness"""
+    return http_request.headers.get("X-Client-ID") or (
+        http_request.client.host if http_request.client else "anonymous"
+    )
+
+
+def _queue_full(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _trace_queue_wait(job):
+    """Record the time a scheduled job waited for a worker as a span"""
+    if job.started_at is not None:
+        tracer.record_span('scheduler.queue', job.enqueued_at, job.started_at,
+                           {'scheduler.priority': job.priority})
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Validate a comma-separated `fields` selection against ReasoningResponse"""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RESPONSE_FIELDS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields {unknown}; choose from {', '.join(RESPONSE_FIELDS)}"
+        )
+    return names
+
+
+def _render(payload, fields: Optional[List[str]]):
+    """
+    Serialize /solve and /batch-solve payloads
+    
+    The payloads are built here from pipeline results, so the fast path returns
+    them directly and skips FastAPI's response_model validation and encoding.
+    A field selection is always served this way, since it is not a full model.
+    """
+    if fields is not None:
+        if isinstance(payload, list):
+            payload = [{name: item[name] for name in fields} for item in payload]
+        else:
+            payload = {name: payload[name] for name in fields}
+        return FastJSONResponse(payload)
+    if FAST_JSON_RESPONSES:
+        return FastJSONResponse(payload)
+    return payload
+
+
+def _build_response(result: ReasoningResult, options: List[str], job, budget: UsageBudget) -> Dict:
+    """Assemble a ReasoningResponse payload from a pipeline result (job is None if it was never queued)"""
+    answer_index = result.predicted_answer - 1  # Convert to 0-indexed
+    if 0 <= answer_index < len(options):
+        answer_text = options[answer_index]
+    else:
+        answer_text = "Invalid answer index"
+    
+    return {
+        "predicted_answer": result.predicted_answer,
+        "answer_text": answer_text,
+        "confidence": result.confidence,
+        "reasoning": result.reasoning,
+        "category": result.category,
+        "category_confidence": result.category_confidence,
+        "timestamp": datetime.now().isoformat(),
+        "queue_wait_ms": job.queue_wait_ms if job is not None else None,
+        "solve_ms": job.solve_ms if job is not None else None,
+        "tokens_used": budget.spent_tokens,
+        "cost_usd": budget.spent_cost,
+        "budget_degraded": result.budget_degraded,
+        "verification": result.verification,
+        "degraded": result.degraded
+    }
+
+
 @app.post("/solve", response_model=ReasoningResponse)
-async def solve_problem(request: ReasoningRequest):
+async def solve_problem(request: ReasoningRequest, http_request: Request, fields: Optional[str] = None):
     """
     Solve a reasoning problem
     
@@ -136,59 +370,60 @@ async def solve_problem(request: ReasoningRequest):
     
     - **question**: The problem statement (minimum 10 characters)
     - **options**: Exactly 5 answer options as a list
+    - **max_cost** / **max_tokens**: Optional budget; near it, a cheaper prompt is used, and a solve it cannot pay for gets a fallback answer without an LLM call
+    - **fields** (query): Comma-separated response fields to return, e.g. `predicted_answer,confidence`
     
     Returns the predicted answer (1-5), confidence score, and detailed reasoning.
+    Runs at interactive priority. Under load the answer may be degraded (see the
+    `degraded` field); when the queue is full, a cached or local-engine answer is
+    returned if there is one, otherwise 429 with Retry-After.
     """
     if pipeline is None:
         raise HTTPException(status_code=503, detail="Pipeline not initialized")
     
+    # Validate options
+    if len(request.options) != 5:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected exactly 5 options, got {len(request.options)}"
+        )
+    selected = _parse_fields(fields)
+    
+    budget = UsageBudget(request.max_cost, request.max_tokens)
     try:
-        # Validate options
-        if len(request.options) != 5:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Expected exactly 5 options, got {len(request.options)}"
-            )
-        
-        # Process the problem
-        result = pipeline.process_single_problem(
-            problem=request.question,
-            options=request.options
+        job = scheduler.submit(
+            pipeline.process_single_problem, request.question, request.options, budget,
+            priority='interactive', client_id=_client_id(http_request)
         )
-        
-        # Get the answer text
-        answer_index = result['predicted_answer'] - 1  # Convert to 0-indexed
-        if 0 <= answer_index < len(request.options):
-            answer_text = request.options[answer_index]
-        else:
-            answer_text = "Invalid answer index"
-        
-        # Build response
-        response = {
-            "predicted_answer": result['predicted_answer'],
-            "answer_text": answer_text,
-            "confidence": result['confidence'],
-            "reasoning": result['reasoning'],
-            "category": result['category'],
-            "category_confidence": result['category_confidence'],
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        return response
-        
+    except QueueFullError as e:
+        result = None
+        if pipeline.load_monitor is not None:
+            result = await run_in_threadpool(pipeline.answer_without_queue, request.question, request.options)
+        if result is None:
+            raise _queue_full(e)
+        return _render(_build_response(result, request.options, None, budget), selected)
+    
+    try:
+        result = await asyncio.wrap_future(job.future)
+        _trace_queue_wait(job)
+        response = _build_response(result, request.options, job, budget)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing request: {str(e)}"
         )
+    return _render(response, selected)
 
 
 @app.post("/batch-solve", response_model=List[ReasoningResponse])
-async def batch_solve(requests: List[ReasoningRequest]):
+async def batch_solve(requests: List[ReasoningRequest], http_request: Request,
+                      fields: Optional[str] = None):
     """
     Solve multiple reasoning problems in batch
     
     Takes a list of questions and their options, returns predictions for all.
+    Items run at batch priority, so they only use capacity left by interactive calls.
+    Pass `fields=predicted_answer,confidence` to drop the reasoning text from large batches.
     """
     if pipeline is None:
         raise HTTPException(status_code=503, detail="Pipeline not initialized")
@@ -198,41 +433,187 @@ async def batch_solve(requests: List[ReasoningRequest]):
             status_code=400,
             detail="Maximum 100 requests allowed in batch"
         )
+    selected = _parse_fields(fields)
     
-    results = []
+    budgets = [UsageBudget(req.max_cost, req.max_tokens) for req in requests]
+    try:
+        jobs = scheduler.submit_many(
+            [(pipeline.process_single_problem, (req.question, req.options, budget), {})
+             for req, budget in zip(requests, budgets)],
+            priority='batch', client_id=_client_id(http_request)
+        )
+    except QueueFullError as e:
+        raise _queue_full(e)
     
-    for req in requests:
-        try:
-            result = pipeline.process_single_problem(
-                problem=req.question,
-                options=req.options
-            )
-            
-            answer_index = result['predicted_answer'] - 1
-            answer_text = req.options[answer_index] if 0 <= answer_index < len(req.options) else "Invalid"
-            
-            results.append({
-                "predicted_answer": result['predicted_answer'],
-                "answer_text": answer_text,
-                "confidence": result['confidence'],
-                "reasoning": result['reasoning'],
-                "category": result['category'],
-                "category_confidence": result['category_confidence'],
-                "timestamp": datetime.now().isoformat()
-            })
-        except Exception as e:
+    outcomes = await asyncio.gather(
+        *(asyncio.wrap_future(job.future) for job in jobs), return_exceptions=True
+    )
+    
+    results = []
+    for req, job, budget, outcome in zip(requests, jobs, budgets, outcomes):
+        _trace_queue_wait(job)
+        if not isinstance(outcome, Exception):
+            results.append(_build_response(outcome, req.options, job, budget))
+        else:
             # Add error entry
             results.append({
                 "predicted_answer": 3,
                 "answer_text": "Error",
                 "confidence": 0.0,
-                "reasoning": f"Error: {str(e)}",
+                "reasoning": f"Error: {str(outcome)}",
                 "category": "Unknown",
                 "category_confidence": 0.0,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "queue_wait_ms": job.queue_wait_ms,
+                "solve_ms": job.solve_ms,
+                "tokens_used": budget.spent_tokens,
+                "cost_usd": budget.spent_cost,
+                "budget_degraded": False,
+                "verification": None,
+                "degraded": None
             })
     
-    return results
+    return _render(results, selected)
+
+
+def _iter_csv_items(upload_file):
+    """Stream (problem, options) pairs from an uploaded CSV in the test.csv schema"""
+    for chunk in iter_problem_chunks(upload_file):
+        for _, problem, options in chunk.iter_rows():
+            yield problem, list(options.values())
+
+
+@app.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def create_job(http_request: Request, max_cost: Optional[float] = None,
+                     max_tokens: Optional[int] = None, callback_url: Optional[str] = None):
+    """
+    Submit an asynchronous batch job
+    
+    Accepts either a JSON list of reasoning requests (any length) or a multipart
+    upload with a `file` field holding a CSV in the test.csv schema. Returns the
+    job id immediately; poll `GET /jobs/{id}` for progress. The optional
+    `max_cost`/`max_tokens` query parameters budget the whole job. With a
+    `callback_url`, the job's final status is also POSTed there (as returned
+    by `GET /jobs/{id}`, without results) when it completes or fails.
+    """
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    if callback_url is not None and not callback_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL")
+    
+    client_id = _client_id(http_request)
+    content_type = http_request.headers.get("content-type", "")
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "file"):
+            raise HTTPException(status_code=400, detail="Expected a CSV upload in the 'file' field")
+        try:
+            job_id = await run_in_threadpool(
+                job_store.create_job, _iter_csv_items(upload.file), client_id,
+                max_cost=max_cost, max_tokens=max_tokens, callback_url=callback_url
+            )
+        except (ValueError, KeyError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
+    else:
+        try:
+            payload = await http_request.json()
+            if not isinstance(payload, list):
+                raise ValueError("expected a list of requests")
+            items = [ReasoningRequest(**item) for item in payload]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid job payload: {str(e)}")
+        job_id = await run_in_threadpool(
+            job_store.create_job, ((item.question, item.options) for item in items), client_id,
+            max_cost=max_cost, max_tokens=max_tokens, callback_url=callback_url
+        )
+    
+    job_runner.start(job_id)
+    return job_store.get_job(job_id)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, offset: int = 0, limit: int = 100):
+    """Job progress plus a page of finished results (in row order)"""
+    if job_store is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    job['results'] = list(job_store.iter_results(job_id, offset=offset, limit=limit))
+    return job
+
+
+@app.get("/jobs/{job_id}/results")
+async def download_job_results(job_id: str, format: str = "jsonl"):
+    """Stream all finished results as CSV or JSONL (partial while the job runs)"""
+    if job_store is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    if job_store.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    if format == "jsonl":
+        lines = (json.dumps(result) + "\n" for result in job_store.iter_results(job_id))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    
+    if format == "csv":
+        columns = ['row_index', 'predicted_answer', 'confidence', 'category', 'status']
+        
+        def rows():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            for result in job_store.iter_results(job_id):
+                writer.writerow(result)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        
+        return StreamingResponse(
+            rows(), media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={job_id}.csv"}
+        )
+    
+    raise HTTPException(status_code=400, detail="format must be 'csv' or 'jsonl'")
+
+
+_profile_lock = asyncio.Lock()
+
+
+@app.post("/admin/profile")
+async def capture_profile(http_request: Request, seconds: float = 10.0, format: str = "speedscope"):
+    """
+    Capture a time-boxed sampling profile of the running server
+    
+    Requires the `X-Admin-Token` header to match `ADMIN_TOKEN`. Returns the
+    profile file (speedscope JSON or collapsed stacks); a copy is kept in PROFILE_DIR.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    # Constant-time comparison, so response timing does not reveal the token
+    supplied = http_request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    if format not in ("speedscope", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be 'speedscope' or 'collapsed'")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}]")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already being captured")
+    
+    async with _profile_lock:
+        profiler = SamplingProfiler().start(seconds)
+        await asyncio.sleep(seconds)
+        profiler.stop()
+    
+    extension = "speedscope.json" if format == "speedscope" else "collapsed.txt"
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.{extension}")
+    await run_in_threadpool(profiler.write, path, format)
+    return FileResponse(path, filename=os.path.basename(path),
+                        headers={"X-Profile-Samples": str(profiler.samples)})
 
 
 def run_server(host: str = "0.0.0.0", port: int = 8000, reload: bool = False):
@@ -0,0 +1,521 @@
+"""
+Benchmarks
+- api: in-process API load test comparing response serialization paths
+  (validated pydantic responses vs the orjson fast path, with and without `fields=`)
+- hotpath: micro-benchmarks of the per-solve CPU work around the LLM call
+  (prompt build, option pre-filter, response parsing), with a saved-baseline check
+- memory: memory held by kept results (ReasoningResult records vs plain dicts)
+- classifier: category classifier size, per-item latency and accuracy before
+  and after each compression step (pruned vocabulary without 3-grams,
+  float32/int8 weights, direct TF-IDF transform)
+- distributed: coordinator throughput with 1, 2, 4... local worker processes
+  against a fixed-latency stub pipeline standing in for the LLM
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from config import CATEGORY_PROMPTS, TRAIN_FILE
+from data_loader import OPTION_COLUMNS, OPTION_KEYS
+from records import ReasoningResult
+
+# Reasoning text of typical full chain-of-thought length
+_CANNED_REASONING = ("Step 1: list the terms and their differences. The differences are constant, "
+                     "so the sequence is arithmetic and the next term follows directly. ") * 12
+
+_REQUEST = {
+    'question': 'What is the next number in the sequence: 2, 4, 6, 8, ?',
+    'options': ['9', '10', '11', '12', '13']
+}
+
+
+class _CannedPipeline:
+    """Returns a fixed result immediately, so the benchmark measures only the API layer"""
+
+    load_monitor = None
+
+    def process_single_problem(self, problem: str, options: List[str], budget=None) -> ReasoningResult:
+        result = ReasoningResult(2, 0.87, _CANNED_REASONING, 'regex', 'Sequence solving')
+        result.category = 'Sequence solving'
+        result.category_confidence = 0.93
+        return result
+
+
+async def _load(client: httpx.AsyncClient, path: str, body, requests: int,
+                concurrency: int) -> Dict:
+    remaining = iter(range(requests))
+    wire_bytes = body_bytes = 0
+
+    async def user():
+        nonlocal wire_bytes, body_bytes
+        for _ in remaining:
+            response = await client.post(path, json=body)
+            response.raise_for_status()
+            wire_bytes += response.num_bytes_downloaded
+            body_bytes += len(response.content)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return {'wire_bytes': wire_bytes / requests, 'body_bytes': body_bytes / requests}
+
+
+def run_api_benchmark(requests: int = 200, batch: int = 100, concurrency: int = 8,
+                      fast: bool = True, fields: Optional[str] = None,
+                      compress: bool = False) -> Dict:
+    """
+    Drive /batch-solve (or /solve when batch is 0) in-process through the ASGI app
+
+    CPU time covers client and server, which share the process; the ratio
+    between runs is what matters.
+
+    Returns:
+        Throughput (requests and items per second and per CPU-second) and body sizes
+    """
+    import api
+    from scheduler import SolveScheduler
+
+    api.pipeline = _CannedPipeline()
+    api.scheduler = SolveScheduler()
+    configured, api.FAST_JSON_RESPONSES = api.FAST_JSON_RESPONSES, fast
+    path = '/batch-solve' if batch else '/solve'
+    if fields:
+        path += f'?fields={fields}'
+    body = [_REQUEST] * batch if batch else _REQUEST
+    headers = {'Accept-Encoding': 'gzip, br' if compress else 'identity'}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench',
+                                     headers=headers) as client:
+            await _load(client, path, body, max(concurrency, 4), concurrency)  # Warm-up
+            wall, cpu = time.perf_counter(), time.process_time()
+            sizes = await _load(client, path, body, requests, concurrency)
+            return sizes, time.perf_counter() - wall, time.process_time() - cpu
+
+    try:
+        sizes, wall, cpu = asyncio.run(run())
+    finally:
+        api.scheduler.shutdown()
+        api.FAST_JSON_RESPONSES = configured
+
+    items = requests * (batch or 1)
+    return {
+        'requests': requests,
+        'requests_per_sec': requests / wall,
+        'items_per_sec': items / wall,
+        'items_per_cpu_sec': items / cpu if cpu else float('inf'),
+        'cpu_ms_per_request': cpu / requests * 1000,
+        **sizes
+    }
+
+
+def print_api_results(results: Dict[str, Dict]):
+    print("\n" + "=" * 80)
+    print("API SERIALIZATION BENCHMARK")
+    print("=" * 80)
+    print(f"{'Mode':<22}{'req/s':>9}{'items/s':>11}{'items/CPU-s':>13}{'CPU ms/req':>12}"
+          f"{'body KB':>10}{'wire KB':>10}")
+    for label, r in results.items():
+        print(f"{label:<22}{r['requests_per_sec']:>9.1f}{r['items_per_sec']:>11.0f}"
+              f"{r['items_per_cpu_sec']:>13.0f}{r['cpu_ms_per_request']:>12.2f}"
+              f"{r['body_bytes'] / 1024:>10.1f}{r['wire_bytes'] / 1024:>10.1f}")
+
+    baseline = results.get('validated')
+    if baseline:
+        print()
+        for label, r in results.items():
+            if label != 'validated':
+                speedup = r['items_per_cpu_sec'] / baseline['items_per_cpu_sec']
+                print(f"{label}: {speedup:.2f}x throughput per core vs validated")
+
+
+def _time_per_call(fn: Callable, inputs: List, min_seconds: float) -> float:
+    """Mean microseconds per call, cycling through inputs for at least min_seconds"""
+    calls, start = 0, time.perf_counter()
+    while True:
+        for item in inputs:
+            fn(item)
+        calls += len(inputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls * 1e6
+
+
+def _sample_responses() -> List[str]:
+    """Responses in the shapes the parser sees: short, long chain-of-thought, unparseable"""
+    step = "Step {i}: compare the option against the constraints; it does not fit, so move on.\n"
+    long_reasoning = ''.join(step.format(i=i) for i in range(40))
+    return [
+        "REASONING: The differences grow by 2 each time, so the next term is 42.\nANSWER: 3\nCONFIDENCE: 0.9\n",
+        f"REASONING: {long_reasoning}ANSWER: 2\nCONFIDENCE: 0.75\n",
+        f"Let me think.\n{long_reasoning}So the best choice is option 4, I think.",
+    ]
+
+
+def run_hotpath_benchmark(samples: int = 100, min_seconds: float = 0.5) -> Dict[str, float]:
+    """
+    Microseconds per call for the CPU work done around each LLM call
+
+    Agents are built without an LLM; problems come from train.csv.
+
+    Returns:
+        {benchmark name: microseconds per call}
+    """
+    import pandas as pd
+    from option_filter import analyze_options
+    from reasoning_agents import SpecializedReasoningAgent
+
+    df = pd.read_csv(TRAIN_FILE).head(samples)
+    problems = [
+        (topic, problem, dict(zip(OPTION_KEYS, row)))
+        for topic, problem, *row in zip(df['topic'], df['problem_statement'],
+                                        *(df[column].astype(str) for column in OPTION_COLUMNS))
+    ]
+    agents = {category: SpecializedReasoningAgent(category, llm=None) for category in CATEGORY_PROMPTS}
+    parser = agents['Sequence solving']
+    responses = _sample_responses()
+
+    return {
+        'prompt_build': _time_per_call(
+            lambda item: agents[item[0]]._prepare(item[1], item[2], None), problems, min_seconds),
+        'option_filter': _time_per_call(
+            lambda item: analyze_options(item[1], item[2]), problems, min_seconds),
+        'parse_short': _time_per_call(parser._parse_response, responses[:1], min_seconds),
+        'parse_long': _time_per_call(parser._parse_response, responses[1:2], min_seconds),
+        'parse_fallback': _time_per_call(parser._parse_response, responses[2:], min_seconds),
+    }
+
+
+def check_regressions(results: Dict[str, float], baseline: Dict[str, float],
+                      tolerance: float) -> List[str]:
+    """Names of benchmarks slower than baseline by more than ``tolerance`` (a fraction)"""
+    return [name for name, micros in results.items()
+            if name in baseline and micros > baseline[name] * (1 + tolerance)]
+
+
+def print_hotpath_results(results: Dict[str, float], baseline: Optional[Dict[str, float]] = None):
+    print("\n" + "=" * 80)
+    print("HOT PATH MICRO-BENCHMARKS (us per call)")
+    print("=" * 80)
+    for name, micros in results.items():
+        line = f"{name:<20}{micros:>10.2f}"
+        if baseline and name in baseline:
+            line += f"   baseline {baseline[name]:>9.2f}  ({micros / baseline[name] - 1:+.1%})"
+        print(line)
+
+
+def _measure(build: Callable[[], List]) -> Dict[str, float]:
+    """Build time, then traced bytes still held by what ``build`` returns"""
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    start = time.perf_counter()
+    kept = build()
+    seconds = time.perf_counter() - start
+    del kept
+    gc.collect()
+
+    tracemalloc.start()
+    kept = build()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'rows': len(kept), 'seconds': seconds, 'bytes': held, 'bytes_per_row': held / len(kept)}
+
+
+def run_memory_benchmark(rows: int = 100_000) -> Dict[str, Dict]:
+    """
+    Memory held by the results of a ``rows``-row run kept in memory
+
+    Rows are built as the pipeline builds them (response parse, usage,
+    classifier label), each with a unique response of full chain-of-thought
+    length. 'dicts' keeps ``to_dict()`` of each record, which is the per-row
+    dict the pipeline used to keep.
+
+    Returns:
+        {'records': stats, 'dicts': stats} with seconds, bytes and bytes per row
+    """
+    import numpy as np
+    from langchain_core.messages import AIMessage
+    from reasoning_agents import SpecializedReasoningAgent
+    from token_budget import usage_from_response
+
+    agents = [SpecializedReasoningAgent(category, llm=None) for category in CATEGORY_PROMPTS]
+    labels = np.array(list(CATEGORY_PROMPTS))  # Classifier labels: a new numpy string per lookup
+    step = "Step {s}: option {o} fails constraint {c} of row {i}, so it is ruled out.\n"
+    template = "REASONING: " + ''.join(step.format(s=s, o=s % 5 + 1, c=s, i='{i}') for s in range(12))
+    template += "ANSWER: {answer}\nCONFIDENCE: 0.8{i}\n"
+    message = AIMessage(content='', usage_metadata={'input_tokens': 420, 'output_tokens': 260,
+                                                    'total_tokens': 680},
+                        response_metadata={'model_name': 'gpt-4o-mini'})
+
+    def build_record(i: int) -> ReasoningResult:
+        response = template.format(i=i, answer=i % 5 + 1)
+        result = agents[i % len(agents)]._parse_response(response)
+        result.usage = usage_from_response(message, [], response)
+        result.llm_latency_ms = 850.0
+        result.category = labels[i % len(labels)]
+        result.category_confidence = 0.9
+        result.row_index = i
+        return result
+
+    def build_dict(i: int) -> Dict:
+        record = build_record(i).to_dict()
+        record['category'] = labels[i % len(labels)]
+        return record
+
+    return {
+        'records': _measure(lambda: [build_record(i) for i in range(rows)]),
+        'dicts': _measure(lambda: [build_dict(i) for i in range(rows)])
+    }
+
+
+def print_memory_results(results: Dict[str, Dict]):
+    print("\n" + "=" * 80)
+    print(f"KEPT RESULT MEMORY ({results['records']['rows']:,} rows)")
+    print("=" * 80)
+    print(f"{'Representation':<16}{'MB held':>10}{'bytes/row':>12}{'build s':>10}")
+    for label, r in results.items():
+        print(f"{label:<16}{r['bytes'] / 2 ** 20:>10.1f}{r['bytes_per_row']:>12.0f}{r['seconds']:>10.2f}")
+    print(f"\nRecords hold {1 - results['records']['bytes'] / results['dicts']['bytes']:.0%} less than dicts")
+
+
+def _loaded_bytes(blob: bytes) -> int:
+    """Traced bytes held by an unpickled object"""
+    import gc
+    import pickle
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    kept = pickle.loads(blob)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return held
+
+
+def run_classifier_benchmark(keep_features: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Category classifier before and after ``compress()``, one step at a time
+
+    Trains once on the train.csv split, then compresses copies of the model:
+    int8 weights on the full n-gram range with sklearn's transform, then
+    with 3-grams dropped (CLASSIFIER_MAX_NGRAM), then the served model with
+    the direct TF-IDF transform, and its float32 variant. Size is the pickled
+    vectorizer plus classifier and the memory they hold once loaded; latency
+    is ``predict()`` per problem over the validation split (best of three
+    runs), which also gives the accuracy.
+
+    Returns:
+        {label: {'features', 'ngram_range', 'pickle_bytes', 'loaded_bytes',
+                 'micros_per_item', 'accuracy'}}
+    """
+    import copy
+    import pickle
+    from category_classifier import CategoryClassifier, split_validation
+    from config import CLASSIFIER_KEEP_FEATURES, CLASSIFIER_MAX_NGRAM
+    from data_loader import read_columns
+
+    train_df = read_columns(TRAIN_FILE, ['problem_statement', 'topic'])
+    _, X_val, _, y_val = split_validation(train_df)
+    trained = CategoryClassifier()
+    trained.train(train_df)
+
+    def stats(classifier: CategoryClassifier) -> Dict:
+        blob = pickle.dumps((classifier.vectorizer, classifier.classifier))
+        correct = sum(classifier.predict(problem)['predicted_category'] == label
+                      for problem, label in zip(X_val, y_val))
+        micros = min(_time_per_call(classifier.predict, list(X_val), 0.5) for _ in range(3))
+        return {
+            'features': len(classifier.vectorizer.vocabulary_),
+            'ngram_range': classifier.vectorizer.ngram_range,
+            'pickle_bytes': len(blob),
+            'loaded_bytes': _loaded_bytes(blob),
+            'micros_per_item': micros,
+            'accuracy': correct / len(y_val)
+        }
+
+    variants = [
+        ('int8, sklearn tf-idf', 'int8', None, False),
+        ('int8, no 3-grams', 'int8', CLASSIFIER_MAX_NGRAM, False),
+        ('int8 (served)', 'int8', CLASSIFIER_MAX_NGRAM, True),
+        ('float32', 'float32', CLASSIFIER_MAX_NGRAM, True)
+    ]
+    results = {'original': stats(trained)}
+    for label, dtype, max_ngram, direct_transform in variants:
+        compressed = copy.deepcopy(trained)
+        compressed.compress(keep_features or CLASSIFIER_KEEP_FEATURES, dtype, max_ngram)
+        if not direct_transform:
+            compressed.vectorizer = compressed.vectorizer.vectorizer  # The wrapped TfidfVectorizer
+        results[label] = stats(compressed)
+    return results
+
+
+def print_classifier_results(results: Dict[str, Dict]):
+    print("\n" + "=" * 80)
+    print("CATEGORY CLASSIFIER COMPRESSION")
+    print("=" * 80)
+    print(f"{'Model':<24}{'terms':>7}{'n-grams':>9}{'pickle KB':>11}{'held KB':>10}"
+          f"{'µs/item':>10}{'accuracy':>10}")
+    for label, r in results.items():
+        low, high = r['ngram_range']
+        print(f"{label:<24}{r['features']:>7}{f'{low}-{high}':>9}{r['pickle_bytes'] / 1024:>11.1f}"
+              f"{r['loaded_bytes'] / 1024:>10.1f}{r['micros_per_item']:>10.1f}{r['accuracy']:>10.1%}")
+
+
+class _FixedLatencyPipeline:
+    """Answers every row after a fixed delay, like a mock LLM with constant latency"""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def _process_row(self, row) -> ReasoningResult:
+        index, problem, options = row
+        time.sleep(self.latency_ms / 1000)
+        result = ReasoningResult(index % 5 + 1, 0.9, '', 'regex', 'Sequence solving')
+        result.row_index = index
+        return result
+
+
+def run_distributed_benchmark(worker_counts: Tuple[int, ...] = (1, 2, 4), rows: int = 400,
+                              latency_ms: float = 20.0, threads: int = 2, shard_size: int = 10,
+                              backend: str = 'local') -> Dict[int, Dict]:
+    """
+    Coordinator throughput per number of spawned local workers
+
+    Every worker solves ``threads`` rows at a time, each taking ``latency_ms``,
+    so ideal throughput is ``workers * threads * 1000 / latency_ms`` rows/s.
+
+    Returns:
+        {workers: {'elapsed_s', 'rows_per_s', 'speedup', 'efficiency'}}
+    """
+    import csv
+    import os
+    import tempfile
+    from distributed import make_queue, run_coordinator, spawn_local_workers
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        test_file = os.path.join(directory, 'test.csv')
+        with open(test_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['problem_statement'] + OPTION_COLUMNS)
+            for index in range(rows):
+                writer.writerow([f'Problem {index}'] + [f'option {i}' for i in range(1, 6)])
+
+        for workers in worker_counts:
+            work_queue = make_queue(backend, os.path.join(directory, f'queue-{workers}'))
+            work_queue.reset()
+            processes = spawn_local_workers(work_queue, workers, threads, pipeline=_FixedLatencyPipeline(latency_ms))
+            start = time.perf_counter()
+            summary = run_coordinator(test_file, work_queue, os.path.join(directory, f'output-{workers}.csv'),
+                                      shard_size=shard_size, max_outstanding=4 * max(worker_counts))
+            elapsed = time.perf_counter() - start
+            for process in processes:
+                process.join(timeout=10)
+            results[workers] = {'elapsed_s': elapsed, 'rows_per_s': summary['rows'] / elapsed}
+
+    base = results[worker_counts[0]]['rows_per_s'] / worker_counts[0]
+    for workers, r in results.items():
+        r['speedup'] = r['rows_per_s'] / results[worker_counts[0]]['rows_per_s']
+        r['efficiency'] = r['rows_per_s'] / (base * workers)
+    return results
+
+
+def print_distributed_results(results: Dict[int, Dict]):
+    print("\n" + "=" * 80)
+    print("DISTRIBUTED THROUGHPUT (fixed-latency stub pipeline)")
+    print("=" * 80)
+    print(f"{'Workers':<10}{'elapsed s':>11}{'rows/s':>10}{'speedup':>10}{'efficiency':>12}")
+    for workers, r in results.items():
+        print(f"{workers:<10}{r['elapsed_s']:>11.2f}{r['rows_per_s']:>10.1f}"
+              f"{r['speedup']:>9.2f}x{r['efficiency']:>12.0%}")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmarks for the ML Reasoning System')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    api_parser = commands.add_parser('api', help='In-process API serialization load test')
+    api_parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+    api_parser.add_argument('--batch', type=int, default=100,
+                            help='Items per /batch-solve request (0 = single /solve calls)')
+    api_parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    api_parser.add_argument('--fields', type=str, default='predicted_answer,confidence',
+                            help='Field selection for the fields= run')
+    api_parser.add_argument('--compress', action='store_true',
+                            help='Accept gzip/brotli (reports compressed wire size)')
+
+    hotpath_parser = commands.add_parser('hotpath', help='Prompt-build and parse micro-benchmarks')
+    hotpath_parser.add_argument('--samples', type=int, default=100, help='train.csv problems to cycle through')
+    hotpath_parser.add_argument('--seconds', type=float, default=0.5, help='Minimum time per benchmark')
+    hotpath_parser.add_argument('--save', type=str, default=None, help='Write results as a JSON baseline')
+    hotpath_parser.add_argument('--against', type=str, default=None,
+                                help='Baseline JSON to compare with; exits 1 on a regression')
+    hotpath_parser.add_argument('--tolerance', type=float, default=0.25,
+                                help='Allowed slowdown against the baseline (fraction)')
+
+    memory_parser = commands.add_parser('memory', help='Memory held by kept results')
+    memory_parser.add_argument('--rows', type=int, default=100_000, help='Rows kept in memory')
+
+    classifier_parser = commands.add_parser('classifier', help='Category classifier compression report')
+    classifier_parser.add_argument('--keep', type=int, default=None,
+                                   help='Terms kept after pruning (default: CLASSIFIER_KEEP_FEATURES)')
+
+    distributed_parser = commands.add_parser('distributed', help='Coordinator scaling with local workers')
+    distributed_parser.add_argument('--workers', type=str, default='1,2,4', help='Worker counts to run')
+    distributed_parser.add_argument('--rows', type=int, default=400)
+    distributed_parser.add_argument('--latency-ms', type=float, default=20.0, help='Stub latency per row')
+    distributed_parser.add_argument('--threads', type=int, default=2, help='Concurrent rows per worker')
+    distributed_parser.add_argument('--backend', choices=['local', 'file'], default='local')
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        print_memory_results(run_memory_benchmark(args.rows))
+
+    elif args.command == 'classifier':
+        print_classifier_results(run_classifier_benchmark(args.keep))
+
+    elif args.command == 'distributed':
+        counts = tuple(int(count) for count in args.workers.split(','))
+        print_distributed_results(run_distributed_benchmark(
+            counts, args.rows, args.latency_ms, args.threads, backend=args.backend))
+
+    elif args.command == 'api':
+        common = dict(requests=args.requests, batch=args.batch,
+                      concurrency=args.concurrency, compress=args.compress)
+        results = {
+            'validated': run_api_benchmark(fast=False, **common),
+            'fast': run_api_benchmark(fast=True, **common),
+            'fast fields=': run_api_benchmark(fast=True, fields=args.fields, **common)
+        }
+        print_api_results(results)
+
+    elif args.command == 'hotpath':
+        results = run_hotpath_benchmark(args.samples, args.seconds)
+        baseline = None
+        if args.against:
+            with open(args.against) as f:
+                baseline = json.load(f)
+        print_hotpath_results(results, baseline)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\n✓ Baseline saved to {args.save}")
+        if baseline:
+            slower = check_regressions(results, baseline, args.tolerance)
+            if slower:
+                print(f"\n✗ Regression beyond {args.tolerance:.0%}: {', '.join(slower)}")
+                sys.exit(1)
+            print(f"\n✓ No regression beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,119 @@ Classifies reasoning problems into categories for specialized agent routing
 import pickle
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import os
 
-from config import CATEGORY_VECTORIZER_FILE, CATEGORY_CLASSIFIER_FILE, CATEGORY_METADATA_FILE
+from config import (CATEGORY_VECTORIZER_FILE, CATEGORY_CLASSIFIER_FILE, CATEGORY_METADATA_FILE,
+                    CLASSIFIER_COMPRESSION, CLASSIFIER_KEEP_FEATURES, CLASSIFIER_MAX_NGRAM,
+                    CLASSIFIER_WEIGHT_DTYPE)
+
+
+def split_validation(train_df: pd.DataFrame, test_size: float = 0.2) -> Tuple:
+    """Stratified (X_train, X_val, y_train, y_val) split used for training and reports"""
+    return train_test_split(
+        train_df['problem_statement'].values, train_df['topic'].values,
+        test_size=test_size, random_state=42, stratify=train_df['topic'].values
+    )
+
+
+class CompressedLinearClassifier:
+    """
+    Multinomial logistic regression reduced to what prediction needs
+
+    Weights are stored (features x classes) as float32, or as int8 with one
+    float32 scale per class; scores are dequantized after the sparse product,
+    so the weight matrix itself is never expanded.
+    """
+
+    def __init__(self, classes: np.ndarray, coef: np.ndarray, intercept: np.ndarray,
+                 weight_dtype: str = 'int8'):
+        self.classes_ = classes
+        self.intercept_ = intercept.astype(np.float32)
+        if weight_dtype == 'int8':
+            peak = np.abs(coef).max(axis=1)
+            self.scales = (np.where(peak > 0, peak, 1.0) / 127).astype(np.float32)
+            self.weights = np.ascontiguousarray(np.rint(coef.T / self.scales).astype(np.int8))
+        elif weight_dtype == 'float32':
+            self.scales = None
+            self.weights = np.ascontiguousarray(coef.T.astype(np.float32))
+        else:
+            raise ValueError(f"Unknown weight dtype: {weight_dtype}")
+
+    def decision_function(self, X) -> np.ndarray:
+        scores = np.asarray(X @ self.weights, dtype=np.float32)
+        if self.scales is not None:
+            scores *= self.scales
+        return scores + self.intercept_
+
+    def predict_proba(self, X) -> np.ndarray:
+        scores = self.decision_function(X)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+
+class CompressedTfidfVectorizer:
+    """
+    TF-IDF transform of a fitted, word-analyzer TfidfVectorizer without its per-call overhead
+
+    Tokenization is the wrapped vectorizer's own analyzer; term counting,
+    sublinear TF, IDF weighting and the L2 norm are done directly in numpy,
+    skipping the input validation sklearn runs on every ``transform`` call
+    (most of the time a single-problem ``predict()`` took).
+    """
+
+    def __init__(self, vectorizer: TfidfVectorizer):
+        if vectorizer.norm not in ('l2', None):
+            raise ValueError(f"Unsupported norm: {vectorizer.norm}")
+        self.vectorizer = vectorizer
+        self.vocabulary_ = vectorizer.vocabulary_
+        self.ngram_range = vectorizer.ngram_range
+        self.idf_ = vectorizer.idf_.astype(np.float32)
+        self._analyze = vectorizer.build_analyzer()
+
+    def __getstate__(self):
+        return {'vectorizer': self.vectorizer}  # The rest is derived from it on load
+
+    def __setstate__(self, state):
+        self.__init__(state['vectorizer'])
+
+    def get_feature_names_out(self) -> np.ndarray:
+        return self.vectorizer.get_feature_names_out()
+
+    def transform(self, raw_documents) -> csr_matrix:
+        indices, counts, indptr = [], [], [0]
+        for document in raw_documents:
+            row = {}
+            for term in self._analyze(document):
+                index = self.vocabulary_.get(term)
+                if index is not None:
+                    row[index] = row.get(index, 0) + 1
+            indices.extend(sorted(row))
+            counts.extend(row[index] for index in sorted(row))
+            indptr.append(len(indices))
+        indices = np.asarray(indices, dtype=np.int32)
+        data = np.asarray(counts, dtype=np.float32)
+        if self.vectorizer.sublinear_tf:
+            np.log(data, out=data)
+            data += 1.0
+        if self.vectorizer.use_idf:
+            data *= self.idf_[indices]
+        indptr = np.asarray(indptr, dtype=np.int32)
+        if self.vectorizer.norm == 'l2':
+            for start, end in zip(indptr[:-1], indptr[1:]):
+                norm = np.sqrt(np.dot(data[start:end], data[start:end]))
+                if norm > 0:
+                    data[start:end] /= norm
+        return csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.vocabulary_)))
 
 
 class CategoryClassifier:
@@ -24,6 +129,7 @@ class CategoryClassifier:
         self.classifier = None
         self.categories = []
         self.is_trained = False
+        self.compression = None
     
     def train(self, train_df: pd.DataFrame, test_size: float = 0.2):
         """
@@ -35,13 +141,8 @@ class CategoryClassifier:
         """
         print("Training category classifier...")
         
-        X = train_df['problem_statement'].values
-        y = train_df['topic'].values
-        
         # Split for validation
-        X_train, X_val, y_train, y_val = train_test_split(
-            X, y, test_size=test_size, random_state=42, stratify=y
-        )
+        X_train, X_val, y_train, y_val = split_validation(train_df, test_size)
         
         # Build TF-IDF vectorizer
         self.vectorizer = TfidfVectorizer(
@@ -65,8 +166,7 @@ class CategoryClassifier:
             C=1.0,
             class_weight='balanced',
             random_state=42,
-            solver='lbfgs',
-            multi_class='multinomial'
+            solver='lbfgs'  # Multinomial for multi-class targets
         )
         
         self.classifier.fit(X_train_tfidf, y_train)
@@ -77,6 +177,7 @@ class CategoryClassifier:
         
         self.categories = self.classifier.classes_.tolist()
         self.is_trained = True
+        self.compression = None
         
         print(f"✓ Category classifier trained with {accuracy:.1%} validation accuracy")
         return accuracy
@@ -96,8 +197,8 @@ class CategoryClassifier:
             raise ValueError("Classifier not trained. Call train() first or load() a trained model.")
         
         problem_tfidf = self.vectorizer.transform([problem])
-        prediction = self.classifier.predict(problem_tfidf)[0]
         probabilities = self.classifier.predict_proba(problem_tfidf)[0]
+        prediction = self.classifier.classes_[np.argmax(probabilities)]
         
         result = {
             'predicted_category': prediction,
@@ -113,6 +214,61 @@ class CategoryClassifier:
         
         return result
     
+    def compress(self, keep_features: int = CLASSIFIER_KEEP_FEATURES,
+                 weight_dtype: str = CLASSIFIER_WEIGHT_DTYPE,
+                 max_ngram: Optional[int] = CLASSIFIER_MAX_NGRAM) -> Dict:
+        """
+        Prune and quantize the trained model for serving
+        
+        Keeps the ``keep_features`` terms of at most ``max_ngram`` words (None
+        for any length) with the largest weight magnitude in any class, rebuilds
+        the vectorizer on that vocabulary (with the n-gram range cut to the
+        longest kept term) behind a CompressedTfidfVectorizer, and swaps the
+        classifier for a CompressedLinearClassifier with ``weight_dtype`` weights.
+        Other terms are dropped before the L2 norm, so probabilities shift
+        slightly; check the effect with ``python benchmark.py classifier``.
+        
+        Returns:
+            Compression summary (feature counts, n-gram range, weight dtype)
+        """
+        if not self.is_trained:
+            raise ValueError("Classifier not trained. Call train() first or load() a trained model.")
+        if self.compression is not None:
+            return self.compression
+        
+        coef = self.classifier.coef_
+        terms = self.vectorizer.get_feature_names_out()
+        importance = np.abs(coef).max(axis=0)
+        if max_ngram is not None:
+            lengths = np.array([len(term.split(' ')) for term in terms])
+            importance = np.where(lengths <= max_ngram, importance, -1.0)
+            keep_features = min(keep_features, int((lengths <= max_ngram).sum()))
+        kept = np.sort(np.argsort(-importance, kind='stable')[:keep_features])
+        kept_terms = terms[kept]
+        
+        low = self.vectorizer.ngram_range[0]
+        high = max(low, max(len(term.split(' ')) for term in kept_terms))
+        pruned = TfidfVectorizer(**{
+            **self.vectorizer.get_params(),
+            'vocabulary': {term: index for index, term in enumerate(kept_terms)},
+            'ngram_range': (low, high),
+            'max_features': None, 'min_df': 1, 'max_df': 1.0,
+            'dtype': np.float32
+        })
+        pruned.fit(kept_terms)  # Fixed vocabulary: only sets up the IDF transformer
+        pruned.idf_ = self.vectorizer.idf_[kept]
+        
+        self.vectorizer = CompressedTfidfVectorizer(pruned)
+        self.classifier = CompressedLinearClassifier(self.classifier.classes_, coef[:, kept],
+                                                     self.classifier.intercept_, weight_dtype)
+        self.compression = {
+            'features': len(terms),
+            'kept_features': len(kept_terms),
+            'ngram_range': (low, high),
+            'weight_dtype': weight_dtype
+        }
+        return self.compression
+    
     def save(self):
         """Save the trained model to disk"""
         if not self.is_trained:
@@ -126,7 +282,8 @@ class CategoryClassifier:
         
         metadata = {
             'categories': self.categories,
-            'num_categories': len(self.categories)
+            'num_categories': len(self.categories),
+            'compression': self.compression
         }
         
         with open(CATEGORY_METADATA_FILE, 'wb') as f:
@@ -149,8 +306,13 @@ class CategoryClassifier:
             metadata = pickle.load(f)
         
         self.categories = metadata['categories']
+        self.compression = metadata.get('compression')
         self.is_trained = True
         
+        # Models saved before compression existed are compressed on load
+        if CLASSIFIER_COMPRESSION and self.compression is None:
+            self.compress()
+        
         print(f"✓ Model loaded from {os.path.dirname(CATEGORY_CLASSIFIER_FILE)}")
         return self
 
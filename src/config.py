@@ -3,6 +3,7 @@ Configuration settings for the ML Reasoning System
 """
 
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,6 +17,105 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GPT_MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.1  # Low temperature for consistent reasoning
 
+# LLM backends: OpenAI-compatible endpoints (local servers only need a base_url).
+# Override with a JSON object in the LLM_BACKENDS environment variable.
+LLM_BACKENDS = json.loads(os.getenv('LLM_BACKENDS', 'null')) or {
+    "openai": {"model": GPT_MODEL, "base_url": None, "api_key_env": "OPENAI_API_KEY"},
+}
+
+# CPU-local quantized model: in-process llama.cpp on a GGUF file (LOCAL_MODEL_PATH), or a
+# sidecar with an OpenAI-compatible API such as `llama-server --cont-batching` (LOCAL_MODEL_URL)
+LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH')
+LOCAL_MODEL_URL = os.getenv('LOCAL_MODEL_URL')
+LOCAL_MODEL_NAME = os.getenv('LOCAL_MODEL_NAME', 'local-gguf')
+LOCAL_MODEL_THREADS = int(os.getenv('LOCAL_MODEL_THREADS', str(os.cpu_count() or 1)))
+LOCAL_MODEL_CONTEXT = 8192  # KV cells shared by all sequences in the running batch
+LOCAL_MODEL_MAX_BATCH = 8  # Sequences decoded together (continuous batching)
+LOCAL_MODEL_PREFILL_CHUNK = 256  # Prompt tokens admitted per decode step
+if LOCAL_MODEL_PATH:
+    LLM_BACKENDS.setdefault("local", {"type": "llama_cpp", "model": LOCAL_MODEL_NAME,
+                                      "model_path": LOCAL_MODEL_PATH, "local": True})
+elif LOCAL_MODEL_URL:
+    LLM_BACKENDS.setdefault("local", {"model": LOCAL_MODEL_NAME, "base_url": LOCAL_MODEL_URL,
+                                      "local": True})
+# Per-category policy: 'local' routes to the local backends and uses the remote ones only
+# when the local call fails; other categories stay remote
+LOCAL_MODEL_POLICY = {"Classic riddles": "local", "Lateral thinking": "local"}
+
+DEFAULT_BACKENDS = [name for name, spec in LLM_BACKENDS.items() if not spec.get("local")]
+LOCAL_BACKENDS = [name for name, spec in LLM_BACKENDS.items() if spec.get("local")]
+CATEGORY_BACKENDS = json.loads(os.getenv('CATEGORY_BACKENDS', 'null')) or {}  # category -> [backend names]
+
+# Routing: EWMA health tracking, hedging after the primary's p95 latency, failover
+ROUTER_EWMA_ALPHA = 0.2
+ROUTER_ERROR_PENALTY = 10.0  # Score multiplier per unit of EWMA error rate
+ROUTER_HEDGE_PERCENTILE = 95
+ROUTER_HEDGE_MIN_SAMPLES = 20  # Latency samples needed before hedging kicks in
+ROUTER_PROBE_INTERVAL = 30.0  # Seconds after which an idle backend is probed again
+
+# Agent-level request hedging: duplicate a solve that is slower than its tracked percentile
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # Latency samples per agent before hedging starts
+HEDGE_BUDGET_PER_MINUTE = 30  # Maximum duplicate requests per rolling minute
+
+# Token budgets (completion tokens per call)
+DEFAULT_MAX_TOKENS = 1000
+CATEGORY_TOKEN_BUDGETS = {
+    "Spatial reasoning": 1200,
+    "Optimization of actions and planning": 1200,
+    "Operation of mechanisms": 1000,
+    "Sequence solving": 1000,
+    "Logical traps": 1000,
+    "Classic riddles": 600,
+    "Lateral thinking": 600,
+}
+COMPACT_REASONING = False  # Ask for a short REASONING block instead of full chain-of-thought
+COMPACT_MAX_TOKENS = 350  # Budget cap used with compact reasoning
+RESPONSE_END_MARKER = "END"  # Emitted after the CONFIDENCE line and used as stop sequence
+
+# Structured output (JSON schema with the answer emitted before the reasoning)
+STRUCTURED_OUTPUT = False
+STRUCTURED_EARLY_STOP = False  # Close the stream once answer + confidence arrive
+REPAIR_MAX_TOKENS = 20  # Budget for the repair call made when a response cannot be parsed
+
+# Answer-option pre-filter (dedupe, numeric checks, sequence extrapolation)
+OPTION_FILTER = True
+OPTION_FILTER_MAX_CANDIDATES = 2  # Shortlists this small get a short "choose between" prompt
+
+# Local solver engines: exact solvers tried before the LLM for the categories they model
+LOCAL_ENGINES = True
+ENGINE_LLM_EXTRACTION = False  # Ask the LLM for the model when the rules extractor finds none
+ENGINE_CONFIDENCE = 0.95  # Confidence reported for an engine answer
+ENGINE_EXTRACT_MAX_TOKENS = 400  # Completion cap of the LLM extraction call
+PLANNING_MAX_ITEMS = 8  # Largest task/place/worker count searched exhaustively
+LOGIC_MAX_VARIABLES = 12  # Largest person/place variable count enumerated by the logic solver
+SPATIAL_MAX_EDGE = 100  # Largest unit-cube count per axis the spatial solver builds a voxel grid for
+
+# Asynchronous verification (API): low-confidence answers are returned at once, re-checked in the
+# background, and the verified result replaces the original in the response cache and job store
+ASYNC_VERIFICATION = True
+VERIFY_CONFIDENCE_THRESHOLD = 0.75  # LLM answers below this confidence are queued for a re-check
+VERIFY_QUEUE_SIZE = 256  # Re-checks waiting beyond this are skipped (a solve never waits on the queue)
+VERIFY_WORKERS = 2  # Background threads running re-checks
+RESPONSE_CACHE_SIZE = 10000  # Solved (problem, options) pairs kept for repeat requests
+
+# API load shedding: service tiers chosen from queue depth, backend error rate and latency SLO
+LOAD_SHEDDING = True
+LOAD_LATENCY_SLO_MS = 15000  # Interactive queue wait plus solve time
+LOAD_WINDOW = 50  # Recent interactive solves checked against the SLO
+LOAD_SLO_BREACH_RATE = 0.3  # Fraction of the window over the SLO that moves to the short tier
+LOAD_QUEUE_FILL = 0.25  # Interactive queue depth / max depth that moves to the short tier
+LOAD_ERROR_RATE = {'short': 0.3, 'local': 0.8}  # EWMA error rate of the healthiest backend per tier
+LOAD_TIER_HOLD = 10.0  # Seconds a raised tier is kept before stepping down
+LOAD_PROBE_INTERVAL = 5.0  # Seconds between LLM probes while the backends are down
+SHORT_ANSWER_MAX_TOKENS = 24  # Completion cap of the short-answer prompt
+
+# Packed solves: several same-category problems per LLM call in bulk runs (main.py --packed)
+PACKED_SOLVES = False
+PACK_MAX_SIZE = 8  # Problems per call; halves after a pack with unparseable answers, regrows by one
+PACK_TOKEN_LIMIT = 8000  # Prompt plus completion tokens one packed call may use
+
 # Paths
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PROJECT_ROOT, "ML Challenge Dataset")
@@ -32,10 +132,77 @@ CATEGORY_VECTORIZER_FILE = os.path.join(MODELS_DIR, "category_vectorizer.pkl")
 CATEGORY_CLASSIFIER_FILE = os.path.join(MODELS_DIR, "category_classifier.pkl")
 CATEGORY_METADATA_FILE = os.path.join(MODELS_DIR, "category_metadata.pkl")
 
+# Category classifier compression (after training, or on load of an uncompressed model)
+CLASSIFIER_COMPRESSION = True
+CLASSIFIER_KEEP_FEATURES = 2000  # Terms kept, by largest weight magnitude in any class
+CLASSIFIER_MAX_NGRAM = 2  # Longest kept term; 3-grams add no accuracy and slow tokenization
+CLASSIFIER_WEIGHT_DTYPE = 'int8'  # 'int8' (per-class scale) or 'float32'
+
 # Processing Configuration
 BATCH_SIZE = 10
 CHECKPOINT_INTERVAL = 10
 MAX_RETRIES = 3
+CSV_CHUNK_SIZE = 256  # Rows read per streaming chunk
+MAX_WORKERS = 8  # Concurrent LLM calls during batch processing
+
+# API scheduler: interactive /solve traffic vs bulk /batch-solve traffic
+SCHEDULER_WORKERS = MAX_WORKERS
+SCHEDULER_RESERVED_INTERACTIVE = 2  # Workers that never take batch jobs
+SCHEDULER_MAX_DEPTH = {'interactive': 100, 'batch': 1000}  # Queued jobs before 429
+
+# Asynchronous batch jobs (POST /jobs)
+JOBS_DB_FILE = os.path.join(PROJECT_ROOT, "jobs.db")
+JOB_MAX_IN_FLIGHT = 32  # Items per job queued in the scheduler at once
+JOB_CALLBACK_ATTEMPTS = 3  # Deliveries tried per job callback (webhook) before giving up
+JOB_CALLBACK_TIMEOUT = 10.0  # Seconds per callback request
+JOB_CALLBACK_BACKOFF = 2.0  # Seconds before the first callback retry, doubled per retry
+
+# API response encoding
+FAST_JSON_RESPONSES = True  # Serialize /solve and /batch-solve with orjson, skipping re-validation
+RESPONSE_COMPRESSION = True  # gzip (brotli if brotli-asgi is installed) when the client accepts it
+RESPONSE_COMPRESSION_MIN_SIZE = 1024  # Bytes; smaller bodies are sent uncompressed
+
+# Usage ledger and cost budgets
+# USD per 1M tokens; provider model names are matched by prefix, unknown models cost 0
+MODEL_PRICING = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+}
+USAGE_LEDGER_FILE = os.path.join(PROJECT_ROOT, "usage.db")  # A .parquet path writes part files instead
+USAGE_FLUSH_ROWS = 500  # Buffered call records before a flush
+BUDGET_MIN_COMPLETION_TOKENS = 64  # Smallest completion cap worth a call; below it a limited budget gets no call
+
+# Tracing (spans per pipeline stage, exported as JSONL)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))  # Fraction of root traces kept
+TRACE_FILE = os.path.join(PROJECT_ROOT, "traces.jsonl")
+TRACE_FLUSH_SPANS = 200  # Buffered spans before appending to TRACE_FILE
+
+# Sampling profiler (main.py --profile, POST /admin/profile)
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_MAX_SECONDS = 60  # Longest capture the admin endpoint allows
+PROFILE_DIR = os.path.join(PROJECT_ROOT, "profiles")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Required by /admin endpoints; unset disables them
+
+# LLM transport: 'live', 'record' (live calls archived to LLM_ARCHIVE_FILE) or 'replay'
+# (archived responses served offline; no API key or network needed)
+LLM_TRANSPORT = os.getenv("LLM_TRANSPORT", "live")
+LLM_ARCHIVE_FILE = os.getenv("LLM_ARCHIVE_FILE", os.path.join(PROJECT_ROOT, "llm_archive.db"))
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))  # 1 = recorded latencies, 0 = none
+ARCHIVE_FLUSH_ROWS = 100  # Buffered recorded calls before a flush
+
+# Distributed batch execution (distributed.py)
+SHARD_SIZE = 64  # Rows per shard handed to a worker
+SHARD_TIMEOUT = 600.0  # Seconds before an unanswered shard is re-dispatched
+SHARD_MAX_ATTEMPTS = 3  # Dispatches per shard before default predictions are used
+DISTRIBUTED_QUEUE_DIR = os.path.join(PROJECT_ROOT, "shard_queue")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Detailed output configuration
+COMPRESS_DETAILED_OUTPUT = False  # Write output_detailed.jsonl.gz instead of plain JSONL
+RAW_RESPONSE_MODE = 'inline'  # 'inline', 'drop' or 'blob' (content-addressed sidecar file)
 
 # Ensemble Configuration
 ENSEMBLE_METHODS = ['majority_vote', 'confidence_weighted', 'unanimous_only']
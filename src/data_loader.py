@@ -0,0 +1,75 @@
+"""
+Streaming CSV ingestion
+Reads problem files as chunks of typed columns instead of per-row pandas objects
+"""
+
+import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+
+from config import CSV_CHUNK_SIZE
+
+PROBLEM_COLUMN = 'problem_statement'
+OPTION_COLUMNS = [f'answer_option_{i}' for i in range(1, 6)]
+OPTION_KEYS = [f'option_{i}' for i in range(1, 6)]
+
+
+class ProblemChunk:
+    """A contiguous block of rows stored column-wise as plain Python lists"""
+
+    __slots__ = ('start', 'problems', 'options')
+
+    def __init__(self, start: int, problems: List[str], options: List[List[str]]):
+        self.start = start
+        self.problems = problems
+        self.options = options  # five columns, one list per answer option
+
+    def __len__(self) -> int:
+        return len(self.problems)
+
+    @property
+    def row_indices(self) -> range:
+        return range(self.start, self.start + len(self.problems))
+
+    def iter_rows(self) -> Iterator[Tuple[int, str, Dict[str, str]]]:
+        """Yield (row_index, problem, options_dict) without touching pandas"""
+        for offset, row in enumerate(zip(self.problems, *self.options)):
+            yield self.start + offset, row[0], dict(zip(OPTION_KEYS, row[1:]))
+
+
+def iter_problem_chunks(path: str, chunksize: int = CSV_CHUNK_SIZE) -> Iterator[ProblemChunk]:
+    """
+    Stream a test-format CSV in fixed-size column chunks
+
+    Only the problem statement and the five answer options are parsed, all as
+    strings, so memory stays proportional to ``chunksize`` regardless of file size.
+
+    Args:
+        path: Path to a CSV with 'problem_statement' and 'answer_option_1..5' columns
+        chunksize: Number of rows per chunk
+
+    Yields:
+        ProblemChunk objects in file order
+    """
+    reader = pd.read_csv(
+        path,
+        usecols=[PROBLEM_COLUMN] + OPTION_COLUMNS,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunksize
+    )
+    start = 0
+    with reader:
+        for frame in reader:
+            chunk = ProblemChunk(
+                start,
+                frame[PROBLEM_COLUMN].tolist(),
+                [frame[column].tolist() for column in OPTION_COLUMNS]
+            )
+            start += len(chunk)
+            yield chunk
+
+
+def read_columns(path: str, columns: List[str]) -> pd.DataFrame:
+    """Load only the requested columns of a CSV (as strings)"""
+    return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+
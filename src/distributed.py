@@ -0,0 +1,390 @@
+"""
+Distributed batch execution
+A coordinator shards a test CSV by row range; worker processes (local or on other
+nodes) solve shards and the coordinator merges results in order into output.csv
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import queue as queue_module
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import (
+    TEST_FILE, OUTPUT_FILE, MAX_WORKERS, SHARD_SIZE, SHARD_TIMEOUT,
+    SHARD_MAX_ATTEMPTS, DISTRIBUTED_QUEUE_DIR, REDIS_URL
+)
+from data_loader import iter_problem_chunks, ProblemChunk
+from llm_transport import llm_transport
+from records import ReasoningResult
+from result_writer import ResultWriter
+from usage_ledger import usage_ledger
+
+
+# ----------------------------------------------------------------------------
+# Work queues: tasks flow coordinator -> workers, results flow back
+# ----------------------------------------------------------------------------
+
+class LocalQueue:
+    """multiprocessing queues for workers spawned on this machine"""
+
+    def __init__(self):
+        self._tasks = mp.Queue()
+        self._results = mp.Queue()
+        self._stop = mp.Event()
+
+    def put_task(self, task: Dict):
+        self._tasks.put(task)
+
+    def get_task(self, timeout: float = 1.0) -> Optional[Dict]:
+        try:
+            return self._tasks.get(timeout=timeout)
+        except queue_module.Empty:
+            return None
+
+    def put_result(self, result: Dict):
+        self._results.put(result)
+
+    def get_result(self, timeout: float = 0.5) -> Optional[Dict]:
+        try:
+            return self._results.get(timeout=timeout)
+        except queue_module.Empty:
+            return None
+
+    def reset(self):
+        pass
+
+    def stop(self):
+        self._stop.set()
+
+    def is_stopped(self) -> bool:
+        return self._stop.is_set()
+
+
+class FileQueue:
+    """
+    Shared-directory queue usable across nodes (e.g. on NFS)
+
+    Tasks are claimed with an atomic rename, so each is taken by one worker.
+    """
+
+    def __init__(self, directory: str = DISTRIBUTED_QUEUE_DIR):
+        self.directory = directory
+        for name in ('tasks', 'claimed', 'results'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def _write(self, folder: str, name: str, payload: Dict):
+        tmp = self._path(folder, f'.{name}.{uuid.uuid4().hex}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp, self._path(folder, name))
+
+    def _take(self, folder: str) -> Optional[Dict]:
+        for name in sorted(os.listdir(self._path(folder))):
+            if name.startswith('.'):
+                continue
+            claimed = self._path('claimed', f'{uuid.uuid4().hex}-{name}')
+            try:
+                os.rename(self._path(folder, name), claimed)
+            except FileNotFoundError:
+                continue  # Another process got it first
+            with open(claimed) as f:
+                payload = json.load(f)
+            os.remove(claimed)
+            return payload
+        return None
+
+    def _poll(self, folder: str, timeout: float) -> Optional[Dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            payload = self._take(folder)
+            if payload is not None or time.monotonic() >= deadline:
+                return payload
+            time.sleep(0.05)
+
+    def put_task(self, task: Dict):
+        self._write('tasks', f"{task['shard_id']:010d}-{task['attempt']}.json", task)
+
+    def get_task(self, timeout: float = 1.0) -> Optional[Dict]:
+        return self._poll('tasks', timeout)
+
+    def put_result(self, result: Dict):
+        self._write('results', f"{result['shard_id']:010d}-{result['attempt']}-{uuid.uuid4().hex[:8]}.json", result)
+
+    def get_result(self, timeout: float = 0.5) -> Optional[Dict]:
+        return self._poll('results', timeout)
+
+    def reset(self):
+        """Discard tasks, results and the stop marker left by a previous run"""
+        for folder in ('tasks', 'claimed', 'results'):
+            for name in os.listdir(self._path(folder)):
+                os.remove(self._path(folder, name))
+        if os.path.exists(self._path('STOP')):
+            os.remove(self._path('STOP'))
+
+    def stop(self):
+        open(self._path('STOP'), 'w').close()
+
+    def is_stopped(self) -> bool:
+        return os.path.exists(self._path('STOP'))
+
+
+class RedisQueue:
+    """Redis lists as task/result queues (any Redis-compatible server works)"""
+
+    def __init__(self, url: str = REDIS_URL, namespace: str = 'hydra'):
+        try:
+            import redis  # Optional dependency, only needed for this backend
+        except ImportError as e:
+            raise ImportError("The redis backend needs redis "
+                              "(pip install -r requirements-distributed.txt)") from e
+        self.url = url
+        self.namespace = namespace
+        self._client = redis.Redis.from_url(url)
+
+    def __getstate__(self):
+        return {'url': self.url, 'namespace': self.namespace}
+
+    def __setstate__(self, state):
+        self.__init__(state['url'], state['namespace'])
+
+    def _key(self, name: str) -> str:
+        return f'{self.namespace}:{name}'
+
+    def put_task(self, task: Dict):
+        self._client.lpush(self._key('tasks'), json.dumps(task))
+
+    def get_task(self, timeout: float = 1.0) -> Optional[Dict]:
+        item = self._client.brpop(self._key('tasks'), timeout=max(int(timeout), 1))
+        return json.loads(item[1]) if item else None
+
+    def put_result(self, result: Dict):
+        self._client.lpush(self._key('results'), json.dumps(result, default=str))
+
+    def get_result(self, timeout: float = 0.5) -> Optional[Dict]:
+        item = self._client.brpop(self._key('results'), timeout=max(int(timeout), 1))
+        return json.loads(item[1]) if item else None
+
+    def reset(self):
+        self._client.delete(self._key('tasks'), self._key('results'), self._key('stop'))
+
+    def stop(self):
+        self._client.set(self._key('stop'), 1)
+
+    def is_stopped(self) -> bool:
+        return bool(self._client.exists(self._key('stop')))
+
+
+def make_queue(backend: str, location: Optional[str] = None):
+    """Create a work queue: 'local', 'file' (directory) or 'redis' (URL)"""
+    if backend == 'local':
+        return LocalQueue()
+    if backend == 'file':
+        return FileQueue(location or DISTRIBUTED_QUEUE_DIR)
+    if backend == 'redis':
+        return RedisQueue(location or REDIS_URL)
+    raise ValueError(f"Unknown queue backend: {backend}")
+
+
+# ----------------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------------
+
+def run_worker(work_queue, max_workers: int = MAX_WORKERS, pipeline=None):
+    """
+    Solve shards until the coordinator signals stop
+
+    The classifier artifacts and LLM clients are loaded once per worker process.
+    """
+    if pipeline is None:
+        from main import MLReasoningPipeline
+        pipeline = MLReasoningPipeline(train_model=False)
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while not work_queue.is_stopped():
+            task = work_queue.get_task(timeout=1.0)
+            if task is None:
+                continue
+
+            chunk = ProblemChunk(task['start'], task['problems'], task['options'])
+            try:
+                results = [result.to_dict() for result in executor.map(pipeline._process_row, chunk.iter_rows())]
+                work_queue.put_result({
+                    'shard_id': task['shard_id'], 'attempt': task['attempt'],
+                    'ok': True, 'results': results, 'worker': worker_id
+                })
+            except Exception as e:
+                work_queue.put_result({
+                    'shard_id': task['shard_id'], 'attempt': task['attempt'],
+                    'ok': False, 'error': str(e), 'worker': worker_id
+                })
+
+    # Worker processes exit without running atexit hooks
+    usage_ledger.flush()
+    llm_transport.flush()
+
+
+def spawn_local_workers(work_queue, count: int, max_workers: int = MAX_WORKERS,
+                        pipeline=None) -> List[mp.Process]:
+    """Start ``count`` worker processes on this machine (each loads its own pipeline by default)"""
+    if pipeline is None:
+        import main  # noqa: F401 -- forked workers inherit the imported modules
+    processes = []
+    for _ in range(count):
+        process = mp.Process(target=run_worker, args=(work_queue, max_workers, pipeline), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+# ----------------------------------------------------------------------------
+# Coordinator
+# ----------------------------------------------------------------------------
+
+def _failed_rows(task: Dict, error: str) -> List[Dict]:
+    """Default predictions for a shard that exhausted its retries"""
+    return [ReasoningResult.failed(error, row_index=task['start'] + offset).to_dict()
+            for offset in range(len(task['problems']))]
+
+
+def run_coordinator(test_file: str, work_queue, output_file: str = OUTPUT_FILE,
+                    shard_size: int = SHARD_SIZE, max_outstanding: int = 16,
+                    shard_timeout: float = SHARD_TIMEOUT,
+                    max_attempts: int = SHARD_MAX_ATTEMPTS) -> Dict:
+    """
+    Shard ``test_file``, dispatch shards and merge results in row order
+
+    At most ``max_outstanding`` shards are dispatched or waiting to be merged at
+    once, so coordinator memory is bounded. Shards that fail or time out are
+    re-dispatched up to ``max_attempts`` times before falling back to default
+    predictions. The pipeline already turns a problem's error into a default
+    prediction (``_process_row``), so a shard is only retried when its worker
+    fails outside a row (e.g. a crash) or does not answer in time.
+
+    Returns:
+        Summary dictionary with row, shard and retry counts
+    """
+    chunks = iter_problem_chunks(test_file, shard_size)
+    outstanding = {}  # shard_id -> (task, dispatched_at)
+    finished = {}  # shard_id -> results awaiting in-order merge
+    next_shard = 0
+    next_to_write = 0
+    exhausted = False
+    summary = {'rows': 0, 'shards': 0, 'retries': 0, 'failed_shards': 0}
+    json_output = output_file.replace('.csv', '_detailed.jsonl')
+
+    def dispatch(task: Dict):
+        work_queue.put_task(task)
+        outstanding[task['shard_id']] = (task, time.monotonic())
+
+    def retry(task: Dict, error: str):
+        if task['attempt'] + 1 >= max_attempts:
+            print(f"\nShard {task['shard_id']} failed after {max_attempts} attempts: {error}")
+            del outstanding[task['shard_id']]
+            finished[task['shard_id']] = _failed_rows(task, error)
+            summary['failed_shards'] += 1
+        else:
+            summary['retries'] += 1
+            dispatch(dict(task, attempt=task['attempt'] + 1))
+
+    with open(output_file, 'w', newline='') as csv_file, ResultWriter(json_output) as json_writer:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(['predicted_answer'])
+
+        while not exhausted or outstanding or finished:
+            while not exhausted and len(outstanding) + len(finished) < max_outstanding:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                dispatch({'shard_id': next_shard, 'attempt': 0, 'start': chunk.start,
+                          'problems': chunk.problems, 'options': chunk.options})
+                next_shard += 1
+
+            result = work_queue.get_result(timeout=0.5)
+            if result is not None and result['shard_id'] in outstanding:
+                task, _ = outstanding[result['shard_id']]
+                if result['ok']:
+                    del outstanding[result['shard_id']]
+                    finished[result['shard_id']] = result['results']
+                elif result['attempt'] == task['attempt']:
+                    retry(task, result.get('error', 'worker error'))
+
+            now = time.monotonic()
+            for task, dispatched_at in list(outstanding.values()):
+                if now - dispatched_at > shard_timeout:
+                    retry(task, f'timed out after {shard_timeout:.0f}s')
+
+            # Merge completed shards strictly in order
+            while next_to_write in finished:
+                for row in finished.pop(next_to_write):
+                    csv_writer.writerow([row['predicted_answer']])
+                    json_writer.write(row)
+                    summary['rows'] += 1
+                summary['shards'] += 1
+                next_to_write += 1
+            csv_file.flush()
+            json_writer.flush()
+
+    work_queue.stop()
+    return summary
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Distributed batch execution')
+    parser.add_argument('role', choices=['coordinator', 'worker'])
+    parser.add_argument('--backend', choices=['local', 'file', 'redis'], default='local',
+                        help="Work queue: local processes, shared directory or Redis")
+    parser.add_argument('--location', type=str, default=None,
+                        help='Queue directory (file) or URL (redis)')
+    parser.add_argument('--test-file', type=str, default=TEST_FILE)
+    parser.add_argument('--output', type=str, default=OUTPUT_FILE)
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Worker processes to spawn on this machine (coordinator only)')
+    parser.add_argument('--threads', type=int, default=MAX_WORKERS,
+                        help='Concurrent problems per worker process')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    args = parser.parse_args()
+
+    work_queue = make_queue(args.backend, args.location)
+
+    if args.role == 'worker':
+        run_worker(work_queue, args.threads)
+        return
+
+    # Start workers on other nodes after the coordinator, which clears stale state
+    work_queue.reset()
+
+    if args.backend == 'local' and args.workers < 1:
+        parser.error('the local backend needs at least one spawned worker')
+    processes = spawn_local_workers(work_queue, args.workers, args.threads)
+
+    start = time.perf_counter()
+    summary = run_coordinator(args.test_file, work_queue, args.output, args.shard_size)
+    elapsed = time.perf_counter() - start
+
+    for process in processes:
+        process.join(timeout=10)
+
+    print("\n" + "="*80)
+    print("DISTRIBUTED RUN SUMMARY")
+    print("="*80)
+    print(f"Rows:           {summary['rows']}")
+    print(f"Shards:         {summary['shards']} (retries: {summary['retries']}, failed: {summary['failed_shards']})")
+    print(f"Elapsed:        {elapsed:.1f}s ({summary['rows'] / elapsed:.1f} rows/s)")
+    print(f"\n✓ Output saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Local solver engines
+Exact solvers for categories whose problems reduce to a small formal model.
+A problem is turned into a model (by rules, or by a short LLM extraction call),
+solved locally, and each answer option is checked against the solution; a
+unique match answers the problem without the chain-of-thought call.
+"""
+
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from data_loader import OPTION_KEYS
+from option_filter import is_catch_all
+
+EXTRACTION_RESPONSE_FORMAT = {"type": "json_object"}
+
+
+class EngineOutcome:
+    """What an engine made of one problem"""
+
+    __slots__ = ('answer', 'reason', 'reasoning')
+
+    def __init__(self, answer: Optional[int], reason: str, reasoning: str = ''):
+        self.answer = answer  # Option number (1-5), or None when the LLM must answer
+        self.reason = reason  # 'solved', 'catch_all', 'ambiguous', 'no_match', 'unsolvable', ...
+        self.reasoning = reasoning
+
+    @property
+    def answered(self) -> bool:
+        return self.answer is not None
+
+
+def choose_option(options: Dict[str, str],
+                  judge: Callable[[str], Optional[bool]]) -> Tuple[Optional[int], str]:
+    """
+    Pick the option a solution singles out
+
+    ``judge`` gets each option's text and returns True if it states the
+    solution, False if it was understood and is wrong, None if it could not be
+    read. Exactly one True answers; a catch-all option ("Another answer")
+    answers only when every other option was read and found wrong.
+
+    Returns:
+        (option number or None, reason)
+    """
+    verdicts, catch_all = {}, []
+    for number, key in enumerate(OPTION_KEYS, 1):
+        text = options.get(key, '')
+        if is_catch_all(text):
+            catch_all.append(number)
+        else:
+            verdicts[number] = judge(str(text))
+
+    matches = [number for number, verdict in verdicts.items() if verdict]
+    if len(matches) == 1:
+        return matches[0], 'solved'
+    if matches:
+        return None, 'ambiguous'
+    if len(catch_all) == 1 and verdicts and all(verdict is False for verdict in verdicts.values()):
+        return catch_all[0], 'catch_all'
+    return None, 'no_match'
+
+
+def parse_extraction(text: str) -> Optional[Dict]:
+    """JSON object from an extraction response (tolerates surrounding prose)"""
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class EngineMetrics:
+    """Per-engine counts of extractions, short-circuits and fallbacks to the LLM"""
+
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def record(self, engine: str, outcome: Optional[EngineOutcome], extraction: Optional[str],
+               elapsed_ms: float):
+        """
+        Args:
+            engine: Engine name
+            outcome: None when no model could be extracted
+            extraction: 'rules' or 'llm' (how the model was obtained), or None
+            elapsed_ms: Time spent in the engine, extraction call included
+        """
+        with self._lock:
+            stats = self._engines.setdefault(engine, {
+                'attempted': 0, 'extracted': {}, 'answered': 0, 'fallbacks': {}, 'elapsed_ms': 0.0
+            })
+            stats['attempted'] += 1
+            stats['elapsed_ms'] += elapsed_ms
+            if extraction is not None:
+                stats['extracted'][extraction] = stats['extracted'].get(extraction, 0) + 1
+            reason = outcome.reason if outcome is not None else 'not_extracted'
+            if outcome is not None and outcome.answered:
+                stats['answered'] += 1
+            else:
+                stats['fallbacks'][reason] = stats['fallbacks'].get(reason, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                engine: {
+                    'attempted': stats['attempted'],
+                    'extracted': dict(stats['extracted']),
+                    'answered': stats['answered'],
+                    'answer_rate': stats['answered'] / stats['attempted'],
+                    'fallbacks': dict(stats['fallbacks']),
+                    'mean_ms': stats['elapsed_ms'] / stats['attempted']
+                }
+                for engine, stats in self._engines.items()
+            }
+
+
+# Process-wide counters shared by all agents
+engine_metrics = EngineMetrics()
+
+
+def engine_report(engine, rows) -> Dict:
+    """
+    Offline coverage and accuracy of an engine's rules extraction (no LLM calls)
+
+    Args:
+        engine: Engine instance
+        rows: Iterable of (problem, options, correct option number)
+    """
+    total = extracted = answered = correct = 0
+    reasons = {}
+    for problem, options, truth in rows:
+        total += 1
+        model = engine.extract(problem)
+        if model is None:
+            continue
+        extracted += 1
+        outcome = engine.answer(model, options)
+        reasons[outcome.reason] = reasons.get(outcome.reason, 0) + 1
+        if outcome.answered:
+            answered += 1
+            correct += outcome.answer == truth
+    return {'problems': total, 'extracted': extracted, 'answered': answered,
+            'correct': correct, 'reasons': reasons}
+
+
+def print_engine_report(name: str, report: Dict):
+    print("\n" + "=" * 80)
+    print(f"{name.upper()} ENGINE (rules extraction only)")
+    print("=" * 80)
+    print(f"Problems:   {report['problems']}")
+    print(f"Extracted:  {report['extracted']}")
+    print(f"Answered:   {report['answered']} ({report['answered'] / max(report['problems'], 1):.1%})")
+    if report['answered']:
+        print(f"Correct:    {report['correct']}/{report['answered']} "
+              f"({report['correct'] / report['answered']:.1%})")
+    for reason, count in sorted(report['reasons'].items()):
+        print(f"  {reason:<12} {count}")
+
+
+def rows_from_csv(path: str, category: str) -> List[Tuple[str, Dict[str, str], int]]:
+    """Labelled (problem, options, correct option) rows of one category"""
+    import pandas as pd
+    from data_loader import OPTION_COLUMNS
+
+    df = pd.read_csv(path)
+    df = df[df['topic'] == category]
+    return [
+        (row['problem_statement'],
+         dict(zip(OPTION_KEYS, (str(row[column]) for column in OPTION_COLUMNS))),
+         int(row['correct_option_number']))
+        for _, row in df.iterrows()
+    ]
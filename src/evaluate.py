@@ -0,0 +1,259 @@
+"""
+Evaluation harness
+Measures accuracy, latency and token usage of the pipeline on labelled data (train.csv)
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import TRAIN_FILE, MAX_WORKERS
+from data_loader import OPTION_COLUMNS, OPTION_KEYS
+from profiler import SamplingProfiler, collect_stages
+from records import ReasoningResult
+
+
+def load_labelled_sample(path: str = TRAIN_FILE, samples: Optional[int] = None,
+                         seed: int = 42, category: Optional[str] = None) -> pd.DataFrame:
+    """
+    Load labelled problems for evaluation
+
+    Args:
+        path: CSV with 'topic', 'problem_statement', options and 'correct_option_number'
+        samples: Number of rows to sample (all rows if None)
+        seed: Random seed for sampling
+        category: Restrict to a single topic
+    """
+    df = pd.read_csv(path)
+    if category:
+        df = df[df['topic'] == category]
+    if samples and samples < len(df):
+        df = df.sample(n=samples, random_state=seed)
+    return df.reset_index(drop=True)
+
+
+def _evaluate_row(pipeline, problem: str, options: Dict[str, str]) -> Tuple[ReasoningResult, float]:
+    """Result and end-to-end latency in ms; a failed row counts as wrong"""
+    start = time.perf_counter()
+    try:
+        result = pipeline.process_problem(problem, options)
+    except Exception as e:
+        result = ReasoningResult.failed(str(e))
+        result.predicted_answer = None
+    return result, (time.perf_counter() - start) * 1000
+
+
+def evaluate(pipeline, df: pd.DataFrame, max_workers: int = MAX_WORKERS,
+             label: str = 'baseline', packed: bool = False) -> Dict:
+    """
+    Run the pipeline over labelled rows and aggregate metrics
+
+    With ``packed``, same-category problems share LLM calls; each problem's
+    latency is then that of its pack and its tokens are its share of the call.
+
+    Returns:
+        Dictionary with overall and per-category accuracy, latency and token usage
+    """
+    problems = df['problem_statement'].tolist()
+    option_dicts = [
+        dict(zip(OPTION_KEYS, row))
+        for row in zip(*(df[column].astype(str).tolist() for column in OPTION_COLUMNS))
+    ]
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if packed:
+            results = [
+                (result, result.llm_latency_ms or 0.0)
+                for result in pipeline.process_rows_packed(
+                    zip(range(len(problems)), problems, option_dicts), executor
+                )
+            ]
+        else:
+            results = list(executor.map(lambda args: _evaluate_row(pipeline, *args),
+                                        zip(problems, option_dicts)))
+    wall_time = time.perf_counter() - wall_start
+
+    rows = []
+    for (result, latency_ms), topic, truth in zip(results, df['topic'], df['correct_option_number']):
+        usage = result.usage or {}
+        rows.append({
+            'topic': topic,
+            'correct': result.predicted_answer == int(truth),
+            'error': result.error is not None,
+            'shortlisted': result.option_shortlist is not None,
+            'packed': result.pack_size is not None,
+            'engine': result.parse_method == 'engine',
+            'latency_ms': latency_ms,
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0)
+        })
+
+    frame = pd.DataFrame(rows)
+    per_category = defaultdict(dict)
+    for topic, group in frame.groupby('topic'):
+        per_category[topic] = {
+            'n': len(group),
+            'accuracy': group['correct'].mean(),
+            'mean_latency_ms': group['latency_ms'].mean(),
+            'mean_completion_tokens': group['completion_tokens'].mean()
+        }
+
+    shortlisted = frame[frame['shortlisted']]
+    packed_rows = frame[frame['packed']]
+    engine_rows = frame[frame['engine']]
+    return {
+        'label': label,
+        'n': len(frame),
+        'accuracy': frame['correct'].mean(),
+        'errors': int(frame['error'].sum()),
+        'mean_latency_ms': frame['latency_ms'].mean(),
+        'p95_latency_ms': float(np.percentile(frame['latency_ms'], 95)),
+        'mean_prompt_tokens': frame['prompt_tokens'].mean(),
+        'mean_completion_tokens': frame['completion_tokens'].mean(),
+        'throughput_per_sec': len(frame) / wall_time if wall_time else 0.0,
+        'shortlist_rate': len(shortlisted) / len(frame),
+        'shortlist_accuracy': shortlisted['correct'].mean() if len(shortlisted) else None,
+        'shortlist_prompt_tokens': shortlisted['prompt_tokens'].mean() if len(shortlisted) else None,
+        'packed_rate': len(packed_rows) / len(frame),
+        'packed_accuracy': packed_rows['correct'].mean() if len(packed_rows) else None,
+        'engine_rate': len(engine_rows) / len(frame),
+        'engine_accuracy': engine_rows['correct'].mean() if len(engine_rows) else None,
+        'per_category': dict(per_category)
+    }
+
+
+def print_report(metrics: Dict):
+    """Print a single evaluation run"""
+    print("\n" + "="*80)
+    print(f"EVALUATION: {metrics['label']} ({metrics['n']} problems)")
+    print("="*80)
+    print(f"Accuracy:            {metrics['accuracy']:.1%}")
+    print(f"Errors:              {metrics['errors']}")
+    print(f"Mean latency:        {metrics['mean_latency_ms']:.0f} ms")
+    print(f"p95 latency:         {metrics['p95_latency_ms']:.0f} ms")
+    print(f"Prompt tokens:       {metrics['mean_prompt_tokens']:.0f} / problem")
+    print(f"Completion tokens:   {metrics['mean_completion_tokens']:.0f} / problem")
+    print(f"Throughput:          {metrics['throughput_per_sec']:.2f} problems/s")
+    if metrics['shortlist_accuracy'] is not None:
+        print(f"Shortlisted:         {metrics['shortlist_rate']:.1%} of problems "
+              f"(acc {metrics['shortlist_accuracy']:.1%}, {metrics['shortlist_prompt_tokens']:.0f} prompt tok)")
+    if metrics['packed_accuracy'] is not None:
+        print(f"Packed:              {metrics['packed_rate']:.1%} of problems "
+              f"(acc {metrics['packed_accuracy']:.1%}; the rest were re-solved alone)")
+    if metrics['engine_accuracy'] is not None:
+        print(f"Local engines:       {metrics['engine_rate']:.1%} of problems "
+              f"(acc {metrics['engine_accuracy']:.1%}, no chain-of-thought call)")
+
+    print("\nPer category:")
+    for topic, stats in sorted(metrics['per_category'].items()):
+        print(f"  {topic:<40} n={stats['n']:>3}  acc={stats['accuracy']:>6.1%}  "
+              f"lat={stats['mean_latency_ms']:>7.0f} ms  out={stats['mean_completion_tokens']:>5.0f} tok")
+
+
+def print_comparison(baseline: Dict, candidate: Dict):
+    """Print the latency/token savings of a candidate run against a baseline"""
+    print("\n" + "="*80)
+    print(f"COMPARISON: {candidate['label']} vs {baseline['label']}")
+    print("="*80)
+
+    def delta(key):
+        before, after = baseline[key], candidate[key]
+        change = (after - before) / before if before else 0.0
+        return before, after, change
+
+    for key, name in [('mean_latency_ms', 'Mean latency (ms)'),
+                      ('p95_latency_ms', 'p95 latency (ms)'),
+                      ('mean_prompt_tokens', 'Prompt tokens'),
+                      ('mean_completion_tokens', 'Completion tokens')]:
+        before, after, change = delta(key)
+        print(f"{name:<22} {before:>9.0f} -> {after:>9.0f}  ({change:+.1%})")
+    before, after, change = delta('throughput_per_sec')
+    print(f"{'Throughput (prob/s)':<22} {before:>9.2f} -> {after:>9.2f}  ({change:+.1%})")
+
+    accuracy_change = candidate['accuracy'] - baseline['accuracy']
+    print(f"{'Accuracy':<22} {baseline['accuracy']:>9.1%} -> {candidate['accuracy']:>9.1%}  "
+          f"({accuracy_change * 100:+.1f} pts)")
+
+
+def print_stage_breakdown(stages: Dict):
+    """Print wall and CPU time per traced stage"""
+    print("\n" + "="*80)
+    print("STAGE BREAKDOWN (inclusive of child stages)")
+    print("="*80)
+    print(f"{'Stage':<28} {'calls':>6} {'wall ms/call':>13} {'cpu ms/call':>12} {'cpu share':>10}")
+    for name, stats in sorted(stages.items(), key=lambda item: -item[1]['cpu_ms']):
+        calls = stats['calls']
+        share = stats['cpu_ms'] / stats['wall_ms'] if stats['wall_ms'] else 0.0
+        print(f"{name:<28} {calls:>6} {stats['wall_ms'] / calls:>13.2f} "
+              f"{stats['cpu_ms'] / calls:>12.2f} {share:>10.1%}")
+
+
+def main():
+    """Main entry point"""
+    from main import MLReasoningPipeline
+    from reasoning_agents import MultiAgentReasoningSystem
+    from tracing import tracer
+
+    parser = argparse.ArgumentParser(description='Evaluate the ML Reasoning System on labelled data')
+    parser.add_argument('--data', type=str, default=TRAIN_FILE, help='Labelled CSV file')
+    parser.add_argument('--samples', type=int, default=50, help='Number of problems to sample (0 = all)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed')
+    parser.add_argument('--category', type=str, default=None, help='Only evaluate one topic')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Concurrent problems')
+    parser.add_argument('--compare-compact', action='store_true',
+                        help='Compare full chain-of-thought against compact reasoning')
+    parser.add_argument('--compare-packed', action='store_true',
+                        help='Compare single solves against packed multi-problem calls')
+    parser.add_argument('--compare-engines', action='store_true',
+                        help='Compare the LLM alone against local solver engines plus the LLM')
+    parser.add_argument('--stage-breakdown', action='store_true',
+                        help='Report wall and CPU time per pipeline stage')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write a sampling profile of the baseline run (.json = speedscope)')
+    args = parser.parse_args()
+
+    df = load_labelled_sample(args.data, args.samples or None, args.seed, args.category)
+    pipeline = MLReasoningPipeline(train_model=False)
+
+    with ExitStack() as stack:
+        stages = stack.enter_context(collect_stages(tracer)) if args.stage_breakdown else None
+        profiler = stack.enter_context(SamplingProfiler()) if args.profile else None
+        baseline = evaluate(pipeline, df, args.workers, label='full reasoning')
+    print_report(baseline)
+    if stages is not None:
+        print_stage_breakdown(stages.report())
+    if profiler is not None:
+        profiler.write(args.profile)
+        print(f"\n✓ Profile ({profiler.samples} samples) saved to {args.profile}")
+
+    if args.compare_compact:
+        full_system = pipeline.reasoning_system
+        pipeline.reasoning_system = MultiAgentReasoningSystem(compact=True)
+        compact = evaluate(pipeline, df, args.workers, label='compact reasoning')
+        print_report(compact)
+        print_comparison(baseline, compact)
+        pipeline.reasoning_system = full_system
+
+    if args.compare_engines:
+        engine_system = pipeline.reasoning_system
+        pipeline.reasoning_system = MultiAgentReasoningSystem(engines=False)
+        llm_only = evaluate(pipeline, df, args.workers, label='LLM only')
+        print_report(llm_only)
+        print_comparison(llm_only, baseline)
+        pipeline.reasoning_system = engine_system
+
+    if args.compare_packed:
+        packed = evaluate(pipeline, df, args.workers, label='packed', packed=True)
+        print_report(packed)
+        print_comparison(baseline, packed)
+
+
+if __name__ == "__main__":
+    main()
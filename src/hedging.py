@@ -0,0 +1,191 @@
+"""
+Request hedging
+Latency percentile tracking, a per-minute hedge budget and a hedged-call runner
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from config import HEDGE_BUDGET_PER_MINUTE, HEDGE_MIN_SAMPLES
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies with percentile lookup (thread-safe)"""
+
+    def __init__(self, window: int = 200, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile in ms, or None until enough samples are collected"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = list(self._samples)
+        return float(np.percentile(samples, q))
+
+
+class HedgeBudget:
+    """Caps the number of hedged (duplicate) requests per rolling minute"""
+
+    def __init__(self, per_minute: int = HEDGE_BUDGET_PER_MINUTE):
+        self.per_minute = per_minute
+        self._issued = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._issued and now - self._issued[0] > 60.0:
+                self._issued.popleft()
+            if len(self._issued) >= self.per_minute:
+                return False
+            self._issued.append(now)
+            return True
+
+
+class HedgeMetrics:
+    """Counters for hedge rate and the latency won by hedging"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.latency_won_ms = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedge_rate': self.hedges / self.calls if self.calls else 0.0,
+            'hedge_wins': self.hedge_wins,
+            'budget_denied': self.budget_denied,
+            'latency_won_ms_total': self.latency_won_ms,
+            'latency_won_ms_mean': self.latency_won_ms / self.hedge_wins if self.hedge_wins else 0.0
+        }
+
+
+# Process-wide budget and metrics shared by all agents
+hedge_budget = HedgeBudget()
+hedge_metrics = HedgeMetrics()
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='hedge')
+
+# Set inside run_hedged attempts, so nested layers (the LLM router) do not hedge again
+_in_hedged_call = contextvars.ContextVar('in_hedged_call', default=False)
+
+
+def in_hedged_call() -> bool:
+    """Whether the current call is an attempt of an (agent-level) hedged call"""
+    return _in_hedged_call.get()
+
+
+def _attempt(call: Callable[[threading.Event], Dict], cancel: threading.Event) -> Dict:
+    _in_hedged_call.set(True)  # Runs in a copied context, so this does not leak out
+    return call(cancel)
+
+
+def run_hedged(call: Callable[[threading.Event], Dict], tracker: LatencyTracker,
+               percentile: float, is_valid: Callable[[Dict], bool] = lambda result: True,
+               budget: HedgeBudget = hedge_budget, metrics: HedgeMetrics = hedge_metrics) -> Dict:
+    """
+    Run ``call`` and fire a duplicate if it is slower than the tracked percentile
+
+    ``call`` receives a cancellation event; the losing attempt's event is set so
+    it can abandon work at its next checkpoint. Only a streamed call can really
+    stop: closing the stream drops the connection, so the backend stops
+    generating. A blocking ``invoke`` cannot be interrupted and runs (and is
+    billed) to completion, which is why agents stream their hedged attempts.
+
+    Args:
+        call: Function performing one attempt and returning a parsed result
+        tracker: Latency history that defines the hedge delay
+        percentile: Percentile of ``tracker`` after which to hedge
+        is_valid: Predicate for results that may win the race
+        budget: Hedge budget to draw duplicate requests from
+        metrics: Metrics sink
+
+    Returns:
+        The first valid result (or the last result if none is valid)
+    """
+    metrics._add(calls=1)
+    start = time.perf_counter()
+    delay = tracker.percentile(percentile)
+
+    primary_cancel = threading.Event()
+    # Attempts run in the caller's context so their spans stay in the same trace
+    primary = _executor.submit(contextvars.copy_context().run, _attempt, call, primary_cancel)
+    attempts = {primary: primary_cancel}
+
+    # Track the primary's latency whenever it finishes, including the slow
+    # primaries that lost to a hedge; a primary abandoned after losing (or
+    # failing because it was abandoned) contributes its elapsed time so far,
+    # a lower bound that still keeps the slow tail in the distribution
+    def record_primary(future):
+        if future.cancelled():
+            return
+        if future.exception() is None or primary_cancel.is_set():
+            tracker.record((time.perf_counter() - start) * 1000)
+    primary.add_done_callback(record_primary)
+
+    if delay is not None:
+        done, _ = wait([primary], timeout=delay / 1000)
+        if not done:
+            if budget.try_acquire():
+                metrics._add(hedges=1)
+                hedge_cancel = threading.Event()
+                attempts[_executor.submit(contextvars.copy_context().run, _attempt, call, hedge_cancel)] = hedge_cancel
+            else:
+                metrics._add(budget_denied=1)
+
+    pending = set(attempts)
+    fallback = None
+    last_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            result = future.result()
+            if not is_valid(result):
+                fallback = result
+                continue
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for other in pending:
+                attempts[other].set()
+                other.cancel()
+            if future is not primary:
+                metrics._add(hedge_wins=1)
+                # Credit the time the primary would still have taken, once it finishes
+                primary.add_done_callback(
+                    lambda _, won_at=elapsed_ms: metrics._add(
+                        latency_won_ms=max((time.perf_counter() - start) * 1000 - won_at, 0.0)
+                    )
+                )
+            return result
+
+    if fallback is not None:
+        return fallback
+    raise last_error
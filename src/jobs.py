@@ -0,0 +1,374 @@
+"""
+Asynchronous batch jobs
+SQLite-backed job store and a runner that feeds job items through the solve scheduler
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from config import (
+    JOBS_DB_FILE, JOB_MAX_IN_FLIGHT, JOB_CALLBACK_ATTEMPTS, JOB_CALLBACK_TIMEOUT, JOB_CALLBACK_BACKOFF
+)
+from records import ReasoningResult
+from scheduler import QueueFullError
+from usage_ledger import UsageBudget
+from verification import cache_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client_id TEXT,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    max_cost REAL,
+    max_tokens INTEGER,
+    spent_cost REAL NOT NULL DEFAULT 0,
+    spent_tokens INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    callback_url TEXT
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    problem TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_pending ON job_items (job_id, status, idx);
+"""
+
+# Columns added after the first release, for databases created before them
+_ADDED_JOB_COLUMNS = {
+    'max_cost': 'REAL',
+    'max_tokens': 'INTEGER',
+    'spent_cost': 'REAL NOT NULL DEFAULT 0',
+    'spent_tokens': 'INTEGER NOT NULL DEFAULT 0',
+    'error': 'TEXT',
+    'callback_url': 'TEXT'
+}
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class JobStore:
+    """Persists jobs and per-item results so jobs survive restarts"""
+
+    def __init__(self, path: str = JOBS_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for column, definition in _ADDED_JOB_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, items: Iterable[Tuple[str, List[str]]], client_id: str = 'anonymous',
+                   chunk_size: int = 1000, max_cost: Optional[float] = None,
+                   max_tokens: Optional[int] = None, callback_url: Optional[str] = None) -> str:
+        """
+        Create a job from (problem, options) pairs, inserted in chunks
+
+        ``max_cost``/``max_tokens`` budget the whole job; items solved near the
+        limit use cheaper prompts. ``callback_url`` is POSTed the job's status
+        once it completes or fails.
+
+        Returns:
+            The new job id
+        """
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        total = 0
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT INTO jobs (id, client_id, status, created_at, updated_at, max_cost, max_tokens, '
+                'callback_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, client_id, 'queued', _now(), _now(), max_cost, max_tokens, callback_url)
+            )
+            batch = []
+            for problem, options in items:
+                batch.append((job_id, total, problem, json.dumps(list(options))))
+                total += 1
+                if len(batch) >= chunk_size:
+                    conn.executemany(
+                        'INSERT INTO job_items (job_id, idx, problem, options) VALUES (?, ?, ?, ?)', batch
+                    )
+                    batch = []
+            if batch:
+                conn.executemany(
+                    'INSERT INTO job_items (job_id, idx, problem, options) VALUES (?, ?, ?, ?)', batch
+                )
+            conn.execute('UPDATE jobs SET total = ? WHERE id = ?', (total, job_id))
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        row = self._conn().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        done = job['completed'] + job['failed']
+        job['progress'] = done / job['total'] if job['total'] else 1.0
+        return job
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._write_lock, self._conn() as conn:
+            conn.execute('UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                         (status, error, _now(), job_id))
+
+    def unfinished_jobs(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    def iter_pending_items(self, job_id: str, page_size: int = 500) -> Iterator[Tuple[int, str, List[str]]]:
+        """Yield pending (idx, problem, options) in order, paging by index"""
+        last_idx = -1
+        while True:
+            rows = self._conn().execute(
+                "SELECT idx, problem, options FROM job_items "
+                "WHERE job_id = ? AND status = 'pending' AND idx > ? ORDER BY idx LIMIT ?",
+                (job_id, last_idx, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row['idx'], row['problem'], json.loads(row['options'])
+            last_idx = rows[-1]['idx']
+
+    def record_results(self, job_id: str, outcomes: List[Tuple[int, Dict, bool]],
+                       spent: Optional[Tuple[int, float]] = None):
+        """
+        Store finished items as (idx, result, failed) and bump the job counters
+
+        ``spent`` is the job's running (tokens, cost) total, persisted alongside
+        so a resumed job keeps its budget.
+        """
+        if not outcomes:
+            return
+        failed = sum(1 for _, _, is_error in outcomes if is_error)
+        with self._write_lock, self._conn() as conn:
+            conn.executemany(
+                'UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND idx = ?',
+                [('error' if is_error else 'done', json.dumps(result, default=str), job_id, idx)
+                 for idx, result, is_error in outcomes]
+            )
+            conn.execute(
+                'UPDATE jobs SET completed = completed + ?, failed = failed + ?, updated_at = ? WHERE id = ?',
+                (len(outcomes) - failed, failed, _now(), job_id)
+            )
+            if spent is not None:
+                conn.execute('UPDATE jobs SET spent_tokens = ?, spent_cost = ? WHERE id = ?',
+                             (spent[0], spent[1], job_id))
+
+    def replace_results(self, job_id: str, results: List[Tuple[int, Dict]]):
+        """Overwrite finished items' results as (idx, result), e.g. once they are verified"""
+        if not results:
+            return
+        with self._write_lock, self._conn() as conn:
+            conn.executemany(
+                "UPDATE job_items SET result = ? WHERE job_id = ? AND idx = ? AND status = 'done'",
+                [(json.dumps(result, default=str), job_id, idx) for idx, result in results]
+            )
+            conn.execute('UPDATE jobs SET updated_at = ? WHERE id = ?', (_now(), job_id))
+
+    def iter_results(self, job_id: str, offset: int = 0,
+                     limit: Optional[int] = None) -> Iterator[Dict]:
+        """Yield finished item results in row order"""
+        query = ("SELECT idx, status, result FROM job_items "
+                 "WHERE job_id = ? AND status != 'pending' ORDER BY idx LIMIT ? OFFSET ?")
+        cursor = self._conn().execute(query, (job_id, -1 if limit is None else limit, offset))
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            for row in rows:
+                result = json.loads(row['result'])
+                result['row_index'] = row['idx']
+                result['status'] = row['status']
+                yield result
+
+
+class JobRunner:
+    """
+    Executes stored jobs through the solve scheduler at batch priority
+
+    Each job keeps at most ``max_in_flight`` items queued, so a huge job neither
+    fills the scheduler nor holds its items in memory. Finished items are
+    written back immediately, which makes every item a checkpoint: on restart
+    ``resume`` continues unfinished jobs from their pending items. All items of
+    a job draw on one usage budget, whose spending is persisted with the results.
+    With a ``verifier``, items stored with a verification pending are
+    rewritten when their background check finishes. A job with a callback URL
+    has its final status POSTed there, with up to ``callback_attempts``
+    deliveries and exponential backoff.
+    """
+
+    def __init__(self, store: JobStore, scheduler, solve_fn: Callable[[str, List[str], UsageBudget], Dict],
+                 max_in_flight: int = JOB_MAX_IN_FLIGHT, verifier=None,
+                 callback_attempts: int = JOB_CALLBACK_ATTEMPTS,
+                 callback_backoff: float = JOB_CALLBACK_BACKOFF):
+        self.store = store
+        self.scheduler = scheduler
+        self.solve_fn = solve_fn
+        self.max_in_flight = max_in_flight
+        self.verifier = verifier
+        self.callback_attempts = callback_attempts
+        self.callback_backoff = callback_backoff
+        self._threads = {}
+        self._awaiting = {}  # Cache key -> [(job id, idx, options)] stored with a pending verification
+        self._awaiting_lock = threading.Lock()
+        if verifier is not None:
+            verifier.add_listener(self._on_verified)
+
+    def start(self, job_id: str):
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f'job-{job_id[:8]}', daemon=True)
+        self._threads[job_id] = thread
+        thread.start()
+
+    def resume(self) -> List[str]:
+        """Restart every job that was queued or running when the process stopped"""
+        job_ids = self.store.unfinished_jobs()
+        for job_id in job_ids:
+            self.start(job_id)
+        return job_ids
+
+    def _submit(self, client_id: str, problem: str, options: List[str], budget: UsageBudget):
+        while True:
+            try:
+                return self.scheduler.submit(
+                    self.solve_fn, problem, options, budget, priority='batch', client_id=client_id
+                )
+            except QueueFullError as e:
+                time.sleep(e.retry_after)
+
+    def _collect(self, job_id: str, in_flight: Dict, budget: UsageBudget):
+        """Wait for at least one in-flight item and persist everything finished"""
+        futures = {job.future: (idx, problem, options) for idx, (job, problem, options) in in_flight.items()}
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        outcomes, awaiting = [], []
+        for future in done:
+            idx, problem, options = futures[future]
+            del in_flight[idx]
+            if future.exception() is None:
+                result = future.result()
+                outcomes.append((idx, job_result(result, options), False))
+                if result.verification == 'pending' and self.verifier is not None:
+                    awaiting.append((cache_key(problem, options), idx, options))
+            else:
+                outcomes.append((idx, {'error': str(future.exception())}, True))
+        self.store.record_results(job_id, outcomes, spent=(budget.spent_tokens, budget.spent_cost))
+        for key, idx, options in awaiting:
+            self._await_verification(key, job_id, idx, options)
+
+    def _await_verification(self, key, job_id: str, idx: int, options: List[str]):
+        """Rewrite a stored item once its verification finishes (at once if it already has)"""
+        with self._awaiting_lock:
+            self._awaiting.setdefault(key, []).append((job_id, idx, options))
+        cached = self.verifier.cache.peek(key)
+        if cached is not None and cached.verification not in (None, 'pending'):
+            self._on_verified(key, cached)
+
+    def _on_verified(self, key, result: ReasoningResult):
+        with self._awaiting_lock:
+            items = self._awaiting.pop(key, [])
+        by_job = {}
+        for job_id, idx, options in items:
+            by_job.setdefault(job_id, []).append((idx, job_result(result, options)))
+        for job_id, results in by_job.items():
+            self.store.replace_results(job_id, results)
+
+    def _run(self, job_id: str):
+        try:
+            self._run_items(job_id)
+        except Exception as e:
+            # Item errors are stored per item; this is the job itself breaking
+            # (e.g. the database or scheduler), which would otherwise leave it 'running'
+            print(f"✗ Job {job_id} failed: {e}")
+            self.store.set_status(job_id, 'failed', error=str(e) or type(e).__name__)
+        try:
+            self._notify(job_id)
+        finally:
+            self._threads.pop(job_id, None)
+
+    def _notify(self, job_id: str) -> bool:
+        """POST a finished job's status to its callback URL; whether it was delivered"""
+        job = self.store.get_job(job_id)
+        if job is None or not job.get('callback_url'):
+            return False
+        delay = self.callback_backoff
+        for attempt in range(1, self.callback_attempts + 1):
+            try:
+                response = httpx.post(job['callback_url'], json=job, timeout=JOB_CALLBACK_TIMEOUT)
+                if response.is_success:
+                    return True
+                error = f'HTTP {response.status_code}'
+                if response.status_code < 500 and response.status_code != 429:
+                    break  # The receiver rejected it; retrying will not help
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.callback_attempts:
+                time.sleep(delay)
+                delay *= 2
+        print(f"✗ Callback for job {job_id} to {job['callback_url']} failed: {error}")
+        return False
+
+    def _run_items(self, job_id: str):
+        job = self.store.get_job(job_id)
+        client_id = f"job:{job['client_id']}"
+        budget = UsageBudget(job['max_cost'], job['max_tokens'], scope=f'job:{job_id}',
+                             spent_cost=job['spent_cost'], spent_tokens=job['spent_tokens'])
+        self.store.set_status(job_id, 'running')
+
+        in_flight = {}
+        for idx, problem, options in self.store.iter_pending_items(job_id):
+            while len(in_flight) >= self.max_in_flight:
+                self._collect(job_id, in_flight, budget)
+            in_flight[idx] = (self._submit(client_id, problem, options, budget), problem, options)
+        while in_flight:
+            self._collect(job_id, in_flight, budget)
+
+        self.store.set_status(job_id, 'completed')
+
+
+def job_result(result: ReasoningResult, options: List[str]) -> Dict:
+    """The subset of a pipeline result persisted for each job item"""
+    answer_index = result.predicted_answer - 1
+    return {
+        'predicted_answer': result.predicted_answer,
+        'answer_text': options[answer_index] if 0 <= answer_index < len(options) else 'Invalid answer index',
+        'confidence': result.confidence,
+        'reasoning': result.reasoning,
+        'category': result.category,
+        'category_confidence': result.category_confidence,
+        'budget_degraded': result.budget_degraded,
+        'verification': result.verification,
+        'degraded': result.degraded
+    }
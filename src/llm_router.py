@@ -0,0 +1,362 @@
+"""
+Multi-backend LLM routing
+Routes calls across OpenAI-compatible endpoints (and an optional in-process local
+model) by observed latency and error rate, with hedged requests and automatic failover
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+
+from config import (
+    TEMPERATURE, LLM_BACKENDS, DEFAULT_BACKENDS, CATEGORY_BACKENDS, LOCAL_BACKENDS, LOCAL_MODEL_POLICY,
+    ROUTER_EWMA_ALPHA, ROUTER_HEDGE_PERCENTILE, ROUTER_HEDGE_MIN_SAMPLES,
+    ROUTER_PROBE_INTERVAL, ROUTER_ERROR_PENALTY
+)
+from hedging import HedgeBudget, LatencyTracker, hedge_budget, in_hedged_call
+from llm_transport import llm_transport
+from token_budget import usage_from_response
+from usage_ledger import active_usage, record_call
+
+
+class BackendStats:
+    """
+    EWMA latency/error tracking for one backend (thread-safe)
+
+    Latency samples are whole-call durations. Streams record their time to
+    first chunk separately, since it is not comparable with a full call.
+    """
+
+    def __init__(self, alpha: float = ROUTER_EWMA_ALPHA):
+        self.alpha = alpha
+        self.ewma_latency_ms = None
+        self.ewma_error_rate = 0.0
+        self.latencies = LatencyTracker(min_samples=ROUTER_HEDGE_MIN_SAMPLES)
+        self.first_chunk = LatencyTracker(min_samples=ROUTER_HEDGE_MIN_SAMPLES)
+        self.calls = 0
+        self.errors = 0
+        self.last_used = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: Optional[float], error: bool):
+        """Record one call; ``latency_ms`` is None for a success of unknown duration"""
+        with self._lock:
+            self.calls += 1
+            self.last_used = time.monotonic()
+            self.ewma_error_rate += self.alpha * (float(error) - self.ewma_error_rate)
+            if error:
+                self.errors += 1
+                return
+            if latency_ms is None:
+                return
+            self.latencies.record(latency_ms)
+            if self.ewma_latency_ms is None:
+                self.ewma_latency_ms = latency_ms
+            else:
+                self.ewma_latency_ms += self.alpha * (latency_ms - self.ewma_latency_ms)
+
+    def score(self) -> float:
+        """Lower is better; untried or long-idle backends score 0 so they get probed"""
+        if self.calls == 0 or time.monotonic() - self.last_used > ROUTER_PROBE_INTERVAL:
+            return 0.0
+        # A backend that has only ever failed ranks behind any that has succeeded
+        latency = self.ewma_latency_ms if self.ewma_latency_ms is not None else 60_000.0
+        return latency * (1.0 + ROUTER_ERROR_PENALTY * self.ewma_error_rate)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile in ms, or None until enough samples are collected"""
+        return self.latencies.percentile(q)
+
+    def snapshot(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'ewma_latency_ms': self.ewma_latency_ms,
+            'ewma_error_rate': self.ewma_error_rate,
+            f'p{ROUTER_HEDGE_PERCENTILE}_latency_ms': self.percentile(ROUTER_HEDGE_PERCENTILE),
+            f'p{ROUTER_HEDGE_PERCENTILE}_first_chunk_ms': self.first_chunk.percentile(ROUTER_HEDGE_PERCENTILE)
+        }
+
+
+class LLMBackend:
+    """A named chat model endpoint with its own health statistics"""
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.stats = BackendStats()
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.client.invoke(messages, **kwargs)
+        except Exception:
+            self.stats.record((time.perf_counter() - start) * 1000, error=True)
+            raise
+        self.stats.record((time.perf_counter() - start) * 1000, error=False)
+        metadata = getattr(response, 'response_metadata', None)
+        if isinstance(metadata, dict):
+            metadata['backend'] = self.name  # Lets the usage ledger attribute the call
+        return response
+
+
+class LLMRouter:
+    """
+    Chat-model facade that picks the healthiest backend per call
+
+    Exposes ``invoke`` and ``stream`` like a LangChain chat model, so agents can
+    use it unchanged. If the chosen backend has not answered by its observed
+    p95 latency, the same request is sent to the next-best backend and the
+    first successful response wins. Failed calls fail over to the next backend.
+    ``fallbacks`` are tried, in health order, only once every primary backend
+    has failed; they are never hedged into. Hedges draw on ``hedge_budget``
+    (by default the process-wide budget agent hedging also uses), and calls
+    made inside an agent-level hedged attempt are never hedged again.
+
+    A hedge's losing call cannot be cancelled once it is running, so it is
+    charged when it completes to the usage scope that was active when the
+    call was made (see usage_ledger.charging).
+    """
+
+    def __init__(self, backends: List[LLMBackend], hedge: bool = True,
+                 hedge_percentile: float = ROUTER_HEDGE_PERCENTILE,
+                 fallbacks: Optional[List[LLMBackend]] = None,
+                 hedge_budget: HedgeBudget = hedge_budget):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.fallbacks = fallbacks or []
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedged_calls = 0
+        self.hedges_denied = 0
+        self.failovers = 0
+        self.fallback_calls = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-router')
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _rank(self, backends: List[LLMBackend]) -> List[LLMBackend]:
+        return sorted(backends, key=lambda backend: backend.stats.score())
+
+    def invoke(self, messages, **kwargs):
+        try:
+            return self._invoke(self._rank(self.backends), messages, kwargs)
+        except Exception:
+            if not self.fallbacks:
+                raise
+        self._count('fallback_calls')
+        return self._invoke(self._rank(self.fallbacks), messages, kwargs)
+
+    def _invoke(self, candidates: List[LLMBackend], messages, kwargs):
+        last_error = None
+
+        while candidates:
+            primary = candidates.pop(0)
+            hedge_after = None
+            if self.hedge and candidates and not in_hedged_call():
+                hedge_after = primary.stats.percentile(self.hedge_percentile)
+
+            if hedge_after is None:
+                try:
+                    return primary.invoke(messages, **kwargs)
+                except Exception as e:
+                    last_error = e
+                    self._count('failovers')
+                    continue
+
+            scope = active_usage()
+            started = {self._executor.submit(primary.invoke, messages, **kwargs): time.perf_counter()}
+            done, _ = wait(started, timeout=hedge_after / 1000)
+            if not done:
+                # Primary is slower than its own p95: race it against the next backend
+                if self.hedge_budget.try_acquire():
+                    self._count('hedged_calls')
+                    started[self._executor.submit(candidates.pop(0).invoke, messages, **kwargs)] = time.perf_counter()
+                else:
+                    self._count('hedges_denied')
+
+            pending = set(started)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        for other in pending:
+                            other.cancel()  # Only stops a call still queued in the executor
+                            other.add_done_callback(
+                                lambda loser, start=started[other]: self._charge_loser(loser, messages, start, scope)
+                            )
+                        return future.result()
+                    last_error = future.exception()
+            self._count('failovers')
+
+        raise last_error
+
+    @staticmethod
+    def _charge_loser(future, messages, start: float, scope):
+        """Record the tokens of a hedged call that lost the race, once it completes"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        response = future.result()
+        usage = usage_from_response(response, messages, response.content)
+        record_call(usage, (time.perf_counter() - start) * 1000, 'hedge_loser', scope)
+
+    def stream(self, messages, **kwargs):
+        """Stream from the best backend, failing over only before the first chunk"""
+        last_error = None
+        for position, backend in enumerate(self._rank(self.backends) + self._rank(self.fallbacks)):
+            if position == len(self.backends):
+                self._count('fallback_calls')
+            start = time.perf_counter()
+            try:
+                iterator = iter(backend.client.stream(messages, **kwargs))
+                first = next(iterator)
+            except StopIteration:
+                backend.stats.record((time.perf_counter() - start) * 1000, error=False)
+                return
+            except Exception as e:
+                backend.stats.record((time.perf_counter() - start) * 1000, error=True)
+                last_error = e
+                self._count('failovers')
+                continue
+            backend.stats.first_chunk.record((time.perf_counter() - start) * 1000)
+            try:
+                yield first
+                yield from iterator
+            except GeneratorExit:
+                # Closed early by the consumer (e.g. an answer parsed mid-stream):
+                # a success, but its duration is not a full call's
+                backend.stats.record(None, error=False)
+                raise
+            except Exception:
+                backend.stats.record((time.perf_counter() - start) * 1000, error=True)
+                raise
+            backend.stats.record((time.perf_counter() - start) * 1000, error=False)
+            return
+        raise last_error
+
+    def snapshot(self) -> Dict:
+        """Routing metrics for monitoring"""
+        return {
+            'backends': {backend.name: backend.stats.snapshot() for backend in self.backends},
+            'fallbacks': [backend.name for backend in self.fallbacks],
+            'hedged_calls': self.hedged_calls,
+            'hedges_denied': self.hedges_denied,
+            'failovers': self.failovers,
+            'fallback_calls': self.fallback_calls
+        }
+
+
+def create_backend(name: str, spec: Dict) -> Optional[LLMBackend]:
+    """
+    Build a backend from its LLM_BACKENDS entry
+
+    Returns None when the backend needs an API key that is not configured.
+    Local OpenAI-compatible servers (with a base_url) may run without a key.
+    Specs with ``"type": "llama_cpp"`` load a GGUF model in-process; they are
+    skipped with a warning when llama-cpp-python or the model file is missing.
+    """
+    if spec.get('type') == 'llama_cpp':
+        from local_model import create_local_client
+        try:
+            return LLMBackend(name, create_local_client(spec))
+        except (ImportError, ValueError) as e:
+            print(f"✗ Local backend '{name}' unavailable: {e}")
+            return None
+
+    api_key = os.getenv(spec.get('api_key_env') or '') or None
+    base_url = spec.get('base_url')
+    if api_key is None:
+        if not base_url:
+            return None
+        api_key = 'not-needed'
+
+    client = ChatOpenAI(
+        model=spec['model'],
+        temperature=spec.get('temperature', TEMPERATURE),
+        api_key=api_key,
+        base_url=base_url,
+        timeout=spec.get('timeout'),
+        max_retries=spec.get('max_retries', 2)
+    )
+    return LLMBackend(name, client)
+
+
+def registry_key(backend_specs: Dict = None) -> Tuple:
+    """What a backend registry is built from: the transport configuration and the backend specs"""
+    backend_specs = LLM_BACKENDS if backend_specs is None else backend_specs
+    return llm_transport.generation, json.dumps(backend_specs, sort_keys=True, default=str)
+
+
+class BackendRegistry:
+    """
+    Creates each configured backend once and builds per-category routers over them
+
+    Under the 'record' transport every backend's client is wrapped to archive
+    its calls; under 'replay' every configured backend answers from the archive.
+    """
+
+    def __init__(self, backend_specs: Dict = None):
+        backend_specs = LLM_BACKENDS if backend_specs is None else backend_specs
+        self.key = registry_key(backend_specs)
+        self.backends = {}
+        for name, spec in backend_specs.items():
+            if llm_transport.mode == 'replay':
+                self.backends[name] = LLMBackend(name, llm_transport.replay_client())
+                continue
+            backend = create_backend(name, spec)
+            if backend is not None:
+                backend.client = llm_transport.wrap(name, backend.client)
+                self.backends[name] = backend
+        self._routers = {}
+
+    def router_for(self, category: Optional[str] = None) -> LLMRouter:
+        """
+        Router over the category's backend list (shared stats across categories)
+
+        An explicit CATEGORY_BACKENDS entry wins. Otherwise categories set to
+        'local' in LOCAL_MODEL_POLICY use the local backends, with the default
+        remote backends as fallbacks, and the rest use DEFAULT_BACKENDS.
+        """
+        names, fallback_names = CATEGORY_BACKENDS.get(category), ()
+        if names is None and LOCAL_MODEL_POLICY.get(category) == 'local' and LOCAL_BACKENDS:
+            names, fallback_names = LOCAL_BACKENDS, DEFAULT_BACKENDS
+        available = tuple(name for name in names or DEFAULT_BACKENDS if name in self.backends)
+        fallbacks = tuple(name for name in fallback_names
+                          if name in self.backends and name not in available)
+        if not available:
+            available, fallbacks = tuple(self.backends), ()
+        if not available:
+            raise ValueError(
+                "No LLM backend available. Set OPENAI_API_KEY in your .env file "
+                "or configure LLM_BACKENDS"
+            )
+        key = (available, fallbacks)
+        if key not in self._routers:
+            self._routers[key] = LLMRouter([self.backends[name] for name in available],
+                                           fallbacks=[self.backends[name] for name in fallbacks])
+        return self._routers[key]
+
+    def snapshot(self) -> Dict:
+        routers = list(self._routers.values())
+        backends = {}
+        for name, backend in self.backends.items():
+            backends[name] = backend.stats.snapshot()
+            if hasattr(backend.client, 'snapshot'):
+                backends[name]['local_batching'] = backend.client.snapshot()
+        return {
+            'backends': backends,
+            'hedged_calls': sum(router.hedged_calls for router in routers),
+            'hedges_denied': sum(router.hedges_denied for router in routers),
+            'failovers': sum(router.failovers for router in routers),
+            'fallback_calls': sum(router.fallback_calls for router in routers)
+        }
@@ -0,0 +1,342 @@
+"""
+Record/replay LLM transport
+Captures chat requests and responses, with their timing, in an indexed SQLite
+archive and serves them back offline, optionally at the recorded latencies
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from config import LLM_TRANSPORT, LLM_ARCHIVE_FILE, REPLAY_LATENCY_SCALE, ARCHIVE_FLUSH_ROWS
+
+TRANSPORT_MODES = ('live', 'record', 'replay')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    request_key TEXT NOT NULL,
+    backend TEXT,
+    kind TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    latency_ms REAL NOT NULL,
+    request BLOB NOT NULL,
+    response BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_request_key ON calls (request_key, id);
+"""
+
+
+class ReplayMissError(LookupError):
+    """The archive has no recording of a request"""
+
+
+class ReplayedError(RuntimeError):
+    """A provider error that was recorded and is being replayed"""
+
+
+def _pack(payload: Dict) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def _unpack(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob))
+
+
+def request_payload(messages, kwargs: Dict) -> Dict:
+    """The parts of a chat call that determine its response"""
+    return {
+        'messages': [[getattr(message, 'type', 'human'), message.content] for message in messages],
+        'params': {key: kwargs[key] for key in sorted(kwargs)}
+    }
+
+
+def request_key(payload: Dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMArchive:
+    """
+    SQLite archive of chat calls keyed by a hash of the request
+
+    Responses and requests are stored as zlib-compressed JSON. Recorded calls
+    are buffered and written every ``flush_rows`` calls and at exit. For
+    replay, only the index (request key -> row ids) is held in memory; each
+    response is read by row id when it is served. A request recorded several
+    times is answered with its recordings in order, cycling when exhausted.
+    """
+
+    def __init__(self, path: str = LLM_ARCHIVE_FILE, flush_rows: int = ARCHIVE_FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self._pending = []
+        self._index = None
+        self._cursor = defaultdict(int)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def record(self, payload: Dict, backend: Optional[str], kind: str, latency_ms: float, response: Dict):
+        """Buffer one call; ``response`` holds content, metadata, error and stream chunks"""
+        row = (request_key(payload), backend, kind, time.time(), latency_ms,
+               _pack(payload), _pack(response))
+        with self._lock:
+            self._pending.append(row)
+            should_flush = len(self._pending) >= self.flush_rows
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Persist buffered calls"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO calls (request_key, backend, kind, recorded_at, latency_ms, request, response) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+
+    def _load_index(self) -> Dict[str, List[int]]:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No LLM archive at {self.path}. Record one with LLM_TRANSPORT=record")
+        index = defaultdict(list)
+        with self._db_lock:
+            for key, row_id in self._connect().execute("SELECT request_key, id FROM calls ORDER BY id"):
+                index[key].append(row_id)
+        return dict(index)
+
+    def lookup(self, payload: Dict) -> Dict:
+        """Next recording of a request (latency_ms plus the response fields)"""
+        key = request_key(payload)
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            row_ids = self._index.get(key)
+            if not row_ids:
+                raise ReplayMissError(f"Request {key[:12]} was not recorded in {self.path}")
+            row_id = row_ids[self._cursor[key] % len(row_ids)]
+            self._cursor[key] += 1
+        with self._db_lock:
+            latency_ms, blob = self._connect().execute(
+                "SELECT latency_ms, response FROM calls WHERE id = ?", (row_id,)
+            ).fetchone()
+        response = _unpack(blob)
+        response['latency_ms'] = latency_ms
+        return response
+
+    def summary(self) -> Dict:
+        """Call counts and recorded latency percentiles per backend"""
+        self.flush()
+        with self._db_lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT backend, latency_ms FROM calls").fetchall()
+            distinct = conn.execute("SELECT COUNT(DISTINCT request_key) FROM calls").fetchone()[0]
+        latencies = defaultdict(list)
+        for backend, latency_ms in rows:
+            latencies[backend or 'unknown'].append(latency_ms)
+        return {
+            'calls': len(rows),
+            'distinct_requests': distinct,
+            'file_bytes': os.path.getsize(self.path),
+            'backends': {
+                backend: {
+                    'calls': len(values),
+                    'p50_latency_ms': float(np.percentile(values, 50)),
+                    'p95_latency_ms': float(np.percentile(values, 95))
+                }
+                for backend, values in latencies.items()
+            }
+        }
+
+
+def _message_fields(message) -> Dict:
+    return {
+        'usage_metadata': getattr(message, 'usage_metadata', None),
+        'response_metadata': dict(getattr(message, 'response_metadata', None) or {})
+    }
+
+
+class RecordingClient:
+    """Chat client wrapper that archives every call it passes through"""
+
+    def __init__(self, client, archive: LLMArchive, backend: Optional[str] = None):
+        self.client = client
+        self.archive = archive
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)  # e.g. snapshot() of a local model
+
+    def invoke(self, messages, **kwargs):
+        payload = request_payload(messages, kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.client.invoke(messages, **kwargs)
+        except Exception as e:
+            self.archive.record(payload, self.backend, 'invoke', (time.perf_counter() - start) * 1000,
+                                {'error': f"{type(e).__name__}: {e}"})
+            raise
+        self.archive.record(payload, self.backend, 'invoke', (time.perf_counter() - start) * 1000,
+                            {'content': response.content, **_message_fields(response)})
+        return response
+
+    def stream(self, messages, **kwargs):
+        """Pass chunks through, recording each one's offset; early close records the partial stream"""
+        payload = request_payload(messages, kwargs)
+        chunks, fields, error = [], {}, None
+        start = time.perf_counter()
+        try:
+            for chunk in self.client.stream(messages, **kwargs):
+                chunks.append([(time.perf_counter() - start) * 1000, chunk.content])
+                if getattr(chunk, 'usage_metadata', None) or getattr(chunk, 'response_metadata', None):
+                    fields = _message_fields(chunk)
+                yield chunk
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.archive.record(payload, self.backend, 'stream', (time.perf_counter() - start) * 1000,
+                                {'chunks': chunks, 'error': error, **fields})
+
+
+class ReplayClient:
+    """
+    Chat client that answers from an archive instead of the provider
+
+    Each call waits for its recorded latency times ``latency_scale`` (streams
+    pace every chunk at its recorded offset), then returns the recorded
+    response or raises the recorded error.
+    """
+
+    def __init__(self, archive: LLMArchive, latency_scale: float = REPLAY_LATENCY_SCALE):
+        self.archive = archive
+        self.latency_scale = latency_scale
+
+    def _wait_until(self, start: float, offset_ms: float):
+        delay = start + offset_ms * self.latency_scale / 1000 - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        recording = self.archive.lookup(request_payload(messages, kwargs))
+        if 'chunks' in recording:
+            # Recorded as a stream: the joined chunks answer a plain call too
+            recording['content'] = ''.join(text for _, text in recording['chunks'])
+        self._wait_until(start, recording['latency_ms'])
+        if recording.get('error'):
+            raise ReplayedError(recording['error'])
+        return AIMessage(content=recording['content'], usage_metadata=recording.get('usage_metadata'),
+                         response_metadata=recording.get('response_metadata') or {})
+
+    def stream(self, messages, **kwargs):
+        start = time.perf_counter()
+        recording = self.archive.lookup(request_payload(messages, kwargs))
+        chunks = recording.get('chunks')
+        if chunks is None:
+            chunks = [[recording['latency_ms'], recording.get('content', '')]]
+        for offset_ms, text in chunks:
+            self._wait_until(start, offset_ms)
+            yield AIMessageChunk(content=text)
+        if recording.get('error'):
+            self._wait_until(start, recording['latency_ms'])
+            raise ReplayedError(recording['error'])
+        if recording.get('usage_metadata') or recording.get('response_metadata'):
+            yield AIMessageChunk(content='', usage_metadata=recording.get('usage_metadata'),
+                                 response_metadata=recording.get('response_metadata') or {})
+
+
+class LLMTransport:
+    """
+    Process-wide transport mode applied by the backend registry
+
+    'live' calls the providers, 'record' calls them and archives every call,
+    'replay' serves archived responses without any provider or API key.
+    """
+
+    def __init__(self, mode: str = LLM_TRANSPORT, path: str = LLM_ARCHIVE_FILE,
+                 latency_scale: float = REPLAY_LATENCY_SCALE):
+        self.generation = 0  # Bumped by every configure(); backend registries built earlier are stale
+        self.archive = None
+        self.configure(mode, path, latency_scale)
+
+    def configure(self, mode: str, path: str = LLM_ARCHIVE_FILE,
+                  latency_scale: float = REPLAY_LATENCY_SCALE):
+        """
+        Set the mode
+
+        Systems built afterwards get backends for the new mode; systems that
+        already exist keep the backends they were built with.
+        """
+        if mode not in TRANSPORT_MODES:
+            raise ValueError(f"LLM transport must be one of {TRANSPORT_MODES}, got {mode!r}")
+        self.flush()  # Calls recorded under the previous configuration
+        self.generation += 1
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.archive = LLMArchive(path) if mode != 'live' else None
+
+    def wrap(self, name: str, client):
+        """The client a backend should use under the current mode"""
+        if self.mode == 'record':
+            return RecordingClient(client, self.archive, name)
+        return client
+
+    def replay_client(self) -> ReplayClient:
+        return ReplayClient(self.archive, self.latency_scale)
+
+    def flush(self):
+        if self.archive is not None:
+            self.archive.flush()
+
+
+# Process-wide transport shared by every backend registry
+llm_transport = LLMTransport()
+atexit.register(llm_transport.flush)
+
+
+def main():
+    """Summarize a recorded archive"""
+    parser = argparse.ArgumentParser(description='Summarize a recorded LLM archive')
+    parser.add_argument('--archive', type=str, default=LLM_ARCHIVE_FILE, help='Archive file')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.archive):
+        print(f"✗ No archive at {args.archive}")
+        return
+    summary = LLMArchive(args.archive).summary()
+    print("\n" + "=" * 80)
+    print(f"LLM ARCHIVE: {args.archive}")
+    print("=" * 80)
+    print(f"Calls:             {summary['calls']}")
+    print(f"Distinct requests: {summary['distinct_requests']}")
+    print(f"Size:              {summary['file_bytes'] / 1024:.1f} KB")
+    for backend, stats in sorted(summary['backends'].items()):
+        print(f"  {backend:<20} {stats['calls']:>6} calls  p50 {stats['p50_latency_ms']:>8.0f} ms  "
+              f"p95 {stats['p95_latency_ms']:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
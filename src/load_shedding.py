@@ -0,0 +1,128 @@
+"""
+Load shedding and graceful degradation
+Picks the API's service tier from queue depth, backend error rate and latency
+SLO breaches, so the service keeps answering under bursts and outages
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from config import (
+    LOAD_LATENCY_SLO_MS, LOAD_WINDOW, LOAD_SLO_BREACH_RATE, LOAD_QUEUE_FILL, LOAD_ERROR_RATE,
+    LOAD_TIER_HOLD, LOAD_PROBE_INTERVAL
+)
+
+# Service tiers, best first. Every tier answers from the response cache and
+# the local engines when it can; for other problems:
+# - full: the normal solve
+# - short: a near-duplicate from the cache, else an answer-only LLM call
+# - local: a near-duplicate from the cache, else an answer with no LLM call
+TIERS = ('full', 'short', 'local')
+
+
+class LoadMonitor:
+    """
+    Overload detection for the API solve path
+
+    Three signals are watched: the interactive queue's fill, the EWMA error
+    rate of the healthiest LLM backend, and the share of recent interactive
+    solves over the latency SLO. The tier is the worst one any signal calls
+    for, and a raised tier is held for ``hold`` seconds before it steps down.
+    While the backends are failing, one solve every ``probe_interval`` seconds
+    runs at the short tier to find out whether they have recovered.
+    """
+
+    def __init__(self, scheduler, backends, slo_ms: float = LOAD_LATENCY_SLO_MS,
+                 window: int = LOAD_WINDOW, hold: float = LOAD_TIER_HOLD,
+                 probe_interval: float = LOAD_PROBE_INTERVAL):
+        self.scheduler = scheduler
+        self.backends = backends
+        self.slo_ms = slo_ms
+        self.hold = hold
+        self.probe_interval = probe_interval
+        self._breaches = deque(maxlen=window)
+        self._tier = 'full'
+        self._raised_at = 0.0
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+        self.tiers = {tier: 0 for tier in TIERS}
+        self.degraded = {}
+        self.shed = 0
+        scheduler.add_listener(self._on_job)
+
+    def _on_job(self, job):
+        if job.priority == 'interactive' and job.queue_wait_ms is not None:
+            with self._lock:
+                self._breaches.append(job.queue_wait_ms + job.solve_ms > self.slo_ms)
+
+    def signals(self) -> Dict[str, float]:
+        """Current queue fill, best backend error rate and SLO breach rate"""
+        rates = [backend.stats.ewma_error_rate for backend in self.backends.backends.values()
+                 if backend.stats.calls]
+        with self._lock:
+            breaches = sum(self._breaches) / len(self._breaches) if self._breaches else 0.0
+        return {
+            'queue_fill': self.scheduler.queue_fill('interactive'),
+            'error_rate': min(rates) if rates else 0.0,
+            'slo_breach_rate': breaches
+        }
+
+    @staticmethod
+    def _level(signals: Dict[str, float]) -> int:
+        """
+        Index into TIERS of the worst tier the signals call for
+
+        Queue depth and slow solves only call for the short tier: the backends
+        still answer, just not in time. Answers with no LLM call are kept for
+        backends that are failing.
+        """
+        if signals['error_rate'] >= LOAD_ERROR_RATE['local']:
+            return 2
+        if (signals['error_rate'] >= LOAD_ERROR_RATE['short'] or signals['queue_fill'] >= LOAD_QUEUE_FILL
+                or signals['slo_breach_rate'] >= LOAD_SLO_BREACH_RATE):
+            return 1
+        return 0
+
+    def tier(self) -> str:
+        """Tier for the next solve"""
+        signals = self.signals()
+        level = self._level(signals)
+        now = time.monotonic()
+        with self._lock:
+            current = TIERS.index(self._tier)
+            if level >= current:
+                self._tier, self._raised_at = TIERS[level], now
+            elif now - self._raised_at >= self.hold:
+                self._tier = TIERS[level]
+            tier = self._tier
+            if (tier == 'local' and signals['error_rate'] >= LOAD_ERROR_RATE['local']
+                    and now - self._last_probe >= self.probe_interval):
+                tier, self._last_probe = 'short', now  # Probe the backends
+            self.tiers[tier] += 1
+        return tier
+
+    def record_degraded(self, kind: str):
+        """Count an answer served below full quality ('near_duplicate', 'short' or 'fallback')"""
+        with self._lock:
+            self.degraded[kind] = self.degraded.get(kind, 0) + 1
+
+    def record_shed(self):
+        """Count a request turned away because no tier could answer it"""
+        with self._lock:
+            self.shed += 1
+
+    def snapshot(self) -> Dict:
+        signals = self.signals()
+        with self._lock:
+            solves = sum(self.tiers.values())
+            degraded = sum(self.degraded.values())
+            return {
+                'tier': self._tier,
+                'signals': signals,
+                'tiers': dict(self.tiers),
+                'degraded': dict(self.degraded),
+                'degraded_rate': degraded / solves if solves else 0.0,
+                'shed': self.shed
+            }
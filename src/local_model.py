@@ -0,0 +1,460 @@
+"""
+CPU-local quantized model backend
+Runs a small GGUF model in-process with llama.cpp. Concurrent requests share
+each decode step (continuous batching): new requests join the running batch
+between steps instead of waiting for it to drain.
+"""
+
+import codecs
+import collections
+import ctypes
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from config import (
+    DEFAULT_MAX_TOKENS, TEMPERATURE, LOCAL_MODEL_THREADS, LOCAL_MODEL_CONTEXT,
+    LOCAL_MODEL_MAX_BATCH, LOCAL_MODEL_PREFILL_CHUNK
+)
+
+try:
+    import llama_cpp
+except ImportError:  # llama-cpp-python is optional; only the in-process backend needs it
+    llama_cpp = None
+
+try:
+    from jinja2.sandbox import ImmutableSandboxedEnvironment
+except ImportError:  # jinja2 is optional; without it the ChatML template is used
+    ImmutableSandboxedEnvironment = None
+
+_ROLES = {'system': 'system', 'human': 'user', 'ai': 'assistant'}
+
+
+def _role(message) -> str:
+    return _ROLES.get(getattr(message, 'type', ''), 'user')
+
+
+def chatml_prompt(messages: Sequence) -> str:
+    """ChatML rendering, used when the model ships no chat template"""
+    turns = ''.join(f"<|im_start|>{_role(message)}\n{message.content}<|im_end|>\n"
+                    for message in messages)
+    return turns + "<|im_start|>assistant\n"
+
+
+class _Request:
+    """One generation in the batcher"""
+
+    __slots__ = ('prompt', 'max_tokens', 'stop', 'temperature', 'seq_id', 'offset', 'last_token',
+                 'generated', 'text', 'emitted', 'decoder', 'finish_reason', 'error', 'cancelled', 'done',
+                 'chunks', 'enqueued_at', 'first_token_at')
+
+    def __init__(self, prompt: List[int], max_tokens: int, stop: List[str], temperature: float,
+                 stream: bool):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.stop = stop
+        self.temperature = temperature
+        self.seq_id = None
+        self.offset = 0  # Tokens of this sequence already in the KV cache
+        self.last_token = None
+        self.generated = 0
+        self.text = ''
+        self.emitted = 0  # Characters of text already streamed
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.finish_reason = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.chunks = queue.Queue() if stream else None
+        self.enqueued_at = time.perf_counter()
+        self.first_token_at = None
+
+    @property
+    def reserved(self) -> int:
+        """KV cells this request may need"""
+        return len(self.prompt) + self.max_tokens
+
+
+class ContinuousBatcher:
+    """
+    Iteration-level scheduler over a batched-decode model
+
+    A single background thread owns the model. Each step it admits waiting
+    requests into free sequence slots (while their KV reservation fits the
+    context), feeds every running sequence's next token plus a bounded chunk of
+    pending prompt tokens to one ``decode`` call, and samples one token for
+    each sequence whose prompt is fully processed. Finished sequences free
+    their slot for the next waiting request straight away.
+
+    The model needs ``n_ctx``, ``tokenize(text)``, ``token_bytes(token)``,
+    ``is_eog(token)``, ``decode(entries)`` taking ``(seq_id, tokens, start_pos)``
+    tuples and returning one logits row per entry, and ``release(seq_id)``.
+    """
+
+    def __init__(self, model, max_batch: int = LOCAL_MODEL_MAX_BATCH,
+                 prefill_chunk: int = LOCAL_MODEL_PREFILL_CHUNK, seed: Optional[int] = None):
+        self.model = model
+        self.max_batch = max_batch
+        self.prefill_chunk = prefill_chunk
+        self._rng = np.random.default_rng(seed)
+        self._waiting = collections.deque()
+        self._active = []
+        self._free_slots = list(range(max_batch - 1, -1, -1))
+        self._reserved = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.steps = 0
+        self.sequences_stepped = 0
+        self.tokens_generated = 0
+        self.requests = 0
+        self.queue_wait_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name='local-model', daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: List[int], max_tokens: int, stop: Optional[List[str]] = None,
+               temperature: float = 0.0, stream: bool = False) -> _Request:
+        """Queue a generation; wait on ``request.done`` (or read ``request.chunks``)"""
+        request = _Request(prompt, max_tokens, list(stop or []), temperature, stream)
+        if request.reserved > self.model.n_ctx:
+            raise ValueError(f"Prompt of {len(prompt)} tokens plus {max_tokens} completion tokens "
+                             f"exceeds the local model context ({self.model.n_ctx})")
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Local model is shut down")
+            self._waiting.append(request)
+            self.requests += 1
+            self._cond.notify()
+        return request
+
+    def cancel(self, request: _Request):
+        """Stop a generation at the next step (e.g. a closed stream)"""
+        request.cancelled = True
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _admit(self):
+        while (self._waiting and self._free_slots
+               and self._reserved + self._waiting[0].reserved <= self.model.n_ctx):
+            request = self._waiting.popleft()
+            request.seq_id = self._free_slots.pop()
+            self._reserved += request.reserved
+            self.queue_wait_ms += (time.perf_counter() - request.enqueued_at) * 1000
+            self._active.append(request)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._admit()
+                while not self._active and not self._stopped:
+                    self._cond.wait()
+                    self._admit()
+                if self._stopped:
+                    for request in self._active + list(self._waiting):
+                        self._finish(request, 'cancelled', RuntimeError("Local model is shut down"))
+                    return
+            self._step()
+
+    def _step(self):
+        entries, sampling = [], []
+        prefill_budget = self.prefill_chunk
+        for request in list(self._active):
+            if request.cancelled:
+                self._finish(request, 'cancelled')
+            elif request.offset < len(request.prompt):
+                if prefill_budget <= 0:
+                    continue  # Prompt resumes next step; running sequences keep decoding
+                chunk = request.prompt[request.offset:request.offset + prefill_budget]
+                prefill_budget -= len(chunk)
+                entries.append((request.seq_id, chunk, request.offset))
+                request.offset += len(chunk)
+                sampling.append(request if request.offset == len(request.prompt) else None)
+            else:
+                entries.append((request.seq_id, [request.last_token], request.offset))
+                request.offset += 1
+                sampling.append(request)
+        if not entries:
+            return
+
+        try:
+            logits = self.model.decode(entries)
+        except Exception as e:
+            for request in list(self._active):
+                self._finish(request, 'error', e)
+            return
+
+        self.steps += 1
+        self.sequences_stepped += len(entries)
+        for request, row in zip(sampling, logits):
+            if request is not None:
+                self._advance(request, self._sample(row, request.temperature))
+
+    def _sample(self, logits: np.ndarray, temperature: float) -> int:
+        if temperature <= 0:
+            return int(np.argmax(logits))
+        scaled = (logits - logits.max()) / temperature
+        probs = np.exp(scaled)
+        probs /= probs.sum()
+        return int(self._rng.choice(len(probs), p=probs))
+
+    def _advance(self, request: _Request, token: int):
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        if self.model.is_eog(token):
+            self._finish(request, 'stop')
+            return
+        request.last_token = token
+        request.generated += 1
+        self.tokens_generated += 1
+        delta = request.decoder.decode(self.model.token_bytes(token))
+        if delta:
+            start = max(0, len(request.text) - max((len(stop) for stop in request.stop), default=0))
+            request.text += delta
+            for stop in request.stop:
+                index = request.text.find(stop, start)
+                if index != -1:
+                    request.text = request.text[:index]
+                    self._finish(request, 'stop')
+                    return
+            self._emit(request)
+        if request.generated >= request.max_tokens:
+            self._finish(request, 'length')
+
+    def _emit(self, request: _Request, final: bool = False):
+        """Stream new text, holding back a tail that could still grow into a stop string"""
+        if request.chunks is None:
+            return
+        end = len(request.text)
+        if not final:
+            for stop in request.stop:
+                for size in range(min(len(stop) - 1, end - request.emitted), 0, -1):
+                    if request.text.endswith(stop[:size]):
+                        end = min(end, len(request.text) - size)
+                        break
+        if end > request.emitted:
+            request.chunks.put(request.text[request.emitted:end])
+            request.emitted = end
+
+    def _finish(self, request: _Request, reason: str, error: Optional[Exception] = None):
+        request.finish_reason = reason
+        request.error = error
+        if request in self._active:
+            self._active.remove(request)
+            self._reserved -= request.reserved
+            try:
+                self.model.release(request.seq_id)
+            finally:
+                self._free_slots.append(request.seq_id)
+        if request.chunks is not None:
+            self._emit(request, final=True)
+            request.chunks.put(None)
+        request.done.set()
+
+    def snapshot(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'running': len(self._active),
+            'waiting': len(self._waiting),
+            'steps': self.steps,
+            'mean_batch_size': self.sequences_stepped / self.steps if self.steps else 0.0,
+            'tokens_generated': self.tokens_generated,
+            'mean_queue_wait_ms': self.queue_wait_ms / self.requests if self.requests else 0.0
+        }
+
+
+def _llama_fn(*names):
+    """First of several llama.cpp C functions that exists (names changed between releases)"""
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return fn
+    raise AttributeError(f"llama_cpp provides none of {names}")
+
+
+class LlamaCppModel:
+    """GGUF model on llama.cpp's C API with one KV-cache sequence per batch slot"""
+
+    def __init__(self, model_path: str, n_ctx: int = LOCAL_MODEL_CONTEXT,
+                 max_batch: int = LOCAL_MODEL_MAX_BATCH, n_threads: int = LOCAL_MODEL_THREADS,
+                 prefill_chunk: int = LOCAL_MODEL_PREFILL_CHUNK):
+        if llama_cpp is None:
+            raise ImportError("The in-process local model needs llama-cpp-python "
+                              "(pip install -r requirements-local.txt)")
+        llama_cpp.llama_backend_init()
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.n_gpu_layers = 0
+        self._model = _llama_fn('llama_model_load_from_file', 'llama_load_model_from_file')(
+            model_path.encode('utf-8'), model_params)
+        if not self._model:
+            raise ValueError(f"Could not load GGUF model from {model_path}")
+
+        n_batch = prefill_chunk + max_batch  # Largest decode call: one chunk plus one token per slot
+        context_params = llama_cpp.llama_context_default_params()
+        context_params.n_ctx = n_ctx
+        context_params.n_batch = n_batch
+        context_params.n_ubatch = n_batch
+        context_params.n_seq_max = max_batch
+        context_params.n_threads = n_threads
+        context_params.n_threads_batch = n_threads
+        self._ctx = _llama_fn('llama_init_from_model', 'llama_new_context_with_model')(
+            self._model, context_params)
+        if not self._ctx:
+            raise ValueError("Could not create a llama.cpp context")
+        self.n_ctx = llama_cpp.llama_n_ctx(self._ctx)
+
+        get_vocab = getattr(llama_cpp, 'llama_model_get_vocab', None)
+        self._vocab = get_vocab(self._model) if get_vocab is not None else self._model
+        self.n_vocab = _llama_fn('llama_vocab_n_tokens', 'llama_n_vocab')(self._vocab)
+        self._is_eog = _llama_fn('llama_vocab_is_eog', 'llama_token_is_eog')
+        self._batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+        self._piece_cache = {}
+        self._template = self._chat_template()
+
+        memory = getattr(llama_cpp, 'llama_get_memory', None)
+        if memory is not None:
+            seq_rm, target = llama_cpp.llama_memory_seq_rm, memory(self._ctx)
+        else:
+            seq_rm, target = _llama_fn('llama_kv_self_seq_rm', 'llama_kv_cache_seq_rm'), self._ctx
+        self._seq_rm = lambda seq_id: seq_rm(target, seq_id, -1, -1)
+
+    def _chat_template(self):
+        get_template = getattr(llama_cpp, 'llama_model_chat_template', None)
+        source = get_template(self._model, None) if get_template is not None else None
+        if not source or ImmutableSandboxedEnvironment is None:
+            return None
+        env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+        return env.from_string(source.decode('utf-8'))
+
+    def format_chat(self, messages: Sequence) -> str:
+        if self._template is None:
+            return chatml_prompt(messages)
+        return self._template.render(
+            messages=[{'role': _role(message), 'content': message.content} for message in messages],
+            add_generation_prompt=True, bos_token='', eos_token=''
+        )
+
+    def tokenize(self, text: str) -> List[int]:
+        data = text.encode('utf-8')
+        size = len(data) + 8
+        tokens = (llama_cpp.llama_token * size)()
+        count = llama_cpp.llama_tokenize(self._vocab, data, len(data), tokens, size, True, True)
+        if count < 0:
+            raise ValueError("Prompt could not be tokenized")
+        return list(tokens[:count])
+
+    def token_bytes(self, token: int) -> bytes:
+        piece = self._piece_cache.get(token)
+        if piece is None:
+            buffer = ctypes.create_string_buffer(64)
+            length = llama_cpp.llama_token_to_piece(self._vocab, token, buffer, len(buffer), 0, False)
+            piece = self._piece_cache[token] = buffer.raw[:max(length, 0)]
+        return piece
+
+    def is_eog(self, token: int) -> bool:
+        return bool(self._is_eog(self._vocab, token))
+
+    def decode(self, entries) -> np.ndarray:
+        batch = self._batch
+        index, logit_rows = 0, []
+        for seq_id, tokens, start in entries:
+            for position, token in enumerate(tokens, start):
+                batch.token[index] = token
+                batch.pos[index] = position
+                batch.n_seq_id[index] = 1
+                batch.seq_id[index][0] = seq_id
+                batch.logits[index] = False
+                index += 1
+            batch.logits[index - 1] = True
+            logit_rows.append(index - 1)
+        batch.n_tokens = index
+        status = llama_cpp.llama_decode(self._ctx, batch)
+        if status != 0:
+            raise RuntimeError(f"llama_decode failed with status {status}")
+        return np.stack([
+            np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self._ctx, row), shape=(self.n_vocab,))
+            for row in logit_rows
+        ])
+
+    def release(self, seq_id: int):
+        self._seq_rm(seq_id)
+
+
+class LocalChatModel:
+    """
+    LangChain-style chat client (``invoke``/``stream``) over a ContinuousBatcher
+
+    ``response_format`` is not enforced locally; structured-output callers fall
+    back to regex parsing and the repair call.
+    """
+
+    def __init__(self, model, model_name: str, max_batch: int = LOCAL_MODEL_MAX_BATCH,
+                 prefill_chunk: int = LOCAL_MODEL_PREFILL_CHUNK, temperature: float = TEMPERATURE):
+        self.model = model
+        self.model_name = model_name
+        self.temperature = temperature
+        self.batcher = ContinuousBatcher(model, max_batch, prefill_chunk)
+
+    def _submit(self, messages, max_tokens: Optional[int], stop: Optional[List[str]], stream: bool):
+        prompt = self.model.tokenize(self.model.format_chat(messages))
+        return self.batcher.submit(prompt, max_tokens or DEFAULT_MAX_TOKENS, stop,
+                                   self.temperature, stream)
+
+    def _metadata(self, request: _Request) -> Dict:
+        return {'model_name': self.model_name, 'finish_reason': request.finish_reason}
+
+    def _usage(self, request: _Request) -> Dict:
+        return {'input_tokens': len(request.prompt), 'output_tokens': request.generated,
+                'total_tokens': len(request.prompt) + request.generated}
+
+    def invoke(self, messages, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+               **kwargs) -> AIMessage:
+        request = self._submit(messages, max_tokens, stop, stream=False)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return AIMessage(content=request.text, usage_metadata=self._usage(request),
+                         response_metadata=self._metadata(request))
+
+    def stream(self, messages, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+               **kwargs):
+        request = self._submit(messages, max_tokens, stop, stream=True)
+        try:
+            while True:
+                delta = request.chunks.get()
+                if delta is None:
+                    break
+                yield AIMessageChunk(content=delta)
+            if request.error is not None:
+                raise request.error
+            yield AIMessageChunk(content='', usage_metadata=self._usage(request),
+                                 response_metadata=self._metadata(request))
+        finally:
+            if not request.done.is_set():
+                self.batcher.cancel(request)  # Caller closed the stream early
+
+    def snapshot(self) -> Dict:
+        return self.batcher.snapshot()
+
+
+def create_local_client(spec: Dict) -> LocalChatModel:
+    """In-process client for an LLM_BACKENDS entry with ``"type": "llama_cpp"``"""
+    model = LlamaCppModel(
+        spec['model_path'],
+        n_ctx=spec.get('n_ctx', LOCAL_MODEL_CONTEXT),
+        max_batch=spec.get('max_batch', LOCAL_MODEL_MAX_BATCH),
+        n_threads=spec.get('n_threads', LOCAL_MODEL_THREADS),
+        prefill_chunk=spec.get('prefill_chunk', LOCAL_MODEL_PREFILL_CHUNK)
+    )
+    return LocalChatModel(
+        model, spec.get('model', 'local-gguf'),
+        max_batch=spec.get('max_batch', LOCAL_MODEL_MAX_BATCH),
+        prefill_chunk=spec.get('prefill_chunk', LOCAL_MODEL_PREFILL_CHUNK),
+        temperature=spec.get('temperature', TEMPERATURE)
+    )
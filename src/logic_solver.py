@@ -0,0 +1,484 @@
+"""
+Logic solver
+Truth-table engine for "Logical traps" puzzles built from statements whose
+truth is constrained: knights and knaves (truth-tellers and liars), and boxes
+bearing statements about where an item is hidden
+"""
+
+import argparse
+import itertools
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from config import LOGIC_MAX_VARIABLES, TRAIN_FILE
+from engines import EngineOutcome, choose_option, engine_report, print_engine_report, rows_from_csv
+from option_filter import normalize_option
+
+CATEGORY = "Logical traps"
+
+EXTRACTION_PROMPT = """Translate this puzzle into a model for an exact logic solver. Do not solve it.
+
+Problem: {problem}
+
+Reply with only one JSON object:
+{{"people": ["<each person who always tells the truth or always lies>"],
+"places": ["<each place a single hidden item may be in, e.g. Box A>"],
+"statements": [{{"by": "<speaking person, or null for a written statement>", "claim": <claim>}}],
+"true_statements": {{"op": "exactly" | "at_least" | "at_most", "n": <number>}} or null,
+"ask": "types" | "truthful" | "liars" | "count_truthful" | "count_liars" | "place"}}
+A <claim> is one of: {{"truthful": "<person>"}}, {{"liar": "<person>"}}, {{"at": "<place>"}},
+{{"not": <claim>}}, {{"and": [<claim>, ...]}}, {{"or": [<claim>, ...]}}, {{"same": ["<person>", "<person>"]}},
+{{"count_liars": {{"op": ..., "n": ...}}}}, {{"count_truthful": {{"op": ..., "n": ...}}}}.
+Reply {{"people": []}} if the puzzle has any rule these claims cannot express."""
+
+ASKS = ('types', 'truthful', 'liars', 'count_truthful', 'count_liars', 'place')
+
+_COUNTS = {'none': 0, 'no': 0, 'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6}
+_COUNT = r'(\d+|none|no|zero|one|two|three|four|five|six)'
+_TRUTHFUL = r'(?:knights?|truth-?\s?tellers?|honest)'
+_LIAR = r'(?:knaves?|liars?)'
+_TYPE = rf'(?:a\s+)?({_TRUTHFUL}|{_LIAR})'
+_NAME = r'([A-Z][a-z]*)'
+
+_PUZZLE = re.compile(rf'\b({_TRUTHFUL}|{_LIAR}|always (?:lies|tells the truth))\b', re.IGNORECASE)
+_QUOTED = r'[\'"‘“](.+?)[\'"’”](?=[\s.,;:!?]|$)'
+_SPEECH = re.compile(
+    rf'\b{_NAME}\s+(?:says|said|claims|claimed|states|stated|tells you|replies|answers|declares)'
+    rf'(?:\s+to you)?,?\s*:?\s*{_QUOTED}'
+)
+_WRITTEN = re.compile(
+    rf'\bBox ([A-Z])(?:\s+has a statement(?: written on it)?(?: reading| that reads| saying)?|\s*:|\s+says)'
+    rf'\s*{_QUOTED}'
+)
+_BOX = re.compile(r'\bBox(?:es)? ([A-Z])\b')
+_ITEM = r'(?:the )?(?:gold|treasure|prize|money|key)(?: coin| bar| bars)?'
+
+_I_TYPE = re.compile(rf'^i am {_TYPE}$|^i always (lie|tell the truth)$|^i am (lying|telling the truth)$')
+_NAME_TYPE = re.compile(
+    rf'^{_NAME} (?:is|am) {_TYPE}$|^{_NAME} always (lies|tells the truth)$|^{_NAME} (?:is|am) (lying|telling the truth)$',
+    re.IGNORECASE
+)
+_SAME = re.compile(rf'^{_NAME} and {_NAME} are (?:of )?(?:the )?(same|different)(?: types?| kinds?)?$',
+                   re.IGNORECASE)
+_BOTH = re.compile(rf'^{_NAME} and {_NAME} are both {_TYPE}$', re.IGNORECASE)
+_QUANTIFIED = re.compile(
+    rf'^(at least |exactly |at most |only )?{_COUNT} of us (?:is|are) {_TYPE}'
+    rf'(?: and the other {_COUNT} (?:is|are) {_TYPE})?$'
+)
+_ALL = re.compile(rf'^all(?: {_COUNT})? of us are {_TYPE}$|^we are all {_TYPE}$')
+_IN_BOX = re.compile(rf'^{_ITEM} is (not )?in (this box|box [a-z])$')
+_EMPTY = re.compile(r'^this box is (not )?empty$')
+_AGREE = re.compile(r"^(?:that's|that is) (true|false|right|a lie),?\s*(.*)$")
+
+_TRUE_COUNT = re.compile(
+    r'\b(only one|exactly one|one) (?:of (?:these|the) )?statements? (?:is|are) true'
+    r'|\bone statement is true and the other is false'
+    r'|\b(at least one) (?:of (?:these|the) )?statements? (?:is|are) true'
+    r'|\b(all|both) (?:of (?:these|the) )?statements are (true|false)',
+    re.IGNORECASE
+)
+_UNDETERMINED = re.compile(r'cannot be determined|can\'t be determined|not enough information|'
+                           r'impossible to (?:tell|determine|know)|undetermined|indeterminable')
+_NOBODY = re.compile(r'^(?:none(?: of them)?|no ?one|nobody)\b')
+_EVERYBODY = re.compile(r'^(?:all(?: of them| three| four)?|everyone|everybody)\b')
+
+
+def _count(text: str) -> int:
+    return int(text) if text.isdigit() else _COUNTS[text.lower()]
+
+
+def _is_truthful(word: str) -> bool:
+    return re.fullmatch(_LIAR, word, re.IGNORECASE) is None and word.lower() not in ('lies', 'lying', 'lie')
+
+
+def _count_claim(kind: str, op: str, n: int) -> Dict:
+    return {kind: {'op': op, 'n': n}}
+
+
+def parse_claim(text: str, speaker: Optional[str], previous: Optional[Dict]) -> Optional[Dict]:
+    """
+    Claim (in the extraction JSON form) of a quoted statement, or None
+
+    ``speaker`` resolves "I" and "this box"; ``previous`` is the statement
+    before it, for "That's true, ...".
+    """
+    text = text.strip().rstrip('.!').strip()
+    lowered = text.lower()
+    agree = _AGREE.match(lowered)
+    if agree:
+        if previous is None:
+            return None
+        echoed = previous if agree.group(1) in ('true', 'right') else {'not': previous}
+        if not agree.group(2):
+            return echoed
+        rest = parse_claim(text[len(text) - len(agree.group(2)):], speaker, None)
+        return None if rest is None else {'and': [echoed, rest]}
+
+    match = _I_TYPE.match(lowered)
+    if match and speaker:
+        word = match.group(1) or match.group(2) or match.group(3)
+        truthful = word in ('tell the truth', 'telling the truth') or (
+            word not in ('lie', 'lying') and _is_truthful(word))
+        return {'truthful' if truthful else 'liar': speaker}
+    if speaker:
+        text = re.sub(r'\b(?:I|me)\b', speaker, text)  # "Bob and I are both knaves"
+    match = _NAME_TYPE.match(text)
+    if match:
+        name = match.group(1) or match.group(3) or match.group(5)
+        word = match.group(2) or match.group(4) or match.group(6)
+        truthful = word.lower() in ('tells the truth', 'telling the truth') or (
+            word.lower() not in ('lies', 'lying') and _is_truthful(word))
+        return {'truthful' if truthful else 'liar': name}
+    match = _SAME.match(text)
+    if match:
+        same = {'same': [match.group(1), match.group(2)]}
+        return same if match.group(3).lower() == 'same' else {'not': same}
+    match = _BOTH.match(text)
+    if match:
+        key = 'truthful' if _is_truthful(match.group(3)) else 'liar'
+        return {'and': [{key: match.group(1)}, {key: match.group(2)}]}
+    match = _QUANTIFIED.match(lowered)
+    if match:
+        op = {'at least ': 'at_least', 'at most ': 'at_most'}.get(match.group(1) or '', 'exactly')
+        kind = 'count_truthful' if _is_truthful(match.group(3)) else 'count_liars'
+        return _count_claim(kind, op, _count(match.group(2)))
+    match = _ALL.match(lowered)
+    if match:
+        word = match.group(2) or match.group(3)
+        return {'all': 'truthful' if _is_truthful(word) else 'liar'}
+    match = _IN_BOX.match(lowered)
+    if match:
+        place = speaker if match.group(2) == 'this box' else match.group(2)[-1].upper()
+        if place is None:
+            return None
+        at = {'at': place}
+        return {'not': at} if match.group(1) else at
+    match = _EMPTY.match(lowered)
+    if match and speaker:
+        at = {'at': speaker}
+        return at if match.group(1) else {'not': at}
+
+    # "X and Y" / "X or Y" of claims that parse on their own
+    for joiner, key in ((' and ', 'and'), (' or ', 'or')):
+        if joiner in lowered:
+            parts = [parse_claim(part, speaker, None)
+                     for part in re.split(joiner, text, flags=re.IGNORECASE)]
+            if len(parts) > 1 and all(part is not None for part in parts):
+                return {key: parts}
+    return None
+
+
+def _named(claim) -> List[str]:
+    """People a claim refers to by name"""
+    if isinstance(claim, list):
+        return [name for part in claim for name in _named(part)]
+    (key, value), = claim.items()
+    if key in ('truthful', 'liar'):
+        return [value]
+    if key == 'same':
+        return list(value)
+    if key in ('not', 'and', 'or'):
+        return _named(value)
+    return []
+
+
+def _ask(problem: str) -> Optional[str]:
+    sentences = re.split(r'(?<=[.?!])\s+|(?<=[.?!][\'"’”])\s+', problem)
+    questions = [sentence for sentence in sentences if sentence.endswith('?')]
+    if not questions:
+        return None
+    question = questions[-1].lower()
+    if re.search(r'\bwhich box\b|\bwhere is\b', question):
+        return 'place'
+    if 'how many' in question:
+        if re.search(rf'{_LIAR}|lying|\blie\b', question):
+            return 'count_liars'
+        if re.search(rf'{_TRUTHFUL}|truth', question):
+            return 'count_truthful'
+        return None
+    if re.search(rf'\bwho is (?:a )?{_TRUTHFUL} and who is (?:a )?{_LIAR}|\bwhich (?:type|kind)|'
+                 rf'\bwhat (?:type|kind)|\bdetermine who', question):
+        return 'types'
+    if re.search(rf'\bwho (?:is|are)\b.*({_TRUTHFUL}|telling the truth)', question):
+        return 'truthful'
+    if re.search(rf'\bwho (?:is|are)\b.*({_LIAR}|lying)', question):
+        return 'liars'
+    return None
+
+
+@lru_cache(maxsize=1024)
+def extract_puzzle(problem: str) -> Optional['TruthPuzzle']:
+    """
+    Puzzle of a problem from its wording, or None
+
+    Every quoted statement must parse; anything else is left to the LLM.
+    """
+    ask = _ask(problem)
+    if ask is None:
+        return None
+
+    statements, previous = [], None
+    if ask == 'place':
+        places = sorted(set(_BOX.findall(problem)))
+        for box, text in _WRITTEN.findall(problem):
+            claim = parse_claim(text, box, previous)
+            if claim is None:
+                return None
+            statements.append({'by': None, 'claim': claim})
+            previous = claim
+        count = _TRUE_COUNT.search(problem)
+        if not statements or count is None:
+            return None
+        if count.group(1):
+            true_statements = {'op': 'exactly', 'n': 1}
+        elif count.group(2):
+            true_statements = {'op': 'at_least', 'n': 1}
+        else:
+            true_statements = {'op': 'exactly', 'n': len(statements) if count.group(4).lower() == 'true' else 0}
+        return model_from_extraction({'people': [], 'places': places, 'statements': statements,
+                                      'true_statements': true_statements, 'ask': ask})
+
+    if not _PUZZLE.search(problem):
+        return None
+    speeches = _SPEECH.findall(problem)
+    if not speeches:
+        return None
+    people = []
+    for speaker, text in speeches:
+        claim = parse_claim(text, speaker, previous)
+        if claim is None:
+            return None
+        statements.append({'by': speaker, 'claim': claim})
+        previous = claim
+        for person in [speaker] + _named(claim):
+            if person not in people:
+                people.append(person)
+    return model_from_extraction({'people': people, 'places': [], 'statements': statements,
+                                  'true_statements': None, 'ask': ask})
+
+
+def _holds(op: str, count: int, n: int) -> bool:
+    if op == 'at_least':
+        return count >= n
+    if op == 'at_most':
+        return count <= n
+    return count == n
+
+
+def _compile(claim, people: List[str], places: List[str]) -> Callable[[Dict, Optional[str]], bool]:
+    """
+    Evaluator of a JSON claim over (truthful-by-person, item place)
+
+    Raises:
+        ValueError: On a claim outside the grammar or about an unknown name
+    """
+    if not isinstance(claim, dict) or len(claim) != 1:
+        raise ValueError(f"Bad claim: {claim!r}")
+    (key, value), = claim.items()
+    if key in ('truthful', 'liar'):
+        if value not in people:
+            raise ValueError(f"Unknown person: {value!r}")
+        expected = key == 'truthful'
+        return lambda truthful, place: truthful[value] is expected
+    if key == 'at':
+        if value not in places:
+            raise ValueError(f"Unknown place: {value!r}")
+        return lambda truthful, place: place == value
+    if key == 'not':
+        inner = _compile(value, people, places)
+        return lambda truthful, place: not inner(truthful, place)
+    if key in ('and', 'or'):
+        parts = [_compile(part, people, places) for part in value]
+        combine = all if key == 'and' else any
+        return lambda truthful, place: combine(part(truthful, place) for part in parts)
+    if key == 'same':
+        a, b = value
+        if a not in people or b not in people:
+            raise ValueError(f"Unknown person in {value!r}")
+        return lambda truthful, place: truthful[a] == truthful[b]
+    if key == 'all':
+        expected = value == 'truthful'
+        return lambda truthful, place: all(truthful[person] is expected for person in people)
+    if key in ('count_truthful', 'count_liars'):
+        op, n = value['op'], int(value['n'])
+        expected = key == 'count_truthful'
+        return lambda truthful, place: _holds(op, sum(truthful[p] is expected for p in people), n)
+    raise ValueError(f"Unknown claim: {key!r}")
+
+
+class TruthPuzzle:
+    """
+    People who always tell the truth or always lie, optionally an item hidden
+    in one of several places, and statements constraining both
+
+    A spoken statement is true exactly when its speaker is truthful; written
+    statements are only bound by ``true_statements``. Solved by enumerating the
+    whole truth table.
+    """
+
+    def __init__(self, people: List[str], places: List[str],
+                 statements: List[Tuple[Optional[str], Callable]],
+                 true_statements: Optional[Tuple[str, int]], ask: str):
+        self.people = people
+        self.places = places
+        self.statements = statements
+        self.true_statements = true_statements
+        self.ask = ask
+
+    def solutions(self) -> List[Tuple[Dict[str, bool], Optional[str]]]:
+        """Every (truthful-by-person, place) consistent with all statements"""
+        found = []
+        for values in itertools.product((True, False), repeat=len(self.people)):
+            truthful = dict(zip(self.people, values))
+            for place in self.places or [None]:
+                truths = [claim(truthful, place) for _, claim in self.statements]
+                if any(speaker is not None and truthful[speaker] != true
+                       for (speaker, _), true in zip(self.statements, truths)):
+                    continue
+                if self.true_statements is not None and not _holds(*self.true_statements, sum(truths)):
+                    continue
+                found.append((truthful, place))
+        return found
+
+    def project(self, truthful: Dict[str, bool], place: Optional[str]):
+        """The part of a solution the question asks for"""
+        if self.ask == 'place':
+            return place
+        if self.ask == 'types':
+            return tuple(truthful[person] for person in self.people)
+        if self.ask in ('truthful', 'liars'):
+            expected = self.ask == 'truthful'
+            return frozenset(person for person in self.people if truthful[person] is expected)
+        expected = self.ask == 'count_truthful'
+        return sum(truthful[person] is expected for person in self.people)
+
+    def read_option(self, text: str):
+        """An option in the form of ``project``'s answer, or None if unreadable"""
+        normalized = normalize_option(text)
+        if self.ask == 'place':
+            named = set(_BOX.findall(text)) & set(self.places)
+            return named.pop() if len(named) == 1 and 'both' not in normalized else None
+        if self.ask in ('count_truthful', 'count_liars'):
+            match = re.fullmatch(rf'{_COUNT}(?: of them)?', normalized)
+            return _count(match.group(1)) if match else None
+
+        types = {}
+        for name, word in re.findall(rf'\b{_NAME} (?:is|are) {_TYPE}', text):
+            types[name] = _is_truthful(word)
+        for name, word in re.findall(rf'\b{_NAME} is (lying|telling the truth)', text):
+            types[name] = word == 'telling the truth'
+        if self.ask == 'types':
+            if set(types) != set(self.people):
+                return None
+            return tuple(types[person] for person in self.people)
+
+        if types:
+            expected = self.ask == 'truthful'
+            if set(types) != set(self.people) and any(value is not expected for value in types.values()):
+                return None
+            return frozenset(name for name, value in types.items() if value is expected)
+        if _NOBODY.match(normalized):
+            return frozenset()
+        if _EVERYBODY.match(normalized):
+            return frozenset(self.people)
+        named = {person for person in self.people if re.search(rf'\b{person}\b', text)}
+        words = set(re.findall(r'[a-z]+', normalized)) - {person.lower() for person in self.people}
+        if named and words <= {'and', 'both', 'only'}:
+            return frozenset(named)
+        return None
+
+    def describe(self, answer) -> str:
+        if self.ask == 'place':
+            return f"the item is in Box {answer}"
+        if self.ask == 'types':
+            return ', '.join(f"{person} is a {'knight' if truthful else 'knave'}"
+                             for person, truthful in zip(self.people, answer))
+        if self.ask in ('truthful', 'liars'):
+            who = ', '.join(sorted(answer)) or 'nobody'
+            return f"{'truthful' if self.ask == 'truthful' else 'lying'}: {who}"
+        return f"{answer} {'truthful' if self.ask == 'count_truthful' else 'lying'}"
+
+
+def model_from_extraction(data: Dict) -> Optional[TruthPuzzle]:
+    """Puzzle from the extraction JSON (see EXTRACTION_PROMPT), or None"""
+    try:
+        people = [str(person) for person in data.get('people') or []]
+        places = [str(place) for place in data.get('places') or []]
+        ask = data.get('ask')
+        if ask not in ASKS or not (people or places) or (ask == 'place') != bool(places):
+            return None
+        if len(people) + (1 if places else 0) > LOGIC_MAX_VARIABLES:
+            return None
+        statements = []
+        for statement in data.get('statements') or []:
+            speaker = statement.get('by')
+            if speaker is not None and speaker not in people:
+                return None
+            statements.append((speaker, _compile(statement['claim'], people, places)))
+        count = data.get('true_statements')
+        true_statements = (count['op'], int(count['n'])) if count else None
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if not statements:
+        return None
+    return TruthPuzzle(people, places, statements, true_statements, ask)
+
+
+class LogicEngine:
+    """Local engine for the logical traps category (see engines.py for the protocol)"""
+
+    name = 'logic'
+
+    def extract(self, problem: str) -> Optional[TruthPuzzle]:
+        return extract_puzzle(problem)
+
+    def extraction_messages(self, problem: str) -> List:
+        return [HumanMessage(content=EXTRACTION_PROMPT.format(problem=problem))]
+
+    def model_from_extraction(self, data: Dict) -> Optional[TruthPuzzle]:
+        return model_from_extraction(data)
+
+    def answer(self, puzzle: TruthPuzzle, options: Dict[str, str]) -> EngineOutcome:
+        solutions = puzzle.solutions()
+        if not solutions:
+            return EngineOutcome(None, 'unsolvable')  # Contradictory as read: let the LLM weigh the trap
+        answers = {puzzle.project(*solution) for solution in solutions}
+        enumerated = 2 ** len(puzzle.people) * max(len(puzzle.places), 1)
+
+        if len(answers) > 1:
+            number, reason = choose_option(options, lambda text: _UNDETERMINED.search(normalize_option(text))
+                                           is not None or (False if puzzle.read_option(text) is not None else None))
+            if reason != 'solved':
+                return EngineOutcome(None, 'ambiguous')
+            return EngineOutcome(number, reason, f"Truth table of {enumerated} cases: {len(solutions)} are "
+                                                 f"consistent and they disagree, so it cannot be determined.")
+
+        answer, = answers
+        number, reason = choose_option(
+            options, lambda text: False if _UNDETERMINED.search(normalize_option(text))
+            else _equal(puzzle.read_option(text), answer)
+        )
+        reasoning = (f"Truth table of {enumerated} cases: the only consistent reading "
+                     f"gives {puzzle.describe(answer)}.")
+        if reason == 'catch_all':
+            reasoning += " None of the listed options states it."
+        return EngineOutcome(number, reason, reasoning)
+
+
+def _equal(read, answer) -> Optional[bool]:
+    return None if read is None else read == answer
+
+
+def main():
+    """Offline report of rules extraction on a labelled CSV (no LLM calls)"""
+    parser = argparse.ArgumentParser(description='Report how often the logic solver answers locally')
+    parser.add_argument('--data', type=str, default=TRAIN_FILE, help='Labelled CSV file')
+    args = parser.parse_args()
+    print_engine_report(LogicEngine.name, engine_report(LogicEngine(), rows_from_csv(args.data, CATEGORY)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,51 @@ Main entry point for the ML Reasoning System
 Processes test data and generates predictions in JSON format
 """
 
+import csv
 import json
 import sys
 import argparse
-import pandas as pd
-from typing import List, Dict
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
+from typing import List, Dict, Optional
 from tqdm import tqdm
 
-from config import TRAIN_FILE, TEST_FILE, OUTPUT_FILE
+from config import (
+    TRAIN_FILE, TEST_FILE, OUTPUT_FILE, CSV_CHUNK_SIZE, MAX_WORKERS,
+    COMPRESS_DETAILED_OUTPUT, RAW_RESPONSE_MODE, COMPACT_REASONING,
+    STRUCTURED_OUTPUT, PACKED_SOLVES, REPLAY_LATENCY_SCALE, VERIFY_CONFIDENCE_THRESHOLD,
+    CLASSIFIER_COMPRESSION
+)
 from category_classifier import CategoryClassifier
+from data_loader import iter_problem_chunks, read_columns
+from llm_transport import llm_transport
+from load_shedding import LoadMonitor
+from profiler import SamplingProfiler
+from result_writer import ResultWriter
 from reasoning_agents import MultiAgentReasoningSystem
+from records import ReasoningResult
+from tracing import tracer
+from usage_ledger import UsageBudget, usage_ledger
+from verification import ResponseCache, VerificationQueue, cache_key
 
 
 class MLReasoningPipeline:
     """Complete ML reasoning pipeline"""
     
-    def __init__(self, train_model: bool = True):
+    def __init__(self, train_model: bool = True, compact: bool = COMPACT_REASONING,
+                 structured: bool = STRUCTURED_OUTPUT, verify: bool = False):
         """
         Initialize the pipeline
         
         Args:
             train_model: If True, train category classifier. If False, load existing model.
+            compact: If True, agents use the compact-reasoning prompt and budget
+            structured: If True, agents request JSON-schema output (answer first)
+            verify: If True, solved problems are cached and low-confidence answers
+                are re-checked in the background (for the API; see verification.py)
         """
         print("="*80)
         print("ML REASONING SYSTEM - INITIALIZATION")
@@ -33,131 +57,313 @@ class MLReasoningPipeline:
         self.category_classifier = CategoryClassifier()
         
         if train_model:
-            # Train on training data
-            train_df = pd.read_csv(TRAIN_FILE)
+            # Train on training data (only the columns the classifier needs)
+            train_df = read_columns(TRAIN_FILE, ['problem_statement', 'topic'])
             self.category_classifier.train(train_df)
+            if CLASSIFIER_COMPRESSION:
+                self.category_classifier.compress()
             self.category_classifier.save()
         else:
             # Load existing model
             self.category_classifier.load()
         
+        self.last_run_summary = None
+        
         # Initialize reasoning system
         print("\nInitializing reasoning agents...")
-        self.reasoning_system = MultiAgentReasoningSystem()
+        self.reasoning_system = MultiAgentReasoningSystem(compact=compact, structured=structured)
         print("✓ Reasoning agents ready")
         
+        self.response_cache = ResponseCache() if verify else None
+        self.verifier = VerificationQueue(self._verify, self.response_cache) if verify else None
+        self.load_monitor = None
+        
         print("\n" + "="*80)
         print("SYSTEM READY")
         print("="*80)
     
-    def process_problem(self, problem: str, options: Dict[str, str]) -> Dict:
+    def enable_load_shedding(self, scheduler) -> LoadMonitor:
+        """
+        Pick a service tier per solve from the scheduler's load (for the API; see load_shedding.py)
+        
+        Solves that would raise on an LLM failure return a degraded answer instead.
+        """
+        if self.response_cache is None:
+            self.response_cache = ResponseCache()
+        self.load_monitor = LoadMonitor(scheduler, self.reasoning_system.backends)
+        return self.load_monitor
+    
+    def _classify(self, problem: str):
+        """Stage 1: (category, confidence) of a problem"""
+        with tracer.span('classify') as classify_span:
+            category_result = self.category_classifier.predict(problem, return_probabilities=False)
+            classify_span.set_attributes({
+                'reasoning.category': category_result['predicted_category'],
+                'reasoning.category_confidence': category_result['confidence']
+            })
+        return category_result['predicted_category'], category_result['confidence']
+    
+    def _cached(self, key, degraded: bool) -> Optional[ReasoningResult]:
+        """Cached answer for key; when degraded, also a renumbered near-duplicate's"""
+        cached = self.response_cache.get(key)
+        if cached is None and degraded:
+            cached = self.response_cache.find_similar(key)
+            if cached is not None:
+                cached.degraded = 'near_duplicate'
+                self.load_monitor.record_degraded(cached.degraded)
+        if cached is not None:
+            cached.usage = None  # Nothing was spent on this request
+        return cached
+    
+    def process_problem(self, problem: str, options: Dict[str, str],
+                        budget: Optional[UsageBudget] = None) -> ReasoningResult:
         """
         Process a single problem
         
         Args:
             problem: Problem statement
             options: Dictionary with option_1 through option_5
+            budget: Token/cost budget to charge (optional)
         
         Returns:
-            Dictionary with prediction and reasoning
+            ReasoningResult with prediction and reasoning
         """
-        # Stage 1: Classify category
-        category_result = self.category_classifier.predict(problem, return_probabilities=False)
-        predicted_category = category_result['predicted_category']
-        category_confidence = category_result['confidence']
-        
-        # Stage 2: Solve with specialized agent
-        solution = self.reasoning_system.solve_problem(
-            problem, options, category=predicted_category
-        )
+        tier = self.load_monitor.tier() if self.load_monitor is not None else 'full'
+        key = cache_key(problem, options.values()) if self.response_cache is not None else None
+        if key is not None:
+            cached = self._cached(key, degraded=tier != 'full')
+            if cached is not None:
+                return cached
         
-        # Compile result
-        result = {
-            'predicted_answer': solution['final_answer'],
-            'confidence': solution['confidence'],
-            'reasoning': solution['explanation'],
-            'category': predicted_category,
-            'category_confidence': category_confidence,
-            'raw_response': solution.get('raw_response', '')
-        }
+        with tracer.span('pipeline.process_problem', {'load.tier': tier}) as span:
+            predicted_category, category_confidence = self._classify(problem)
+            
+            # Stage 2: Solve with specialized agent
+            try:
+                result = self.reasoning_system.solve_problem(
+                    problem, options, category=predicted_category, budget=budget, tier=tier
+                )
+            except Exception as e:
+                if self.load_monitor is None:
+                    raise
+                result = self.reasoning_system.fallback_answer(
+                    problem, options, predicted_category, f"LLM call failed: {e}"
+                )
+            span.set_attributes({
+                'reasoning.category': predicted_category,
+                'reasoning.predicted_answer': result.predicted_answer,
+                'reasoning.parse_method': result.parse_method,
+                'budget.degraded': result.budget_degraded,
+                'load.degraded': result.degraded or 'none'
+            })
+        
+        result.category = predicted_category
+        result.category_confidence = float(category_confidence)
+        if result.degraded is not None:
+            self.load_monitor.record_degraded(result.degraded)  # Not cached: full service recomputes it
+        elif key is not None and result.error is None:
+            self._cache_and_verify(key, problem, options, result)
+        return result
+    
+    def answer_without_queue(self, problem: str, options: List[str]) -> Optional[ReasoningResult]:
+        """
+        Answer a request the scheduler had no room for, without an LLM call
         
+        Uses the response cache (near-duplicates included) and the local
+        engines; None when neither answers, and the request is shed.
+        """
+        options_dict = {f'option_{number}': option for number, option in enumerate(options, 1)}
+        result = self._cached(cache_key(problem, options_dict.values()), degraded=True)
+        if result is None:
+            category, category_confidence = self._classify(problem)
+            result = self.reasoning_system.solve_locally(problem, options_dict, category)
+            if result is None:
+                self.load_monitor.record_shed()
+                return None
+            result.category = category
+            result.category_confidence = float(category_confidence)
         return result
     
-    def process_test_file(self, test_file: str, save_output: bool = True) -> List[Dict]:
+    def _cache_and_verify(self, key, problem: str, options: Dict[str, str], result: ReasoningResult):
+        """Cache a fresh result; below the confidence threshold, also queue it for verification"""
+        if (self.verifier is not None and result.parse_method != 'engine'
+                and result.confidence < VERIFY_CONFIDENCE_THRESHOLD):
+            result.verification = 'pending'
+        self.response_cache.put(key, result)
+        if result.verification == 'pending' and not self.verifier.submit(
+                key, problem, options, result.copy(), result.category):
+            result.verification = None  # Queue full: the answer stays as it is
+            self.response_cache.put(key, result)
+    
+    def _verify(self, problem: str, options: Dict[str, str], result: ReasoningResult,
+                category: Optional[str]):
+        return self.reasoning_system.verify_problem(problem, options, result, category)
+    
+    def _process_row(self, row, budget: Optional[UsageBudget] = None) -> ReasoningResult:
+        """Solve one streamed row, falling back to a default prediction on error"""
+        idx, problem, options = row
+        try:
+            result = self.process_problem(problem, options, budget=budget)
+            result.row_index = idx
+            return result
+        except Exception as e:
+            print(f"\nError processing row {idx}: {e}")
+            return ReasoningResult.failed(str(e), row_index=idx)
+    
+    def _process_pack(self, rows: List, category: str, category_confidences: List[float],
+                      budget: Optional[UsageBudget] = None) -> List[ReasoningResult]:
+        """Solve one pack of same-category rows, falling back to single rows on error"""
+        with tracer.span('pipeline.process_pack', {'reasoning.category': category,
+                                                   'pack.size': len(rows)}):
+            try:
+                results = self.reasoning_system.solve_pack(
+                    [(problem, options) for _, problem, options in rows], category=category, budget=budget
+                )
+            except Exception as e:
+                print(f"\nError processing pack of {len(rows)} rows: {e}")
+                return [self._process_row(row, budget) for row in rows]
+        
+        for (idx, _, _), result, confidence in zip(rows, results, category_confidences):
+            result.category = category
+            result.category_confidence = float(confidence)
+            result.row_index = idx
+        return results
+    
+    def process_rows_packed(self, rows: List, executor: ThreadPoolExecutor,
+                            budget: Optional[UsageBudget] = None) -> List[ReasoningResult]:
+        """
+        Solve (index, problem, options) rows with packed LLM calls
+        
+        Rows are classified up front, grouped by category and split into packs
+        (see ``MultiAgentReasoningSystem.plan_packs``); packs run concurrently
+        on the executor.
+        
+        Returns:
+            Results in row order
+        """
+        rows = list(rows)
+        groups = defaultdict(list)
+        for position, (_, problem, _) in enumerate(rows):
+            prediction = self.category_classifier.predict(problem, return_probabilities=False)
+            groups[prediction['predicted_category']].append((position, prediction['confidence']))
+        
+        futures = []
+        for category, members in groups.items():
+            items = [rows[position][1:] for position, _ in members]
+            for pack in self.reasoning_system.plan_packs(items, category=category):
+                positions = [members[index][0] for index in pack]
+                futures.append((positions, executor.submit(
+                    self._process_pack, [rows[position] for position in positions], category,
+                    [members[index][1] for index in pack], budget
+                )))
+        
+        results = [None] * len(rows)
+        for positions, future in futures:
+            for position, result in zip(positions, future.result()):
+                results[position] = result
+        return results
+    
+    def process_test_file(self, test_file: str, save_output: bool = True,
+                          output_file: str = OUTPUT_FILE,
+                          chunksize: int = CSV_CHUNK_SIZE,
+                          max_workers: int = MAX_WORKERS,
+                          keep_results: bool = True,
+                          compress_output: bool = COMPRESS_DETAILED_OUTPUT,
+                          raw_response: str = RAW_RESPONSE_MODE,
+                          max_cost: Optional[float] = None,
+                          max_tokens: Optional[int] = None,
+                          packed: bool = PACKED_SOLVES) -> List[ReasoningResult]:
         """
         Process entire test file
         
+        Rows are streamed in column chunks and solved concurrently. Predictions are
+        appended to the output CSV and the detailed JSONL file as each chunk
+        completes, so memory stays flat for arbitrarily large inputs.
+        
         Args:
             test_file: Path to test CSV file
             save_output: If True, save predictions to output.csv
+            output_file: Path of the predictions CSV
+            chunksize: Rows read per streaming chunk
+            max_workers: Number of problems solved concurrently
+            keep_results: If False, results are only written to disk (not returned)
+            compress_output: If True, the detailed JSONL is gzip-compressed
+            raw_response: How raw LLM text is stored: 'inline', 'drop' or 'blob'
+            max_cost: USD budget for the run (a hard cap); near it, solves use cheaper prompts
+            max_tokens: Token budget for the run, with the same degradation
+            packed: If True, same-category problems in a chunk share LLM calls
         
         Returns:
-            List of prediction dictionaries
+            List of ReasoningResult records (empty when keep_results is False)
         """
         print(f"\nProcessing test file: {test_file}")
         
-        # Load test data
-        test_df = pd.read_csv(test_file)
-        print(f"Loaded {len(test_df)} test samples")
-        
-        # Process each sample
         results = []
-        predictions_only = []
-        
-        for idx, row in tqdm(test_df.iterrows(), total=len(test_df), desc="Processing"):
-            problem = row['problem_statement']
-            options = {
-                'option_1': row['answer_option_1'],
-                'option_2': row['answer_option_2'],
-                'option_3': row['answer_option_3'],
-                'option_4': row['answer_option_4'],
-                'option_5': row['answer_option_5']
-            }
+        summary = {'total': 0, 'confidence_sum': 0.0, 'answer_counts': Counter(), 'packed': 0}
+        budget = UsageBudget(max_cost, max_tokens, scope=f"run:{datetime.now().isoformat(timespec='seconds')}")
+        process_row = partial(self._process_row, budget=budget)
+        json_output = output_file.replace('.csv', '_detailed.jsonl')
+        
+        with ExitStack() as stack:
+            if save_output:
+                csv_file = stack.enter_context(open(output_file, 'w', newline=''))
+                csv_writer = csv.writer(csv_file)
+                csv_writer.writerow(['predicted_answer'])
+                json_writer = stack.enter_context(
+                    ResultWriter(json_output, compress=compress_output, raw_response=raw_response)
+                )
             
-            try:
-                result = self.process_problem(problem, options)
-                result['row_index'] = idx
-                results.append(result)
-                predictions_only.append(result['predicted_answer'])
-            except Exception as e:
-                print(f"\nError processing row {idx}: {e}")
-                # Default prediction
-                results.append({
-                    'row_index': idx,
-                    'predicted_answer': 3,
-                    'confidence': 0.3,
-                    'reasoning': f'Error: {str(e)}',
-                    'category': 'Unknown',
-                    'category_confidence': 0.0,
-                    'error': str(e)
-                })
-                predictions_only.append(3)
-        
-        # Save output if requested
-        if save_output:
-            # Save submission file (just predictions)
-            output_df = pd.DataFrame({'predicted_answer': predictions_only})
-            output_df.to_csv(OUTPUT_FILE, index=False)
-            print(f"\n✓ Predictions saved to {OUTPUT_FILE}")
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+            progress = stack.enter_context(tqdm(desc="Processing", unit="row"))
             
-            # Save detailed results as JSON
-            json_output = OUTPUT_FILE.replace('.csv', '_detailed.json')
-            with open(json_output, 'w') as f:
-                json.dump(results, f, indent=2)
-            print(f"✓ Detailed results saved to {json_output}")
+            for chunk in iter_problem_chunks(test_file, chunksize):
+                # Both paths preserve row order within the chunk
+                if packed:
+                    chunk_results = self.process_rows_packed(chunk.iter_rows(), executor, budget)
+                else:
+                    chunk_results = executor.map(process_row, chunk.iter_rows())
+                for result in chunk_results:
+                    summary['total'] += 1
+                    summary['packed'] += result.pack_size is not None
+                    summary['confidence_sum'] += result.confidence
+                    summary['answer_counts'][result.predicted_answer] += 1
+                    
+                    if save_output:
+                        csv_writer.writerow([result.predicted_answer])
+                        json_writer.write(result)
+                    if keep_results:
+                        results.append(result)
+                
+                if save_output:
+                    csv_file.flush()
+                    json_writer.flush()
+                progress.update(len(chunk))
+        
+        usage_ledger.flush()
+        llm_transport.flush()
+        tracer.flush()
+        summary['usage'] = budget.snapshot()
+        self.last_run_summary = summary
+        print(f"Processed {summary['total']} test samples")
+        
+        if save_output:
+            print(f"\n✓ Predictions saved to {output_file}")
+            print(f"✓ Detailed results saved to {json_writer.path}")
         
         return results
     
-    def process_single_problem(self, problem: str, options: List[str]) -> Dict:
+    def process_single_problem(self, problem: str, options: List[str],
+                               budget: Optional[UsageBudget] = None) -> ReasoningResult:
         """
         Process a single problem (for API/interactive use)
         
         Args:
             problem: Problem statement
             options: List of 5 answer options
+            budget: Token/cost budget to charge (optional)
         
         Returns:
-            Dictionary with prediction and reasoning
+            ReasoningResult with prediction and reasoning
         """
         if len(options) != 5:
             raise ValueError("Exactly 5 options required")
@@ -170,7 +376,7 @@ class MLReasoningPipeline:
             'option_5': options[4]
         }
         
-        return self.process_problem(problem, options_dict)
+        return self.process_problem(problem, options_dict, budget=budget)
 
 
 def main():
@@ -182,13 +388,48 @@ def main():
                        help='Path to output CSV file')
     parser.add_argument('--no-train', action='store_true',
                        help='Load existing model instead of training')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                       help='Number of problems solved concurrently')
+    parser.add_argument('--compress-output', action='store_true',
+                       help='Gzip-compress the detailed JSONL output')
+    parser.add_argument('--raw-response', choices=['inline', 'drop', 'blob'],
+                       default=RAW_RESPONSE_MODE,
+                       help='Keep raw LLM responses inline, drop them, or store them in a blob file')
+    parser.add_argument('--compact', action='store_true',
+                       help='Use compact reasoning prompts with smaller token budgets')
+    parser.add_argument('--structured', action='store_true',
+                       help='Request JSON-schema output instead of free-text parsing')
+    parser.add_argument('--max-cost', type=float, default=None,
+                       help='USD budget for the run; near it, solves switch to cheaper prompts, and a '
+                            'solve it cannot pay for gets a fallback answer with no LLM call')
+    parser.add_argument('--max-tokens', type=int, default=None,
+                       help='Token budget for the run (same degradation as --max-cost)')
+    parser.add_argument('--packed', action='store_true',
+                       help='Solve several same-category problems per LLM call')
+    parser.add_argument('--profile', type=str, default=None,
+                       help='Write a sampling profile of the run (.json = speedscope, else collapsed stacks)')
+    parser.add_argument('--profile-seconds', type=float, default=None,
+                       help='Only profile the first N seconds of the run')
+    parser.add_argument('--record', type=str, default=None,
+                       help='Archive every LLM call (with timing) to this file')
+    parser.add_argument('--replay', type=str, default=None,
+                       help='Answer LLM calls from an archive recorded with --record (offline)')
+    parser.add_argument('--replay-latency', type=float, default=REPLAY_LATENCY_SCALE,
+                       help='Scale for recorded latencies during --replay (0 = no delay)')
     parser.add_argument('--single', action='store_true',
                        help='Process a single problem from stdin (JSON format)')
     
     args = parser.parse_args()
     
+    if args.record:
+        llm_transport.configure('record', args.record)
+    elif args.replay:
+        llm_transport.configure('replay', args.replay, args.replay_latency)
+    
     # Initialize pipeline
-    pipeline = MLReasoningPipeline(train_model=not args.no_train)
+    pipeline = MLReasoningPipeline(train_model=not args.no_train,
+                                   compact=args.compact or COMPACT_REASONING,
+                                   structured=args.structured or STRUCTURED_OUTPUT)
     
     if args.single:
         # Process single problem from stdin
@@ -202,27 +443,48 @@ def main():
         )
         
         # Output as JSON
-        print(json.dumps(result, indent=2))
+        print(json.dumps(result.to_dict(), indent=2, default=str))
     else:
-        # Process test file
-        results = pipeline.process_test_file(args.test_file, save_output=True)
+        profiler = SamplingProfiler().start(args.profile_seconds) if args.profile else None
+        
+        # Process test file (results are streamed to disk, not kept in memory)
+        pipeline.process_test_file(
+            args.test_file, save_output=True, output_file=args.output,
+            max_workers=args.workers, keep_results=False,
+            compress_output=args.compress_output or COMPRESS_DETAILED_OUTPUT,
+            raw_response=args.raw_response,
+            max_cost=args.max_cost, max_tokens=args.max_tokens,
+            packed=args.packed or PACKED_SOLVES
+        )
+        if profiler is not None:
+            profiler.stop().write(args.profile)
+            print(f"✓ Profile ({profiler.samples} samples) saved to {args.profile}")
+        summary = pipeline.last_run_summary
+        total = summary['total']
         
         # Print summary
         print("\n" + "="*80)
         print("SUMMARY")
         print("="*80)
-        print(f"Total processed: {len(results)}")
-        print(f"Average confidence: {sum(r['confidence'] for r in results) / len(results):.1%}")
+        print(f"Total processed: {total}")
+        if total:
+            print(f"Average confidence: {summary['confidence_sum'] / total:.1%}")
         
         # Answer distribution
-        from collections import Counter
-        answer_dist = Counter(r['predicted_answer'] for r in results)
+        answer_dist = summary['answer_counts']
         print("\nAnswer distribution:")
         for answer in sorted(answer_dist.keys()):
             count = answer_dist[answer]
-            pct = count / len(results) * 100
+            pct = count / total * 100
             print(f"  Option {answer}: {count:>3} ({pct:>5.1f}%)")
         
+        usage = summary['usage']
+        print(f"\nTokens used: {usage['spent_tokens']:,} (${usage['spent_cost']:.4f})")
+        if usage['degraded_calls']:
+            print(f"Budget-degraded solves: {usage['degraded_calls']}")
+        if summary['packed']:
+            print(f"Answered from packed calls: {summary['packed']}/{total}")
+        
         print(f"\n✓ Output saved to {args.output}")
 
 
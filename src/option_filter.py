@@ -0,0 +1,364 @@
+"""
+Answer-option pre-filter
+Cheap local analysis of the five options before the LLM call: normalization,
+duplicate removal, numeric parsing, range checks against what the question asks
+for and deterministic checks (sequence extrapolation) that can narrow the
+question to a short "choose between" prompt, plus a cheap score for each option
+"""
+
+import argparse
+import re
+import threading
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import OPTION_FILTER_MAX_CANDIDATES, TRAIN_FILE
+from data_loader import OPTION_KEYS
+
+# Options that stand for "none of the listed answers"; never eliminated
+_CATCH_ALL = re.compile(r'^(another|other|different) answer$|^none of the (above|options)$')
+_NUMBER = re.compile(r'^[$€£]?\s*(-?\d[\d,]*(?:\.\d+|/\d+)?)\s*(?:[a-z%]+(?:\s[a-z]+)?)?$')
+# Four or more comma-separated numbers, then a blank, "?" or ellipsis, then any known later terms
+_NUMBER_TERM = r'-?\d+(?:\.\d+)?'
+_SEQUENCE = re.compile(
+    rf'({_NUMBER_TERM}(?:\s*,\s*{_NUMBER_TERM}){{3,}})\s*,?\s*(?:_+|\?|\.\.\.|…)'
+    rf'((?:\s*,\s*{_NUMBER_TERM}(?![\d.]))*)'
+)
+_ORDINAL = re.compile(r'\b(\d+)(?:st|nd|rd|th) (?:number|term|element)')
+# What the question asks for, matched in its last question sentence
+_ASKS_PROBABILITY = re.compile(r'\b(?:what|which) (?:is|are) the (?:\w+ )?(?:probability|chances?|likelihood|percentage)\b')
+_ASKS_COUNT = re.compile(r'\bhow many\b')
+_ASKS_WHOLE_COUNT = re.compile(r'\bhow many (?:full|whole|complete)\b')
+# On train.csv the smallest or largest of three or more numeric options is
+# correct 12% of the time, a middle one 27%
+_EXTREME_SCORE = -1
+
+
+def normalize_option(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return ' '.join(str(text).split()).lower().rstrip('.!')
+
+
+def is_catch_all(text: str) -> bool:
+    """Whether an option stands for "none of the listed answers" (never eliminated)"""
+    return _CATCH_ALL.match(normalize_option(text)) is not None
+
+
+def option_value(text: str, normalized: bool = False) -> Optional[Fraction]:
+    """Numeric value of an option that is just a number (with an optional unit)"""
+    match = _NUMBER.match(text if normalized else normalize_option(text))
+    if match is None:
+        return None
+    try:
+        return Fraction(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def asked_sentence(problem: str) -> str:
+    """The last sentence with a question mark (else the last sentence), lowercased"""
+    sentences = re.split(r'(?<=[.?!])\s+', ' '.join(problem.split()).lower())
+    questions = [sentence for sentence in sentences if sentence.endswith('?')]
+    return (questions or sentences or [''])[-1]
+
+
+def out_of_range(asked: str, text: str, value: Optional[Fraction]) -> Optional[str]:
+    """
+    Why a numeric option cannot answer the question, or None
+
+    Probabilities must lie in [0, 1] (or [0%, 100%]), counts cannot be
+    negative and "how many full/whole/complete" counts must be whole numbers.
+    """
+    if value is None:
+        return None
+    if _ASKS_PROBABILITY.search(asked):
+        upper = 100 if text.endswith('%') else 1
+        if not 0 <= value <= upper:
+            return "out of range for a probability"
+    if _ASKS_COUNT.search(asked):
+        if value < 0:
+            return "negative count"
+        if value.denominator != 1 and _ASKS_WHOLE_COUNT.search(asked):
+            return "not a whole number"
+    return None
+
+
+def score_options(candidates: List[int], values: Dict[int, Optional[Fraction]]) -> Dict[int, int]:
+    """
+    Cheap prior for each remaining option (higher is more likely)
+
+    With three or more numeric candidates the smallest and largest value score
+    lower than the ones in between; other options score 0.
+    """
+    scores = {number: 0 for number in candidates}
+    numeric = sorted((number for number in candidates if values.get(number) is not None),
+                     key=lambda number: values[number])
+    if len(numeric) >= 3:
+        scores[numeric[0]] += _EXTREME_SCORE
+        scores[numeric[-1]] += _EXTREME_SCORE
+    return scores
+
+
+def _terms(text: str) -> List[Fraction]:
+    return [Fraction(term) for term in re.findall(_NUMBER_TERM, text)]
+
+
+def extract_sequence(problem: str) -> Optional[Tuple[List[Fraction], List[Fraction], int]]:
+    """
+    Find an explicit 'a, b, c, d, ___' sequence in the problem
+
+    Returns:
+        (terms before the blank, known terms after it, steps from the last
+        known term to the asked-for one) or None
+    """
+    match = _SEQUENCE.search(problem)
+    if match is None:
+        return None
+    terms, after = _terms(match.group(1)), _terms(match.group(2))
+    steps = 1
+    ordinal = _ORDINAL.search(problem)
+    if not after and ordinal is not None and int(ordinal.group(1)) > len(terms):
+        steps = int(ordinal.group(1)) - len(terms)  # "what is the 10th number?"
+    return terms, after, steps
+
+
+def _difference_rule(terms: List[Fraction]) -> Optional[Tuple[Callable, str]]:
+    """Constant differences at some order (polynomial sequences)"""
+    row, order = terms, 0
+    while len(row) >= 2:
+        if order and len(set(row)) == 1:
+            break
+        row, order = [b - a for a, b in zip(row, row[1:])], order + 1
+    else:
+        return None
+
+    def next_term(sequence: List[Fraction]) -> Fraction:
+        rows = [sequence[-order - 1:]]
+        for _ in range(order):
+            rows.append([b - a for a, b in zip(rows[-1], rows[-1][1:])])
+        value = rows[-1][-1]
+        for upper in reversed(rows[:-1]):
+            value = upper[-1] + value
+        return value
+
+    return next_term, f"constant order-{order} differences"
+
+
+def _recurrence_rule(terms: List[Fraction]) -> Optional[Tuple[Callable, str]]:
+    """a(n+1) = p*a(n) + q fitted on three terms and checked on the rest"""
+    if len(terms) < 4 or terms[1] == terms[0]:
+        return None
+    p = (terms[2] - terms[1]) / (terms[1] - terms[0])
+    q = terms[1] - p * terms[0]
+    if p in (0, 1) or any(b != p * a + q for a, b in zip(terms, terms[1:])):
+        return None
+    return (lambda sequence: p * sequence[-1] + q,
+            f"a(n+1) = {p}*a(n) {'+' if q >= 0 else '-'} {abs(q)}")
+
+
+def extrapolate_sequence(terms: List[Fraction], after: Optional[List[Fraction]] = None,
+                         steps: int = 1) -> Optional[Tuple[Fraction, str]]:
+    """
+    The missing term of a numeric sequence, or None if no simple rule fits
+
+    Tries constant differences (any order, with at least two equal entries in
+    the constant row) and first-order linear recurrences (which include
+    geometric sequences). With ``after``, the term right after ``terms`` is
+    wanted and the rule must also reproduce the known later terms; otherwise
+    the term ``steps`` places past the end is returned. Rules that disagree are
+    treated as no answer.
+    """
+    after = after or []
+    predictions = {}
+    for rule in (_difference_rule(terms), _recurrence_rule(terms)):
+        if rule is None:
+            continue
+        next_term, description = rule
+        sequence = list(terms)
+        for _ in range(max(steps, 1 + len(after))):
+            sequence.append(next_term(sequence))
+        if sequence[len(terms) + 1:len(terms) + 1 + len(after)] != after:
+            continue
+        predictions.setdefault(sequence[len(terms) if after else -1], description)
+    if len(predictions) != 1:
+        return None
+    return next(iter(predictions.items()))
+
+
+class OptionAnalysis:
+    """Outcome of the pre-filter for one problem"""
+
+    __slots__ = ('candidates', 'eliminated', 'reason', 'hint', 'scores')
+
+    def __init__(self, candidates: List[int], eliminated: Dict[int, str],
+                 reason: Optional[str] = None, hint: Optional[str] = None,
+                 scores: Optional[Dict[int, int]] = None):
+        self.candidates = candidates  # Option numbers (1-5) still in play
+        self.eliminated = eliminated  # Option number -> why it was dropped
+        self.reason = reason  # Check that produced a shortlist, if any
+        self.hint = hint  # Finding passed to the LLM along with the shortlist
+        self.scores = scores or {number: 0 for number in candidates}  # Cheap prior per candidate
+
+    @property
+    def shortlisted(self) -> bool:
+        return self.reason is not None
+
+    def best(self, default: int = 3) -> int:
+        """Highest-scoring candidate; ``default`` wins ties it is part of"""
+        if not self.candidates:
+            return default
+        top = max(self.scores.get(number, 0) for number in self.candidates)
+        leaders = [number for number in self.candidates if self.scores.get(number, 0) == top]
+        return default if default in leaders else leaders[0]
+
+    def to_dict(self) -> Dict:
+        return {
+            'candidates': self.candidates,
+            'eliminated': self.eliminated,
+            'reason': self.reason,
+            'scores': self.scores
+        }
+
+
+def analyze_options(problem: str, options: Dict[str, str],
+                    max_candidates: int = OPTION_FILTER_MAX_CANDIDATES) -> OptionAnalysis:
+    """
+    Dedupe, range-check and score the answer options of a problem
+
+    Args:
+        problem: Problem statement
+        options: Dictionary with keys 'option_1' through 'option_5'
+        max_candidates: Largest shortlist that is sent as a "choose between" prompt
+
+    Returns:
+        OptionAnalysis; ``shortlisted`` is set when at most ``max_candidates`` remain
+    """
+    texts = [normalize_option(options.get(key, '')) for key in OPTION_KEYS]
+    eliminated = {}
+    seen = {}
+    for number, text in enumerate(texts, 1):
+        if text in seen:
+            eliminated[number] = f"duplicate of option {seen[text]}"
+        else:
+            seen[text] = number
+
+    values = {number: option_value(texts[number - 1], normalized=True)
+              for number in range(1, len(texts) + 1) if number not in eliminated}
+    asked = asked_sentence(problem)
+    for number, value in values.items():
+        why = out_of_range(asked, texts[number - 1], value)
+        if why is not None:
+            eliminated[number] = why
+
+    distinct = [number for number in range(1, len(texts) + 1) if number not in eliminated]
+    scores = score_options(distinct, values)
+    catch_all = [number for number in distinct if _CATCH_ALL.match(texts[number - 1])]
+    numeric = [number for number in distinct if values[number] is not None]
+    checked = 'range' if any(not note.startswith('duplicate') for note in eliminated.values()) else 'duplicates'
+
+    sequence = extract_sequence(problem) if numeric else None
+    prediction = extrapolate_sequence(*sequence) if sequence else None
+    if prediction is not None:
+        value, rule = prediction
+        matches = [number for number in numeric if values[number] == value]
+        hint = f"The given terms fit {rule}, which makes the missing term {_format(value)}."
+        if matches:
+            keep = matches[:1] + catch_all
+        elif catch_all:
+            # No option equals the extrapolation: keep the closest one to let the LLM overrule it
+            keep = [min(numeric, key=lambda number: abs(values[number] - value))] + catch_all
+            hint += " No listed number equals it."
+        else:
+            keep = distinct
+        if len(keep) <= max_candidates:
+            for number in distinct:
+                if number not in keep:
+                    eliminated[number] = f"contradicts sequence extrapolation ({_format(value)})"
+            return OptionAnalysis(sorted(keep), eliminated, 'sequence', hint,
+                                  {number: scores[number] for number in keep})
+
+    if len(distinct) <= max_candidates:
+        return OptionAnalysis(distinct, eliminated, checked, scores=scores)
+    return OptionAnalysis(distinct, eliminated, scores=scores)
+
+
+def _format(value: Fraction) -> str:
+    return str(value.numerator) if value.denominator == 1 else f"{float(value):g}"
+
+
+class OptionFilterMetrics:
+    """How often the pre-filter shortlists, and the prompt tokens that saved"""
+
+    def __init__(self):
+        self.analyzed = 0
+        self.shortlisted = 0
+        self.by_reason = {}
+        self.full_prompt_tokens = 0
+        self.shortlist_prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, analysis: OptionAnalysis, full_tokens: int = 0, shortlist_tokens: int = 0):
+        with self._lock:
+            self.analyzed += 1
+            if analysis.shortlisted:
+                self.shortlisted += 1
+                self.by_reason[analysis.reason] = self.by_reason.get(analysis.reason, 0) + 1
+                self.full_prompt_tokens += full_tokens
+                self.shortlist_prompt_tokens += shortlist_tokens
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            saved = self.full_prompt_tokens - self.shortlist_prompt_tokens
+            return {
+                'analyzed': self.analyzed,
+                'shortlisted': self.shortlisted,
+                'shortlist_rate': self.shortlisted / self.analyzed if self.analyzed else 0.0,
+                'by_reason': dict(self.by_reason),
+                'prompt_tokens_saved': saved,
+                'prompt_reduction': saved / self.full_prompt_tokens if self.full_prompt_tokens else 0.0
+            }
+
+
+# Process-wide counters shared by all agents
+option_filter_metrics = OptionFilterMetrics()
+
+
+def main():
+    """Offline report of the pre-filter on a labelled CSV (no LLM calls)"""
+    import pandas as pd
+    from data_loader import OPTION_COLUMNS
+
+    parser = argparse.ArgumentParser(description='Report how often the option pre-filter shortlists')
+    parser.add_argument('--data', type=str, default=TRAIN_FILE, help='Labelled CSV file')
+    parser.add_argument('--max-candidates', type=int, default=OPTION_FILTER_MAX_CANDIDATES,
+                        help='Largest shortlist sent as a "choose between" prompt')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    shortlisted = kept_correct = 0
+    by_topic = {}
+    for _, row in df.iterrows():
+        options = dict(zip(OPTION_KEYS, (row[column] for column in OPTION_COLUMNS)))
+        analysis = analyze_options(row['problem_statement'], options, args.max_candidates)
+        stats = by_topic.setdefault(row['topic'], [0, 0])
+        stats[0] += 1
+        if analysis.shortlisted:
+            stats[1] += 1
+            shortlisted += 1
+            kept_correct += int(row['correct_option_number']) in analysis.candidates
+
+    print("\n" + "=" * 80)
+    print("OPTION PRE-FILTER")
+    print("=" * 80)
+    print(f"Problems: {len(df)}")
+    print(f"Shortlisted: {shortlisted} ({shortlisted / len(df):.1%})")
+    if shortlisted:
+        print(f"Correct option kept in shortlist: {kept_correct}/{shortlisted} "
+              f"({kept_correct / shortlisted:.1%})")
+    print("\nBy topic:")
+    for topic, (total, count) in sorted(by_topic.items()):
+        print(f"  {topic:<40} {count:>4}/{total:<4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+"""
+Planning solver
+Exact local solver for "Optimization of actions and planning" problems that
+reduce to task scheduling (durations, precedences, workers, deadlines), a
+shortest route over a distance table, or a one-to-one assignment
+"""
+
+import argparse
+import itertools
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from config import PLANNING_MAX_ITEMS, TRAIN_FILE
+from engines import EngineOutcome, choose_option, engine_report, print_engine_report, rows_from_csv
+from option_filter import normalize_option
+
+CATEGORY = "Optimization of actions and planning"
+
+EXTRACTION_PROMPT = """Translate this planning problem into a model for an exact solver. Do not solve it.
+
+Problem: {problem}
+
+Reply with only one JSON object in one of these shapes:
+{{"kind": "schedule", "unit": "<time unit>", "workers": <tasks that can run at once, null if unlimited>, \
+"tasks": [{{"name": "<label>", "duration": <number>, "after": ["<task that must finish first>"], \
+"deadline": <number or null>, "penalty": <cost per unit late or null>}}]}}
+{{"kind": "route", "unit": "<distance unit>", "start": "<place or null>", "return_to_start": <true/false>, \
+"distances": [["<place>", "<place>", <number>]]}}
+{{"kind": "assignment", "unit": "<unit>", "minimize": "total" or "longest", \
+"costs": [["<worker>", "<task>", <number>]]}}
+{{"kind": "none"}} if any rule of the problem cannot be expressed in these shapes \
+(breaks, working hours, calendars, rates, travel, probabilities, ...).
+Use the same labels as the answer options for tasks, places and workers."""
+
+_NUMBER = r'(\d+(?:\.\d+)?|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)'
+_NUMBER_WORDS = {word: index for index, word in enumerate(
+    'zero one two three four five six seven eight nine ten eleven twelve'.split())}
+_UNITS = {
+    'minute': 'minute', 'minutes': 'minute', 'min': 'minute', 'mins': 'minute',
+    'hour': 'hour', 'hours': 'hour', 'hr': 'hour', 'hrs': 'hour',
+    'day': 'day', 'days': 'day', 'week': 'week', 'weeks': 'week',
+    'km': 'km', 'kilometer': 'km', 'kilometers': 'km', 'mile': 'mile', 'miles': 'mile'
+}
+_UNIT = r'(minutes?|mins?|hours?|hrs?|days?|weeks?|km|kilometers?|miles?)\b'
+_MINUTES_PER = {'minute': 1, 'hour': 60}  # Units that convert into each other
+
+# Rules the models below cannot express; problems mentioning them go to the LLM
+_UNMODELLED = re.compile(
+    r'\b(breaks?|lunch|rest|weekends?|priority|priorities|importan\w*|start(?:s|ing)? up|warm(?:s|ing)? up|'
+    r'cool\w*|drives?|away|fuel|gallons?|per (?:hour|day|minute|mile)(?! late)|each day|a day|'
+    r'at most|at least|maximum of|a\.?m\.?|p\.?m\.?|\d{1,2}:\d\d|batch\w*|rate|probability|'
+    r'together|help|twice|times as)\b',
+    re.IGNORECASE
+)
+_LABEL = r'([A-Z]\w*|\d+)'
+# "Task A takes 3 hours", "B takes 2 hours", "Task D, taking 1 day", "Task 1: 2 hours"; bare labels
+# are single capitals or numbers, and durations a named person needs "to complete" something are skipped
+_TASK_DURATION = re.compile(
+    rf'(?:\b(?i:task)\s+{_LABEL}|(?<![\w-])([A-Z]|\d+)),?\s+(?:takes|will take|taking|requires|needs|lasts)\s+'
+    rf'(?:exactly\s+)?{_NUMBER}\s*-?\s*{_UNIT}(?!\s+(?:to complete|for)\b)'
+    rf'|\b(?i:task)\s+{_LABEL}\s*:\s*{_NUMBER}\s*{_UNIT}'
+)
+_TASK_NAME = re.compile(rf'\b(?i:task)\s+{_LABEL}\b')
+_EQUAL_DURATION = re.compile(
+    rf'\beach task (?:takes|requires|will take)\s+(?:exactly\s+)?{_NUMBER}\s+(?:full\s+)?{_UNIT}',
+    re.IGNORECASE
+)
+_DEADLINE = re.compile(
+    rf'\btask\s+{_LABEL}\s+has an?\s+{_NUMBER}-{_UNIT}\s+deadline'
+    rf'(?:\s+and an?\s+\$?(\d+(?:\.\d+)?)\s+penalty per {_UNIT}\s+late)?',
+    re.IGNORECASE
+)
+_WORKERS = re.compile(rf'\b{_NUMBER}\s+(?:workers|people|machines|employees)\b', re.IGNORECASE)
+_ONE_AT_A_TIME = re.compile(r'\bone task at a time\b|\bone at a time\b', re.IGNORECASE)
+_PARALLEL = re.compile(r'\bin parallel\b|\bsimultaneously\b', re.IGNORECASE)
+_BEFORE = re.compile(r'\bbefore\s+((?:(?:task\s+)?(?:[A-Z]|\d+)(?:\s*,\s*|\s+and\s+)?)+)', re.IGNORECASE)
+_AFTER = re.compile(
+    r'\b(?:after|on the completion of|dependent on)\s+((?:(?:task\s+)?(?:[A-Z]|\d+)(?:\s*,\s*|\s+and\s+)?)+)',
+    re.IGNORECASE
+)
+_FINAL = re.compile(r'\bconcludes the project\b|\bmust be (?:done|completed) last\b', re.IGNORECASE)
+_DISTANCE = re.compile(rf'\b([A-Z]\w*) to ([A-Z]\w*)(?:\s+is|:)?\s+(\d+(?:\.\d+)?)\s*{_UNIT}')
+_ROUND_TRIP = re.compile(r'\bstart(?:ing)? and end(?:ing)? at ([A-Z]\w*)|\breturn(?:ing)? to ([A-Z]\w*)')
+_FIXED_START = re.compile(r'\bstart(?:ing)? (?:at|from) ([A-Z]\w*)')
+_ASSIGNMENT_COST = re.compile(rf'\b{_NUMBER}\s+{_UNIT}\s+for\s+(?:task\s+)?([A-Z]\w*|\d+)', re.IGNORECASE)
+_UNIFORM_COST = re.compile(rf'\b{_NUMBER}\s+{_UNIT}\s+to complete any (?:given )?task', re.IGNORECASE)
+_SUBJECT = re.compile(r'^\s*(?:(task)\s+)?(?:employee\s+|worker\s+)?([A-Z]\w*|\d+)\s+takes\b', re.IGNORECASE)
+_STATED_VALUE = re.compile(rf'\$?(\d+(?:\.\d+)?)\s*(?:{_UNIT})?', re.IGNORECASE)
+
+
+def _number(text: str) -> Fraction:
+    return Fraction(_NUMBER_WORDS.get(text.lower(), text))
+
+
+def _unit(text: Optional[str]) -> Optional[str]:
+    return _UNITS.get(text.lower()) if text else None
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence for sentence in re.split(r'(?<=[.?!])\s+', text) if sentence]
+
+
+def _format(value: Fraction) -> str:
+    return str(value.numerator) if value.denominator == 1 else f"{float(value):g}"
+
+
+def _quantity(value: Fraction, unit: Optional[str]) -> str:
+    if not unit:
+        return _format(value)
+    return f"{_format(value)} {unit}{'' if value == 1 or unit == 'km' else 's'}"
+
+
+def _name_pattern(name: str) -> re.Pattern:
+    """A label as a whole word; single letters and numbers match case-sensitively"""
+    flags = re.IGNORECASE if len(name) > 1 and not name.isdigit() else 0
+    return re.compile(rf'(?<!\w){re.escape(name)}(?!\w)', flags)
+
+
+def _find_names(text: str, names: Sequence[str]) -> List[Tuple[int, str]]:
+    """(position, name) of every label occurrence in text, in order"""
+    found = []
+    for name in names:
+        found.extend((match.start(), name) for match in _name_pattern(name).finditer(text))
+    return sorted(found)
+
+
+def stated_value(text: str, unit: Optional[str]) -> Optional[Fraction]:
+    """
+    The quantity an option states, converted to ``unit``
+
+    A bare number counts as being in ``unit``; a number with a unit word must
+    be in ``unit`` or convertible to it (minutes and hours). Options stating
+    several quantities are not read.
+    """
+    normalized = normalize_option(text)
+    if re.fullmatch(r'\$?\d+(?:\.\d+)?', normalized):
+        return Fraction(normalized.lstrip('$'))
+    values = [(Fraction(match.group(1)), _unit(match.group(2)))
+              for match in _STATED_VALUE.finditer(normalized) if match.group(2)]
+    if len(values) != 1:
+        return None
+    value, value_unit = values[0]
+    if value_unit == unit:
+        return value
+    if value_unit in _MINUTES_PER and unit in _MINUTES_PER:
+        return value * _MINUTES_PER[value_unit] / _MINUTES_PER[unit]
+    return None
+
+
+def _same_value(stated: Fraction, text: str, exact: Fraction) -> bool:
+    """Equal up to the precision the option is written with"""
+    decimals = re.search(r'\.(\d+)', text)
+    if decimals is None:
+        return stated == exact
+    return abs(stated - exact) <= Fraction(1, 2 * 10 ** len(decimals.group(1)))
+
+
+class Schedule:
+    """
+    Tasks with durations and precedences on a number of identical workers
+
+    Without deadlines the objective is the makespan; with deadlines it is the
+    total penalty for lateness (one worker, tasks in sequence).
+    """
+
+    kind = 'schedule'
+
+    def __init__(self, durations: Dict[str, Fraction], after: Optional[Dict[str, set]] = None,
+                 workers: Optional[int] = 1, deadlines: Optional[Dict[str, Fraction]] = None,
+                 penalties: Optional[Dict[str, Fraction]] = None, unit: Optional[str] = None):
+        self.durations = durations
+        self.after = {name: set(after.get(name, ())) if after else set() for name in durations}
+        self.workers = workers  # None = unlimited
+        self.deadlines = deadlines or {}
+        self.penalties = penalties or {}
+        self.unit = unit
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.durations)
+
+    def finish_times(self, order: Sequence[str]) -> Optional[Dict[str, Fraction]]:
+        """
+        List schedule: each task in turn starts on the worker free soonest,
+        once its predecessors are done
+
+        Taking an optimal schedule's tasks in start order reproduces it, so the
+        best order is an optimal schedule.
+        """
+        finish = {}
+        free = [Fraction(0)] * (self.workers or 1)
+        for name in order:
+            if not self.after[name] <= finish.keys():
+                return None
+            ready = max((finish[before] for before in self.after[name]), default=Fraction(0))
+            if self.workers is None:
+                finish[name] = ready + self.durations[name]
+                continue
+            worker = min(range(len(free)), key=lambda index: max(free[index], ready))
+            free[worker] = finish[name] = max(free[worker], ready) + self.durations[name]
+        return finish
+
+    def cost(self, order: Sequence[str]) -> Optional[Fraction]:
+        finish = self.finish_times(order)
+        if finish is None:
+            return None
+        if self.deadlines:
+            return sum(self.penalties.get(name, Fraction(1)) * max(Fraction(0), finish[name] - deadline)
+                       for name, deadline in self.deadlines.items())
+        return max(finish.values())
+
+    def optimum(self) -> Optional[Fraction]:
+        if self.deadlines:
+            return self._least_penalty()
+        if self.workers is None or self.workers == 1:
+            # No worker contention (critical path), or one worker that is never idle
+            order = self._topological_order()
+            return None if order is None else self.cost(order)
+        return self._least_makespan()
+
+    def _topological_order(self) -> Optional[List[str]]:
+        order, pending = [], dict(self.after)
+        while pending:
+            ready = [name for name, before in pending.items() if before <= set(order)]
+            if not ready:
+                return None  # Cyclic precedences
+            order.extend(ready)
+            for name in ready:
+                del pending[name]
+        return order
+
+    def _least_penalty(self) -> Optional[Fraction]:
+        """Subset DP: cheapest penalty for each set of tasks done first (one worker)"""
+        names = self.names
+        best = {0: Fraction(0)}
+        for mask in range(1 << len(names)):
+            if mask not in best:
+                continue
+            done = {names[index] for index in range(len(names)) if mask >> index & 1}
+            elapsed = sum(self.durations[name] for name in done)
+            for index, name in enumerate(names):
+                if mask >> index & 1 or not self.after[name] <= done:
+                    continue
+                end = elapsed + self.durations[name]
+                late = max(Fraction(0), end - self.deadlines[name]) if name in self.deadlines else 0
+                cost = best[mask] + self.penalties.get(name, Fraction(1)) * late
+                key = mask | 1 << index
+                if key not in best or cost < best[key]:
+                    best[key] = cost
+        return best.get((1 << len(names)) - 1)
+
+    def _least_makespan(self) -> Optional[Fraction]:
+        """Branch and bound over list-schedule orders"""
+        total_work = sum(self.durations.values())
+        depended_on = set().union(*self.after.values())
+        best = [None]
+
+        def search(finish: Dict[str, Fraction], free: List[Fraction], remaining: Fraction):
+            if len(finish) == len(self.durations):
+                makespan = max(finish.values())
+                if best[0] is None or makespan < best[0]:
+                    best[0] = makespan
+                return
+            bound = max(max(free), (sum(free) + remaining) / len(free))
+            if best[0] is not None and bound >= best[0]:
+                return
+            tried = set()
+            for name, duration in self.durations.items():
+                if name in finish or not self.after[name] <= finish.keys():
+                    continue
+                signature = name if name in depended_on else (duration, frozenset(self.after[name]))
+                if signature in tried:
+                    continue  # Interchangeable with a task already tried here
+                tried.add(signature)
+                ready = max((finish[before] for before in self.after[name]), default=Fraction(0))
+                worker = min(range(len(free)), key=lambda index: max(free[index], ready))
+                end = max(free[worker], ready) + duration
+                search({**finish, name: end}, free[:worker] + [end] + free[worker + 1:], remaining - duration)
+
+        search({}, [Fraction(0)] * self.workers, total_work)
+        return best[0]
+
+    def judge(self, text: str, best: Fraction) -> Optional[bool]:
+        names = [name for _, name in _find_names(text, self.names)]
+        value = None if self.deadlines else stated_value(text, self.unit)
+        if len(names) != len(self.durations) or len(set(names)) != len(names):
+            if value is None or names:
+                return None  # Neither a full order nor a plain quantity
+            return _same_value(value, text, best)
+        cost = self.cost(names)
+        return cost == best and (value is None or _same_value(value, text, best))
+
+    def explain(self, best: Fraction) -> str:
+        if self.deadlines:
+            return (f"Exact search over {len(self.durations)} task orders with deadlines: "
+                    f"minimum lateness penalty {_format(best)}.")
+        workers = 'unlimited workers' if self.workers is None else f"{self.workers} worker(s)"
+        return (f"Exact schedule search over {len(self.durations)} tasks with {workers}: "
+                f"minimum completion time {_quantity(best, self.unit)}.")
+
+
+class Route:
+    """Shortest route visiting every place of a distance table once"""
+
+    kind = 'route'
+
+    def __init__(self, distances: Dict[frozenset, Fraction], start: Optional[str] = None,
+                 closed: bool = False, unit: Optional[str] = None):
+        self.distances = distances
+        self.places = sorted({place for pair in distances for place in pair})
+        self.start = start
+        self.closed = closed
+        self.unit = unit
+
+    @property
+    def names(self) -> List[str]:
+        return self.places
+
+    def length(self, route: Sequence[str]) -> Optional[Fraction]:
+        total = Fraction(0)
+        for a, b in zip(route, route[1:]):
+            distance = self.distances.get(frozenset((a, b)))
+            if distance is None:
+                return None
+            total += distance
+        return total
+
+    def optimum(self) -> Optional[Fraction]:
+        first = self.start or (self.places[0] if self.closed else None)
+        rest = [place for place in self.places if place != first]
+        lengths = []
+        for order in itertools.permutations(rest):
+            route = ((first,) if first else ()) + order + ((first,) if self.closed else ())
+            lengths.append(self.length(route))
+        return min((length for length in lengths if length is not None), default=None)
+
+    def judge(self, text: str, best: Fraction) -> Optional[bool]:
+        route = [name for _, name in _find_names(text, self.places)]
+        if len(route) < 2:
+            value = stated_value(text, self.unit)
+            return None if value is None or route else _same_value(value, text, best)
+        visited = route[:-1] if len(route) > 1 and route[0] == route[-1] else route
+        if sorted(visited) != self.places:
+            return False  # Skips or repeats a place
+        if self.closed and route[0] != route[-1]:
+            route = route + route[:1]
+        if self.start and route[0] != self.start:
+            return False
+        return self.length(route) == best
+
+    def explain(self, best: Fraction) -> str:
+        shape = 'round trip' if self.closed else 'path'
+        return (f"Exact search over every {shape} through {len(self.places)} places: "
+                f"shortest length {_quantity(best, self.unit)}.")
+
+
+class Assignment:
+    """One task per worker, minimizing the total (or the longest) cost"""
+
+    kind = 'assignment'
+
+    def __init__(self, costs: Dict[str, Dict[str, Fraction]], minimize: str = 'total',
+                 unit: Optional[str] = None):
+        self.costs = costs
+        self.workers = list(costs)
+        self.tasks = sorted({task for row in costs.values() for task in row})
+        self.minimize = minimize
+        self.unit = unit
+
+    @property
+    def names(self) -> List[str]:
+        return self.workers + self.tasks
+
+    def cost(self, assignment: Dict[str, str]) -> Optional[Fraction]:
+        values = [self.costs[worker].get(task) for worker, task in assignment.items()]
+        if None in values:
+            return None
+        return max(values) if self.minimize == 'longest' else sum(values)
+
+    def optimum(self) -> Optional[Fraction]:
+        if len(self.tasks) > len(self.workers):
+            return None
+        costs = (self.cost(dict(zip(workers, self.tasks)))
+                 for workers in itertools.permutations(self.workers, len(self.tasks)))
+        return min((cost for cost in costs if cost is not None), default=None)
+
+    def _read(self, text: str) -> Optional[Dict[str, str]]:
+        """Worker -> task pairs from an option such as 'Joe: Task A, Susan: Task B'"""
+        assignment = {}
+        for part in re.split(r'[,;]', text):
+            task = re.search(r'(?i:task)\s+(\w+)', part)
+            task = task.group(1) if task and task.group(1) in self.tasks else None
+            found = [(position, name) for position, name in _find_names(part, self.names)]
+            workers = [name for _, name in found if name in self.workers and name != task]
+            if task is None:
+                tasks = [name for _, name in found if name in self.tasks and name not in workers]
+                task = tasks[0] if len(tasks) == 1 else None
+            if len(workers) != 1 or task is None:
+                return None
+            assignment[workers[0]] = task
+        if len(assignment) != len(self.tasks) or len(set(assignment.values())) != len(assignment):
+            return None
+        return assignment
+
+    def judge(self, text: str, best: Fraction) -> Optional[bool]:
+        assignment = self._read(text)
+        if assignment is None:
+            value = stated_value(text, self.unit)
+            return None if value is None else _same_value(value, text, best)
+        return self.cost(assignment) == best
+
+    def explain(self, best: Fraction) -> str:
+        goal = 'longest single task' if self.minimize == 'longest' else 'total cost'
+        return (f"Exact search over every assignment of {len(self.tasks)} tasks to "
+                f"{len(self.workers)} workers: minimum {goal} {_quantity(best, self.unit)}.")
+
+
+def _extract_schedule(problem: str) -> Optional[Schedule]:
+    durations, units = {}, set()
+    for match in _TASK_DURATION.finditer(problem):
+        if match.group(6):
+            name, amount, unit = match.group(6), match.group(7), match.group(8)
+        else:
+            name, amount, unit = match.group(1) or match.group(2), match.group(3), match.group(4)
+            previous = re.search(r'(\w+)\W*$', problem[:match.start()])
+            if match.group(2) and previous and previous.group(1).istitle():
+                continue  # "Machine B takes ...": not a task
+        if durations.get(name, _number(amount)) != _number(amount):
+            return None  # Conditional durations
+        durations[name] = _number(amount)
+        units.add(_unit(unit))
+
+    deadlines, penalties = {}, {}
+    for match in _DEADLINE.finditer(problem):
+        deadlines[match.group(1)] = _number(match.group(2))
+        units.add(_unit(match.group(3)))
+        if match.group(4):
+            penalties[match.group(1)] = Fraction(match.group(4))
+    equal = _EQUAL_DURATION.search(problem)
+    if deadlines and equal and not durations:
+        durations = {name: _number(equal.group(1)) for name in deadlines}
+        units.add(_unit(equal.group(2)))
+    if len(durations) < 2 or len(units) != 1 or len(durations) > PLANNING_MAX_ITEMS:
+        return None
+    if (set(deadlines) | set(_TASK_NAME.findall(problem))) - set(durations):
+        return None  # A task without a duration
+
+    after = {name: set() for name in durations}
+    for sentence in _sentences(problem):
+        subject = _SUBJECT.match(sentence) or re.match(r'^\s*task\s+(\w+)', sentence, re.IGNORECASE)
+        if subject is None:
+            continue
+        name = subject.group(subject.lastindex)
+        if name not in durations:
+            continue
+        for match in _BEFORE.finditer(sentence):
+            for later in re.findall(r'[A-Z]\w*|\d+', re.sub(r'(?i)\btask\b|\band\b', ' ', match.group(1))):
+                if later in durations and later != name:
+                    after[later].add(name)
+        for match in _AFTER.finditer(sentence):
+            for earlier in re.findall(r'[A-Z]\w*|\d+', re.sub(r'(?i)\btask\b|\band\b', ' ', match.group(1))):
+                if earlier in durations and earlier != name:
+                    after[name].add(earlier)
+        if _FINAL.search(sentence):
+            after[name] |= set(durations) - {name}
+    if re.search(r'\bcan (?:only )?be started (?:only )?(?:when|after) the previous one', problem, re.IGNORECASE):
+        names = list(durations)
+        for earlier, later in zip(names, names[1:]):
+            after[later].add(earlier)
+
+    workers_match = _WORKERS.search(problem)
+    if workers_match is not None:
+        workers = int(_number(workers_match.group(1)))
+    elif _ONE_AT_A_TIME.search(problem):
+        workers = 1
+    elif _PARALLEL.search(problem) or any(after.values()):
+        workers = None
+    else:
+        return None  # Unknown whether tasks may overlap
+    if deadlines and workers != 1:
+        return None
+    return Schedule(durations, after, workers, deadlines, penalties, units.pop())
+
+
+def _extract_route(problem: str) -> Optional[Route]:
+    distances, units = {}, set()
+    for a, b, amount, unit in _DISTANCE.findall(problem):
+        distances[frozenset((a, b))] = Fraction(amount)
+        units.add(_unit(unit))
+    places = {place for pair in distances for place in pair}
+    if len(distances) < 3 or len(units) != 1 or len(places) > PLANNING_MAX_ITEMS:
+        return None
+    if len(distances) != len(places) * (len(places) - 1) // 2:
+        return None  # Incomplete table
+    round_trip = _ROUND_TRIP.search(problem)
+    if round_trip is not None:
+        start = round_trip.group(1) or round_trip.group(2)
+        return Route(distances, start if start in places else None, True, units.pop())
+    start = _FIXED_START.search(problem)
+    start = start.group(1) if start and start.group(1) in places else None
+    return Route(distances, start, False, units.pop())
+
+
+def _extract_assignment(problem: str) -> Optional[Assignment]:
+    costs, units, uniform = {}, set(), {}
+    for sentence in _sentences(problem):
+        subject = _SUBJECT.match(sentence)
+        if subject is None:
+            continue
+        is_task, name = subject.group(1) is not None, subject.group(2)
+        everyone = _UNIFORM_COST.search(sentence)
+        if everyone and not is_task:
+            uniform[name] = _number(everyone.group(1))
+            units.add(_unit(everyone.group(2)))
+            continue
+        for amount, unit, other in _ASSIGNMENT_COST.findall(sentence):
+            worker, task = (other, name) if is_task else (name, other)
+            costs.setdefault(worker, {})[task] = _number(amount)
+            units.add(_unit(unit))
+    tasks = {task for row in costs.values() for task in row}
+    for worker, amount in uniform.items():
+        costs[worker] = {task: amount for task in tasks}
+    if len(costs) < 2 or len(units) != 1 or len(tasks) < 2 or len(costs) > PLANNING_MAX_ITEMS:
+        return None
+    if any(set(row) != tasks for row in costs.values()):
+        return None  # Incomplete cost table
+    minimize = 'longest' if _PARALLEL.search(problem) and not re.search(r'\btotal\b', problem) else 'total'
+    return Assignment(costs, minimize, units.pop())
+
+
+@lru_cache(maxsize=1024)
+def extract_model(problem: str):
+    """
+    Planning model of a problem from its wording, or None
+
+    Conservative by design: a problem mentioning any rule the models cannot
+    express (breaks, calendars, clock times, rates, ...) is left to the LLM.
+    """
+    if _UNMODELLED.search(problem):
+        return None
+    return _extract_assignment(problem) or _extract_route(problem) or _extract_schedule(problem)
+
+
+def _fractions(values) -> Optional[Dict[str, Fraction]]:
+    try:
+        return {str(name): Fraction(str(value)) for name, value in values if value is not None}
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def model_from_extraction(data: Dict):
+    """Planning model from an LLM extraction (see EXTRACTION_PROMPT), or None"""
+    kind, unit = data.get('kind'), _unit(str(data.get('unit') or '')) or data.get('unit')
+    try:
+        if kind == 'schedule':
+            tasks = data.get('tasks') or []
+            durations = _fractions((task['name'], task['duration']) for task in tasks)
+            if not durations or len(durations) < 2 or len(durations) > PLANNING_MAX_ITEMS:
+                return None
+            after = {str(task['name']): {str(name) for name in task.get('after') or []} for task in tasks}
+            if any(not names <= set(durations) for names in after.values()):
+                return None
+            deadlines = _fractions((task['name'], task.get('deadline')) for task in tasks)
+            penalties = _fractions((task['name'], task.get('penalty')) for task in tasks)
+            workers = data.get('workers')
+            workers = int(workers) if workers else None
+            if deadlines and workers != 1:
+                return None
+            return Schedule(durations, after, workers, deadlines, penalties, unit)
+        if kind == 'route':
+            distances = {frozenset((str(a), str(b))): Fraction(str(d)) for a, b, d in data.get('distances') or []}
+            route = Route(distances, data.get('start') or None, bool(data.get('return_to_start')), unit)
+            if len(route.places) < 3 or len(route.places) > PLANNING_MAX_ITEMS:
+                return None
+            return route
+        if kind == 'assignment':
+            costs = {}
+            for worker, task, cost in data.get('costs') or []:
+                costs.setdefault(str(worker), {})[str(task)] = Fraction(str(cost))
+            if len(costs) < 2 or len(costs) > PLANNING_MAX_ITEMS:
+                return None
+            return Assignment(costs, 'longest' if data.get('minimize') == 'longest' else 'total', unit)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    return None
+
+
+class PlanningEngine:
+    """Local engine for the planning category (see engines.py for the protocol)"""
+
+    name = 'planning'
+
+    def extract(self, problem: str):
+        return extract_model(problem)
+
+    def extraction_messages(self, problem: str) -> List:
+        return [HumanMessage(content=EXTRACTION_PROMPT.format(problem=problem))]
+
+    def model_from_extraction(self, data: Dict):
+        return model_from_extraction(data)
+
+    def answer(self, model, options: Dict[str, str]) -> EngineOutcome:
+        best = model.optimum()
+        if best is None:
+            return EngineOutcome(None, 'unsolvable')
+        number, reason = choose_option(options, lambda text: model.judge(text, best))
+        reasoning = model.explain(best)
+        if reason == 'catch_all':
+            reasoning += " None of the listed options achieves it."
+        return EngineOutcome(number, reason, reasoning)
+
+
+def main():
+    """Offline report of rules extraction on a labelled CSV (no LLM calls)"""
+    parser = argparse.ArgumentParser(description='Report how often the planning solver answers locally')
+    parser.add_argument('--data', type=str, default=TRAIN_FILE, help='Labelled CSV file')
+    args = parser.parse_args()
+    print_engine_report(PlanningEngine.name, engine_report(PlanningEngine(), rows_from_csv(args.data, CATEGORY)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Sampling profiler
+Statistical stack sampling of every thread, written as collapsed stacks
+(flamegraph.pl / speedscope) or speedscope JSON, plus per-stage CPU breakdowns
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from config import PROFILE_INTERVAL
+
+# Leaf frames of threads parked waiting for work, excluded unless include_idle is set
+_IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every thread at a fixed interval
+
+    Runs in a background thread, so it can be attached to a live server or
+    batch run. Each sample counts one interval of wall time for its stack.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self._counts = Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self.duration = 0.0
+
+    def start(self, duration: Optional[float] = None) -> 'SamplingProfiler':
+        """Start sampling; stops by itself after ``duration`` seconds if given"""
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> 'SamplingProfiler':
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _run(self, duration: Optional[float]):
+        own_id = threading.get_ident()
+        deadline = None if duration is None else self._started_at + duration
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self._counts[(names.get(thread_id, str(thread_id)), stack)] += 1
+            self.samples += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        self.duration = time.perf_counter() - self._started_at
+
+    def _stack(self, frame) -> Optional[Tuple]:
+        """Root-first tuple of code objects, or None for an idle thread"""
+        code = frame.f_code
+        if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+            return None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code not in self._labels:
+                self._labels[code] = _frame_label(code)
+            stack.append(code)
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def collapsed(self) -> str:
+        """Collapsed-stack text: ``thread;frame;...;leaf count`` per line"""
+        lines = []
+        for (thread_name, stack), count in self._counts.most_common():
+            frames = ';'.join(self._labels[code] for code in stack)
+            lines.append(f"{thread_name};{frames} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name: str = 'hydra') -> Dict:
+        """Speedscope 'sampled' profile with one profile per thread"""
+        frame_index = {}
+        frames = []
+        by_thread = defaultdict(lambda: ([], []))
+        for (thread_name, stack), count in self._counts.items():
+            indices = []
+            for code in stack:
+                if code not in frame_index:
+                    frame_index[code] = len(frames)
+                    frames.append({'name': code.co_name, 'file': code.co_filename,
+                                   'line': code.co_firstlineno})
+                indices.append(frame_index[code])
+            samples, weights = by_thread[thread_name]
+            samples.append(indices)
+            weights.append(count * self.interval)
+
+        profiles = [{
+            'type': 'sampled',
+            'name': thread_name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        } for thread_name, (samples, weights) in sorted(by_thread.items())]
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'hydra-profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': profiles
+        }
+
+    def write(self, path: str, fmt: Optional[str] = None) -> str:
+        """
+        Write the profile; ``fmt`` is 'collapsed' or 'speedscope'
+        (inferred from a .json extension when omitted)
+
+        Returns:
+            The path written
+        """
+        fmt = fmt or ('speedscope' if path.endswith('.json') else 'collapsed')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            if fmt == 'speedscope':
+                json.dump(self.speedscope(os.path.basename(path)), f)
+            elif fmt == 'collapsed':
+                f.write(self.collapsed())
+            else:
+                raise ValueError(f"Unknown profile format: {fmt}")
+        return path
+
+
+class StageBreakdown:
+    """Span exporter that aggregates wall and thread-CPU time per span name"""
+
+    def __init__(self):
+        self._stats = defaultdict(lambda: {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0})
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            stats = self._stats[span.name]
+            stats['calls'] += 1
+            stats['wall_ms'] += (span.end_ns - span.start_ns) / 1e6
+            stats['cpu_ms'] += span.attributes.get('thread.cpu_ms', 0.0)
+
+    def flush(self):
+        pass
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+@contextmanager
+def collect_stages(tracer):
+    """Temporarily trace every request into a StageBreakdown"""
+    breakdown = StageBreakdown()
+    saved = tracer.enabled, tracer.sample_rate, tracer.exporter
+    tracer.enabled, tracer.sample_rate, tracer.exporter = True, 1.0, breakdown
+    try:
+        yield breakdown
+    finally:
+        tracer.enabled, tracer.sample_rate, tracer.exporter = saved
@@ -5,23 +5,211 @@ Category-specific agents with chain-of-thought reasoning
 
 import re
 import json
-from typing import Dict, Optional
-from langchain_openai import ChatOpenAI
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from config import (
-    OPENAI_API_KEY, GPT_MODEL,
-    TEMPERATURE, CATEGORY_PROMPTS
+    CATEGORY_PROMPTS, GPT_MODEL,
+    COMPACT_REASONING, COMPACT_MAX_TOKENS, RESPONSE_END_MARKER, BUDGET_MIN_COMPLETION_TOKENS,
+    STRUCTURED_OUTPUT, STRUCTURED_EARLY_STOP, REPAIR_MAX_TOKENS,
+    HEDGE_REQUESTS, HEDGE_PERCENTILE, OPTION_FILTER, PACK_MAX_SIZE, PACK_TOKEN_LIMIT,
+    LOCAL_ENGINES, ENGINE_LLM_EXTRACTION, ENGINE_CONFIDENCE, ENGINE_EXTRACT_MAX_TOKENS,
+    SHORT_ANSWER_MAX_TOKENS
 )
+from engines import EXTRACTION_RESPONSE_FORMAT, EngineOutcome, engine_metrics, parse_extraction
+from hedging import LatencyTracker, run_hedged, hedge_metrics
+from llm_router import BackendRegistry, registry_key
+from logic_solver import LogicEngine
+from option_filter import OptionAnalysis, analyze_options, option_filter_metrics
+from planning_solver import PlanningEngine
+from records import ReasoningResult
+from spatial_solver import SpatialEngine
+from token_budget import (
+    compact_text, count_tokens, count_message_tokens, get_max_tokens, usage_from_response
+)
+from tracing import tracer
+from usage_ledger import UsageBudget, charging, record_call, usage_ledger
+from structured_output import (
+    RESPONSE_FORMAT, REPAIR_RESPONSE_FORMAT, STRUCTURED_FORMAT_INSTRUCTIONS,
+    StreamingAnswerParser, extract_answer_fields, build_repair_prompt
+)
+
+# Structured output instructions appended to every category prompt
+FORMAT_INSTRUCTIONS = f"""
+Think step-by-step and provide:
+1. Your detailed reasoning
+2. The correct answer (1-5)
+3. Your confidence (0.0-1.0)
+
+Format your response as:
+REASONING: [your detailed reasoning]
+ANSWER: [option number 1-5]
+CONFIDENCE: [0.0-1.0]
+{RESPONSE_END_MARKER}
+"""
+
+COMPACT_FORMAT_INSTRUCTIONS = f"""
+Work it out, but write only the key steps (at most 5 short lines).
+
+Format your response as:
+REASONING: [key steps only]
+ANSWER: [option number 1-5]
+CONFIDENCE: [0.0-1.0]
+{RESPONSE_END_MARKER}
+"""
+
+
+# Response fields; the exact-case labels the prompt asks for are tried first,
+# since a literal search is much cheaper than a case-insensitive one
+_REASONING_LABELS = (re.compile(r'REASONING:\s*'), re.compile(r'REASONING:\s*', re.IGNORECASE))
+_ANSWER_LABELS = (re.compile(r'ANSWER:'), re.compile(r'ANSWER:', re.IGNORECASE))
+_ANSWER_FIELDS = (re.compile(r'ANSWER:\s*(\d)'), re.compile(r'ANSWER:\s*(\d)', re.IGNORECASE))
+_CONFIDENCE_FIELDS = (re.compile(r'CONFIDENCE:\s*([0-9.]+)'),
+                      re.compile(r'CONFIDENCE:\s*([0-9.]+)', re.IGNORECASE))
+_LAST_OPTION_NUMBER = re.compile(r'.*\b([1-5])\b', re.DOTALL)  # Greedy: scans back from the end
+
+# Local solver engines tried before the LLM, by category (see engines.py)
+ENGINES = {
+    "Optimization of actions and planning": PlanningEngine,
+    "Logical traps": LogicEngine,
+    "Spatial reasoning": SpatialEngine
+}
+
+# Agents (and the backend registry they route through) are shared by every
+# system built with the same settings; their only state is latency tracking.
+# Both are rebuilt once the transport is reconfigured or the backend specs change
+_shared_backends = None
+_shared_agents = {}
+_shared_lock = threading.Lock()
+
+
+def _search(patterns, text: str, pos: int = 0):
+    """First match of the exact-case pattern, else of its case-insensitive twin"""
+    for pattern in patterns:
+        match = pattern.search(text, pos)
+        if match is not None:
+            return match
+    return None
+
+
+# Prompt used when the option pre-filter has narrowed a problem to a short list
+SHORTLIST_PROMPT = """A quick check has narrowed this problem down to a few options.
+
+Problem: {problem}
+
+Remaining Options:
+{options}
+
+{hint}Verify this against the problem and select the correct option by its number.
+"""
+
+# Background re-check of a returned low-confidence answer (see verification.py)
+VERIFY_PROMPT = """A first pass proposed an answer to this problem. Check it.
+
+Problem: {problem}
+
+Answer Options:
+1. {option_1}
+2. {option_2}
+3. {option_3}
+4. {option_4}
+5. {option_5}
+
+Proposed answer: {answer}
+Proposed reasoning: {reasoning}
+
+Re-derive the result independently. Keep the proposed option if it holds up, otherwise select the correct one.
+"""
+_VERIFY_REASONING_CHARS = 1500  # Proposed reasoning is cut to this length in the verifier prompt
+
+# Answer-only output for the short tier under load (see load_shedding.py)
+SHORT_ANSWER_INSTRUCTIONS = """
+Reply with only JSON: {"answer": <option number 1-5>, "confidence": <0.0-1.0>}"""
+
+# Packed solves: the category strategy once, then each problem under its own [P<n>] label
+PACK_HEADER = "\n{count} problems follow. Solve each one independently.\n"
+
+PACK_ITEM = """
+[P{number}]
+Problem: {problem}
+
+Answer Options:
+1. {option_1}
+2. {option_2}
+3. {option_3}
+4. {option_4}
+5. {option_5}
+"""
+
+_PACKED_FORMAT = """
+Answer every problem, in order, with one block per problem:
+[P1]
+REASONING: [{reasoning}]
+ANSWER: [option number 1-5]
+CONFIDENCE: [0.0-1.0]
+[P2]
+...
+After the last block, write {end} on its own line.
+"""
+PACKED_FORMAT_INSTRUCTIONS = {
+    False: _PACKED_FORMAT.format(reasoning='your reasoning', end=RESPONSE_END_MARKER),
+    True: _PACKED_FORMAT.format(reasoning='key steps only', end=RESPONSE_END_MARKER)
+}
+_PACK_LABEL = re.compile(r'^\s*\[P(\d+)\]', re.MULTILINE)
+
+
+def _pack_strategy(template: str) -> str:
+    """Category prompt without its problem and options block (the part a pack shares)"""
+    head, _, rest = template.partition('Problem: {problem}')
+    tail = rest.partition('{option_5}')[2]
+    return f"{head.strip()}\n\n{tail.strip()}\n"
+
+
+def _usage_share(usage: Dict, count: int) -> Dict:
+    """One problem's share of a packed call's token usage and cost"""
+    return {key: value / count if isinstance(value, (int, float)) else value
+            for key, value in usage.items()}
+
+
+def _affords(budget: Optional[UsageBudget], messages, max_tokens: int) -> bool:
+    """Whether a call with this prompt and completion cap stays within the budget's limits"""
+    if budget is None or not budget.limited:
+        return True
+    affordable = budget.affordable_completion_tokens(count_message_tokens(messages), GPT_MODEL)
+    return affordable is None or affordable >= max_tokens
 
 
 class SpecializedReasoningAgent:
     """A specialized reasoning agent for a specific problem category"""
     
-    def __init__(self, category: str, llm):
+    def __init__(self, category: str, llm, compact: bool = COMPACT_REASONING,
+                 structured: bool = STRUCTURED_OUTPUT, hedge: bool = HEDGE_REQUESTS,
+                 option_filter: bool = OPTION_FILTER, engine=None,
+                 llm_extraction: bool = ENGINE_LLM_EXTRACTION):
         self.category = category
         self.llm = llm
+        self.compact = compact
+        self.structured = structured
+        self.hedge = hedge
+        self.option_filter = option_filter
+        self.engine = engine  # Local solver tried before the LLM (None = always the LLM)
+        self.llm_extraction = llm_extraction
+        self.latency_tracker = LatencyTracker()
         self.prompt_template = CATEGORY_PROMPTS.get(category, self._get_general_prompt())
+        self.max_tokens = get_max_tokens(category, compact)
+        
+        # Static message parts, built once instead of on every solve
+        self._system_message = SystemMessage(content=f"You are an expert in {category}.")
+        if structured:
+            self._format_instructions = {False: STRUCTURED_FORMAT_INSTRUCTIONS,
+                                         True: STRUCTURED_FORMAT_INSTRUCTIONS}
+        else:
+            self._format_instructions = {False: FORMAT_INSTRUCTIONS, True: COMPACT_FORMAT_INSTRUCTIONS}
+        self._pack_strategy = _pack_strategy(self.prompt_template)
+        self.pack_size = PACK_MAX_SIZE
+        self._pack_lock = threading.Lock()
     
     def _get_general_prompt(self):
         """Fallback general reasoning prompt"""
@@ -39,66 +227,588 @@ Answer Options:
 Solve this step-by-step and select the correct option (1-5).
 """
     
-    def solve(self, problem: str, options: Dict[str, str]) -> Dict:
+    def solve(self, problem: str, options: Dict[str, str],
+              budget: Optional[UsageBudget] = None, tier: str = 'full') -> ReasoningResult:
         """
         Solve a reasoning problem
         
         Args:
             problem: The problem statement
             options: Dictionary with keys 'option_1' through 'option_5'
+            budget: Spending scope to charge; when its limits are close the agent
+                switches to the compact prompt with a tighter cap and no hedging
+            tier: Service tier under load ('full', 'short' or 'local'); below
+                'full', a problem the engine cannot answer gets an answer-only
+                call ('short') or no LLM call at all ('local')
+        
+        Returns:
+            ReasoningResult with reasoning and answer
+        """
+        with tracer.span('agent.solve', {'reasoning.category': self.category, 'load.tier': tier}) as span, \
+                charging(budget, self.category):
+            if self.engine is not None:
+                result = self._solve_with_engine(problem, options, budget)
+                if result is not None:
+                    span.set_attribute('reasoning.parse_method', result.parse_method)
+                    return result
+            
+            if tier == 'local':
+                return self.fallback(problem, options, 'service overloaded, no LLM call made')
+            if tier == 'short':
+                result = self._short_answer(problem, options, budget)
+                if result is None:
+                    return self._budget_fallback(problem, options, budget)
+                span.set_attribute('reasoning.parse_method', result.parse_method)
+                return result
+            
+            analysis = None
+            if self.option_filter:
+                with tracer.span('option_filter') as filter_span:
+                    analysis = analyze_options(problem, options)
+                    filter_span.set_attributes({
+                        'option_filter.candidates': len(analysis.candidates),
+                        'option_filter.reason': analysis.reason or 'none'
+                    })
+            
+            with tracer.span('prompt') as prompt_span:
+                messages, max_tokens, degraded = self._prepare(problem, options, budget, analysis)
+                if messages is None:
+                    return self._budget_fallback(problem, options, budget)
+                prompt_span.set_attributes({
+                    'prompt.compact': self.compact or degraded,
+                    'prompt.shortlisted': analysis is not None and analysis.shortlisted,
+                    'llm.max_tokens': max_tokens,
+                    'budget.degraded': degraded
+                })
+            # A hedge is a second call: only when the budget has room for both
+            hedge = self.hedge and not degraded and _affords(budget, messages, 2 * max_tokens)
+            
+            start = time.perf_counter()
+            if hedge:
+                # Duplicate the request if it runs past this agent's tracked latency percentile
+                result = run_hedged(
+                    lambda cancel: self._attempt(messages, cancel, max_tokens, budget),
+                    self.latency_tracker, HEDGE_PERCENTILE,
+                    is_valid=lambda attempt: attempt.parse_method != 'fallback'
+                )
+            else:
+                result = self._attempt(messages, max_tokens=max_tokens, budget=budget)
+            
+            result.llm_latency_ms = (time.perf_counter() - start) * 1000
+            result.budget_degraded = degraded
+            result.option_shortlist = analysis.candidates if analysis and analysis.shortlisted else None
+            span.set_attributes({'hedge.enabled': hedge, 'reasoning.parse_method': result.parse_method})
+        return result
+    
+    def _solve_with_engine(self, problem: str, options: Dict[str, str],
+                           budget: Optional[UsageBudget] = None,
+                           llm_extraction: Optional[bool] = None) -> Optional[ReasoningResult]:
+        """
+        Answer from the category's local solver, or None to go on to the LLM
+        
+        The model comes from the engine's rules extractor or, when enabled, a
+        short LLM extraction call. Only a unique option match answers.
+        """
+        if llm_extraction is None:
+            llm_extraction = self.llm_extraction
+        start = time.perf_counter()
+        usage = None
+        with tracer.span('engine', {'engine.name': self.engine.name}) as engine_span:
+            model, extraction = self.engine.extract(problem), 'rules'
+            if model is None and llm_extraction and not (budget is not None and budget.exhausted):
+                model, usage = self._extract_model(problem, budget)
+                extraction = 'llm'
+            outcome = None
+            if model is not None:
+                try:
+                    outcome = self.engine.answer(model, options)
+                except Exception:
+                    outcome = EngineOutcome(None, 'error')  # A bad model must not fail the solve
+                if outcome.reason == 'catch_all' and extraction == 'llm':
+                    # An extracted model that matches no option more likely lost a rule
+                    outcome = EngineOutcome(None, 'unconfirmed', outcome.reasoning)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            engine_metrics.record(self.engine.name, outcome, extraction if model is not None else None, elapsed_ms)
+            engine_span.set_attributes({
+                'engine.extraction': extraction if model is not None else 'none',
+                'engine.outcome': outcome.reason if outcome is not None else 'not_extracted'
+            })
+        
+        if outcome is None or not outcome.answered:
+            return None
+        result = ReasoningResult(outcome.answer, ENGINE_CONFIDENCE, '', 'engine', self.category)
+        result.reasoning = outcome.reasoning
+        result.usage = usage
+        result.llm_latency_ms = elapsed_ms
+        return result
+    
+    def verify(self, problem: str, options: Dict[str, str],
+               result: ReasoningResult) -> Tuple[ReasoningResult, Optional[str]]:
+        """
+        Re-check an answer that was already returned (off the request path)
+        
+        The local engine gets the first try, with an LLM extraction call if its
+        rules found no model; otherwise a verifier prompt sees the proposed
+        answer and reasoning. Agreement confirms the answer (keeping the higher
+        confidence); a disagreement revises it when the check came from the
+        engine or is more confident than the original.
         
         Returns:
-            Dictionary with reasoning and answer
+            (verified result, 'engine' or 'llm' for the check that decided it)
         """
-        # Format the prompt
+        with tracer.span('agent.verify', {'reasoning.category': self.category}) as span, \
+                charging(None, self.category):
+            checked, method = None, None
+            if self.engine is not None:
+                checked, method = self._solve_with_engine(problem, options, llm_extraction=True), 'engine'
+            if checked is None:
+                answer = result.predicted_answer
+                prompt = VERIFY_PROMPT.format(
+                    problem=compact_text(problem),
+                    **{key: compact_text(value) for key, value in options.items()},
+                    answer=f"{answer}. {compact_text(options.get(f'option_{answer}', ''))}",
+                    reasoning=compact_text(result.reasoning)[:_VERIFY_REASONING_CHARS] or '(none)'
+                )
+                messages = self._build_messages(prompt, compact=True)
+                checked = self._attempt(messages, max_tokens=COMPACT_MAX_TOKENS, purpose='verify')
+                method = 'llm' if checked.parse_method != 'fallback' else None
+            
+            verified = result.copy()
+            if method is None:
+                verified.verification = 'unresolved'
+            elif checked.predicted_answer == result.predicted_answer:
+                verified.confidence = max(result.confidence, checked.confidence)
+                verified.verification = 'confirmed'
+            elif method == 'engine' or checked.confidence > result.confidence:
+                verified = checked
+                verified.category = result.category
+                verified.category_confidence = result.category_confidence
+                verified.verification = 'revised'
+            else:
+                verified.verification = 'unresolved'
+            span.set_attributes({'verify.method': method or 'none', 'verify.outcome': verified.verification})
+        return verified, method
+    
+    def _short_answer(self, problem: str, options: Dict[str, str],
+                      budget: Optional[UsageBudget] = None) -> Optional[ReasoningResult]:
+        """One answer-only call with a tiny completion cap (the short tier), or None if unaffordable"""
         prompt = self.prompt_template.format(
-            problem=problem,
-            **options
+            problem=compact_text(problem),
+            **{key: compact_text(value) for key, value in options.items()}
         )
+        messages = [self._system_message, HumanMessage(content=prompt + SHORT_ANSWER_INSTRUCTIONS)]
+        if not _affords(budget, messages, SHORT_ANSWER_MAX_TOKENS):
+            return None
+        start = time.perf_counter()
+        with tracer.span('llm', {'llm.max_tokens': SHORT_ANSWER_MAX_TOKENS, 'llm.short_answer': True}):
+            response = self.llm.invoke(
+                messages,
+                max_tokens=SHORT_ANSWER_MAX_TOKENS,
+                response_format=REPAIR_RESPONSE_FORMAT
+            )
+        usage = usage_from_response(response, messages, response.content)
+        self._record_usage(usage, start, budget, 'short')
         
-        # Add structured output instructions
-        full_prompt = f"""{prompt}
-
-Think step-by-step and provide:
-1. Your detailed reasoning
-2. The correct answer (1-5)
-3. Your confidence (0.0-1.0)
-
-Format your response as:
-REASONING: [your detailed reasoning]
-ANSWER: [option number 1-5]
-CONFIDENCE: [0.0-1.0]
-"""
+        fields = extract_answer_fields(response.content)
+        if fields is not None:
+            result = ReasoningResult(fields['answer'], fields['confidence'], response.content,
+                                     'short', self.category)
+            result.reasoning = "Short answer given while the service is under load (no reasoning generated)"
+        else:
+            result = self._parse_response(response.content)
+        result.usage = usage
+        result.llm_latency_ms = (time.perf_counter() - start) * 1000
+        result.degraded = 'short'
+        return result
+    
+    def fallback(self, problem: str, options: Dict[str, str], reason: str) -> ReasoningResult:
+        """
+        Answer without the LLM, for the local tier or a solve whose LLM call failed
+        
+        The option pre-filter's candidates are the only evidence: a single
+        remaining candidate is taken with moderate confidence, otherwise the
+        candidate with the best cheap score (option 3 on ties) with low confidence.
+        """
+        analysis = analyze_options(problem, options)
+        candidates = analysis.candidates or [3]
+        answer = analysis.best()
+        result = ReasoningResult(answer, 0.5 / len(candidates), '', 'fallback', self.category)
+        if len(candidates) == 1:
+            found = f"the option pre-filter left only this option ({analysis.reason or 'no check'})"
+        else:
+            found = f"{len(candidates)} options remain after the option pre-filter"
+        result.reasoning = f"Degraded answer ({reason}): {found}"
+        result.degraded = 'fallback'
+        return result
+    
+    def _budget_fallback(self, problem: str, options: Dict[str, str], budget: UsageBudget) -> ReasoningResult:
+        """Fallback answer for a solve its budget cannot pay for (no LLM call is made)"""
+        budget.note_degraded()
+        result = self.fallback(problem, options, 'budget exhausted, no LLM call made')
+        result.budget_degraded = True
+        return result
+    
+    def _extract_model(self, problem: str, budget: Optional[UsageBudget] = None):
+        """One short LLM call that turns the problem into the engine's model"""
+        messages = self.engine.extraction_messages(problem)
+        if not _affords(budget, messages, ENGINE_EXTRACT_MAX_TOKENS):
+            return None, None
+        start = time.perf_counter()
+        try:
+            response = self.llm.invoke(
+                messages,
+                max_tokens=ENGINE_EXTRACT_MAX_TOKENS,
+                response_format=EXTRACTION_RESPONSE_FORMAT
+            )
+        except Exception:
+            return None, None
+        usage = usage_from_response(response, messages, response.content)
+        self._record_usage(usage, start, budget, 'extract')
+        data = parse_extraction(response.content)
+        return (self.engine.model_from_extraction(data) if data is not None else None), usage
+    
+    def _prepare(self, problem: str, options: Dict[str, str], budget: Optional[UsageBudget],
+                 analysis: Optional[OptionAnalysis] = None):
+        """
+        Build the messages and completion cap for a solve
+        
+        A problem the option pre-filter has shortlisted gets the short
+        "choose between" prompt with the compact output format. When the budget
+        cannot afford the normal call, the compact prompt and a cap that fits
+        the remaining budget are used instead (a cheaper path). When it cannot
+        afford even ``BUDGET_MIN_COMPLETION_TOKENS`` on top of that prompt, no
+        call is made and messages is None.
+        
+        Returns:
+            (messages, max_tokens, degraded)
+        """
+        # Format the prompt (redundant whitespace and escapes stripped)
+        prompt = self.prompt_template.format(
+            problem=compact_text(problem),
+            **{key: compact_text(value) for key, value in options.items()}
+        )
+        messages = self._build_messages(prompt, self.compact)
+        max_tokens = self.max_tokens
+        
+        if analysis is not None and analysis.shortlisted:
+            full_tokens = count_message_tokens(messages)
+            prompt = self._shortlist_prompt(problem, options, analysis)
+            messages = self._build_messages(prompt, compact=True)
+            max_tokens = min(max_tokens, COMPACT_MAX_TOKENS)
+            option_filter_metrics.record(analysis, full_tokens, count_message_tokens(messages))
+        elif analysis is not None:
+            option_filter_metrics.record(analysis)
+        
+        if budget is None or not budget.limited:
+            return messages, max_tokens, False
+        
+        prompt_tokens = count_message_tokens(messages)
+        affordable = budget.affordable_completion_tokens(prompt_tokens, GPT_MODEL)
+        if affordable is None or affordable >= max_tokens:
+            return messages, max_tokens, False
         
-        # Get response from LLM
-        messages = [
-            SystemMessage(content=f"You are an expert in {self.category}."),
-            HumanMessage(content=full_prompt)
+        messages = self._build_messages(prompt, compact=True)
+        prompt_tokens = count_message_tokens(messages)
+        affordable = budget.affordable_completion_tokens(prompt_tokens, GPT_MODEL)
+        if affordable < BUDGET_MIN_COMPLETION_TOKENS:
+            return None, 0, True
+        max_tokens = min(max_tokens, COMPACT_MAX_TOKENS, affordable)
+        budget.note_degraded()
+        return messages, max_tokens, True
+    
+    def _shortlist_prompt(self, problem: str, options: Dict[str, str], analysis: OptionAnalysis) -> str:
+        """Short prompt listing only the shortlisted options, under their original numbers"""
+        return SHORTLIST_PROMPT.format(
+            problem=compact_text(problem),
+            options='\n'.join(f"{number}. {compact_text(options[f'option_{number}'])}"
+                              for number in analysis.candidates),
+            hint=f"{analysis.hint}\n" if analysis.hint else ''
+        )
+    
+    def _build_messages(self, prompt: str, compact: bool):
+        """System and user messages with the output-format instructions appended"""
+        return [
+            self._system_message,
+            HumanMessage(content=prompt + self._format_instructions[compact])
         ]
+    
+    def plan_packs(self, items: List[Tuple[str, Dict[str, str]]]) -> List[List[int]]:
+        """
+        Group (problem, options) items into packs for ``solve_pack``
+        
+        Each problem costs its prompt block plus its own completion budget; a
+        pack closes at PACK_TOKEN_LIMIT or the current adaptive pack size.
+        Problems the option pre-filter shortlists keep their short single prompt,
+        and problems a local engine can model are solved alone so it can try them.
+        
+        Returns:
+            Lists of item indices
+        """
+        static = count_message_tokens(self._build_pack_messages([]))
+        packs, current, used = [], [], static
+        for index, (problem, options) in enumerate(items):
+            if self.engine is not None and self.engine.extract(problem) is not None:
+                packs.append([index])  # The engine may answer it without a call
+                continue
+            if self.option_filter and analyze_options(problem, options).shortlisted:
+                packs.append([index])
+                continue
+            cost = count_tokens(self._pack_item(len(current) + 1, problem, options)) + self.max_tokens
+            if current and (len(current) >= self.pack_size or used + cost > PACK_TOKEN_LIMIT):
+                packs.append(current)
+                current, used = [], static
+            current.append(index)
+            used += cost
+        if current:
+            packs.append(current)
+        return packs
+    
+    def solve_pack(self, items: List[Tuple[str, Dict[str, str]]],
+                   budget: Optional[UsageBudget] = None) -> List[ReasoningResult]:
+        """
+        Solve several problems of this category with one LLM call
+        
+        The strategy text and format block are sent once, followed by each
+        problem under a [P<n>] label. Each answer block is parsed on its own; a
+        problem whose block is missing or unparseable is re-solved alone. The
+        free-text format is used even with structured output, since the
+        response schema describes a single answer.
+        
+        Args:
+            items: (problem, options) pairs
+            budget: Spending scope to charge; a pack it cannot afford is solved
+                problem by problem (where the usual degradation applies)
+        
+        Returns:
+            One solution per item, in order
+        """
+        if len(items) == 1:
+            result = self.solve(*items[0], budget=budget)
+            self._resize_pack(clean=True)  # Lets a pack size that collapsed to 1 recover
+            return [result]
+        
+        with tracer.span('agent.solve_pack', {'reasoning.category': self.category,
+                                              'pack.size': len(items)}) as span, \
+                charging(budget, self.category):
+            messages = self._build_pack_messages(items)
+            max_tokens = self.max_tokens * len(items)
+            if budget is not None and budget.limited:
+                affordable = budget.affordable_completion_tokens(count_message_tokens(messages), GPT_MODEL)
+                if affordable is not None and affordable < max_tokens:
+                    span.set_attribute('pack.unpacked', True)
+                    return [self.solve(problem, options, budget=budget) for problem, options in items]
+            
+            start = time.perf_counter()
+            blocks, usage = {}, None
+            try:
+                with tracer.span('llm', {'llm.max_tokens': max_tokens}):
+                    response = self.llm.invoke(messages, max_tokens=max_tokens,
+                                               stop=[f"\n{RESPONSE_END_MARKER}"])
+                usage = usage_from_response(response, messages, response.content)
+                self._record_usage(usage, start, budget, 'pack')
+                blocks = self._split_pack(response.content)
+            except Exception as e:
+                span.set_attribute('pack.error', str(e))
+            latency_ms = (time.perf_counter() - start) * 1000
+            
+            results, retried = [], 0
+            for number, (problem, options) in enumerate(items, 1):
+                result = self._parse_response(blocks[number]) if number in blocks else None
+                if result is None or result.parse_method == 'fallback':
+                    retried += 1
+                    results.append(self.solve(problem, options, budget=budget))
+                    continue
+                result.llm_latency_ms = latency_ms
+                result.usage = _usage_share(usage, len(items))
+                result.pack_size = len(items)
+                results.append(result)
+            
+            self._resize_pack(clean=retried == 0)
+            span.set_attributes({'pack.retried': retried, 'pack.next_size': self.pack_size})
+        return results
+    
+    def _pack_item(self, number: int, problem: str, options: Dict[str, str]) -> str:
+        return PACK_ITEM.format(number=number, problem=compact_text(problem),
+                                **{key: compact_text(value) for key, value in options.items()})
+    
+    def _build_pack_messages(self, items: List[Tuple[str, Dict[str, str]]]):
+        """System message plus one user message: strategy, labelled problems, format block"""
+        prompt = self._pack_strategy + PACK_HEADER.format(count=len(items)) + ''.join(
+            self._pack_item(number, problem, options)
+            for number, (problem, options) in enumerate(items, 1)
+        )
+        return [self._system_message, HumanMessage(content=prompt + PACKED_FORMAT_INSTRUCTIONS[self.compact])]
+    
+    @staticmethod
+    def _split_pack(response_text: str) -> Dict[int, str]:
+        """Answer block per [P<n>] label (the first block wins if a label repeats)"""
+        labels = list(_PACK_LABEL.finditer(response_text))
+        blocks = {}
+        for label, following in zip(labels, labels[1:] + [None]):
+            end = following.start() if following is not None else len(response_text)
+            blocks.setdefault(int(label.group(1)), response_text[label.end():end])
+        return blocks
+    
+    def _resize_pack(self, clean: bool):
+        """Halve the pack size after unparseable answers; grow it by one after a clean pack"""
+        with self._pack_lock:
+            if clean:
+                self.pack_size = min(self.pack_size + 1, PACK_MAX_SIZE)
+            else:
+                self.pack_size = max(1, self.pack_size // 2)
+    
+    def _record_usage(self, usage: Dict, start: float, budget: Optional[UsageBudget], purpose: str):
+        """Log one call to the usage ledger and charge it to the budget"""
+        record_call(usage, (time.perf_counter() - start) * 1000, purpose, (budget, self.category))
+    
+    def _attempt(self, messages, cancel: Optional[threading.Event] = None,
+                 max_tokens: Optional[int] = None, budget: Optional[UsageBudget] = None,
+                 purpose: str = 'solve') -> ReasoningResult:
+        """One LLM call plus parsing (and a repair call if parsing fails)"""
+        max_tokens = max_tokens or self.max_tokens
+        start = time.perf_counter()
+        with tracer.span('llm', {'llm.max_tokens': max_tokens, 'llm.structured': self.structured}) as llm_span:
+            if self.structured:
+                response, response_text, result = self._solve_structured(messages, cancel, max_tokens)
+            elif cancel is not None:
+                response = None
+                response_text = self._stream_text(messages, cancel, max_tokens=max_tokens,
+                                                  stop=[f"\n{RESPONSE_END_MARKER}"])
+            else:
+                # Get response from LLM (capped, and cut off right after the CONFIDENCE line)
+                response = self.llm.invoke(
+                    messages,
+                    max_tokens=max_tokens,
+                    stop=[f"\n{RESPONSE_END_MARKER}"]
+                )
+                response_text = response.content
+            
+            usage = usage_from_response(response, messages, response_text)
+            self._record_usage(usage, start, budget, purpose)
+            if llm_span.recording:
+                llm_span.set_attributes({
+                    'llm.model': usage['model'],
+                    'llm.backend': usage['backend'],
+                    'llm.usage.prompt_tokens': usage['prompt_tokens'],
+                    'llm.usage.cached_tokens': usage['cached_tokens'],
+                    'llm.usage.completion_tokens': usage['completion_tokens'],
+                    'llm.prompt_cache_hit': usage['cached_tokens'] > 0,
+                    'llm.cost_usd': usage['cost_usd']
+                })
         
-        response = self.llm.invoke(messages)
-        response_text = response.content
+        if not self.structured:
+            with tracer.span('parse') as parse_span:
+                result = self._parse_response(response_text)
+                parse_span.set_attribute('parse.method', result.parse_method)
+        
+        # A cheap, targeted repair call instead of guessing or re-running the problem
+        if (result.parse_method == 'fallback' and not (cancel and cancel.is_set())
+                and not (budget is not None and budget.exhausted)):
+            with tracer.span('repair'):
+                repaired = self._repair_answer(response_text, budget)
+            if repaired is not None:
+                result.predicted_answer = repaired['answer']
+                result.confidence = repaired['confidence']
+                result.parse_method = 'repair'
+        
+        result.usage = usage
+        return result
+    
+    def _stream_text(self, messages, cancel: threading.Event, **kwargs) -> str:
+        """
+        Streamed call for a hedged attempt
         
-        # Parse the response
-        return self._parse_response(response_text)
+        Once ``cancel`` is set (the attempt lost its race) the stream is closed,
+        which drops the connection so the backend stops generating; a plain
+        ``invoke`` could only be abandoned, and would run (and bill) to the end.
+        """
+        parts = []
+        stream = self.llm.stream(messages, **kwargs)
+        try:
+            for chunk in stream:
+                parts.append(chunk.content)
+                if cancel.is_set():
+                    break
+        finally:
+            stream.close()
+        return ''.join(parts)
     
-    def _parse_response(self, response_text: str) -> Dict:
+    def _solve_structured(self, messages, cancel: Optional[threading.Event] = None,
+                          max_tokens: Optional[int] = None):
+        """
+        Structured-output call with the answer fields emitted first
+        
+        With early stop enabled the response is streamed and the stream is closed
+        as soon as answer and confidence have arrived, leaving reasoning partial.
+        A hedged attempt (``cancel`` given) is always streamed, so losing stops it.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        kwargs = {'max_tokens': max_tokens, 'response_format': RESPONSE_FORMAT}
+        
+        if STRUCTURED_EARLY_STOP:
+            parser = StreamingAnswerParser(max_chars=max_tokens * 6)
+            stream = self.llm.stream(messages, **kwargs)
+            try:
+                for chunk in stream:
+                    if parser.feed(chunk.content) or parser.truncated:
+                        break
+                    if cancel is not None and cancel.is_set():
+                        break  # Lost a hedge race; stop generating
+            finally:
+                stream.close()
+            response, response_text = None, parser.text
+            fields = parser.result()
+        elif cancel is not None:
+            response, response_text = None, self._stream_text(messages, cancel, **kwargs)
+            fields = extract_answer_fields(response_text)
+        else:
+            response = self.llm.invoke(messages, **kwargs)
+            response_text = response.content
+            fields = extract_answer_fields(response_text)
+        
+        if fields is None:
+            return response, response_text, self._parse_response(response_text)
+        
+        result = ReasoningResult(fields['answer'], fields['confidence'], response_text,
+                                 'structured', self.category)
+        result.reasoning = fields['reasoning']
+        return response, response_text, result
+    
+    def _repair_answer(self, response_text: str,
+                       budget: Optional[UsageBudget] = None) -> Optional[Dict]:
+        """Ask for just the final answer of a response that could not be parsed"""
+        messages = [HumanMessage(content=build_repair_prompt(response_text))]
+        if not _affords(budget, messages, REPAIR_MAX_TOKENS):
+            return None
+        start = time.perf_counter()
+        try:
+            response = self.llm.invoke(
+                messages,
+                max_tokens=REPAIR_MAX_TOKENS,
+                response_format=REPAIR_RESPONSE_FORMAT
+            )
+        except Exception:
+            return None
+        self._record_usage(usage_from_response(response, messages, response.content),
+                           start, budget, 'repair')
+        return extract_answer_fields(response.content)
+    
+    def _parse_response(self, response_text: str) -> ReasoningResult:
         """Parse LLM response to extract answer and reasoning"""
         # Try to extract structured response
-        reasoning_match = re.search(r'REASONING:\s*(.+?)(?=ANSWER:|$)', response_text, re.DOTALL | re.IGNORECASE)
-        answer_match = re.search(r'ANSWER:\s*(\d)', response_text, re.IGNORECASE)
-        confidence_match = re.search(r'CONFIDENCE:\s*([0-9.]+)', response_text, re.IGNORECASE)
-        
-        # Extract values
-        reasoning = reasoning_match.group(1).strip() if reasoning_match else response_text
+        reasoning_match = _search(_REASONING_LABELS, response_text)
+        answer_match = _search(_ANSWER_FIELDS, response_text)
+        confidence_match = _search(_CONFIDENCE_FIELDS, response_text)
         
         # Extract answer
         if answer_match:
             answer = int(answer_match.group(1))
+            parse_method = 'regex'
         else:
-            # Fallback: look for any number 1-5
-            numbers = re.findall(r'\b([1-5])\b', response_text)
-            answer = int(numbers[-1]) if numbers else 3
+            # Last resort (used only if the repair call also fails): the last number 1-5
+            last_number = _LAST_OPTION_NUMBER.match(response_text)
+            answer = int(last_number.group(1)) if last_number else 3
+            parse_method = 'fallback'
         
         # Extract confidence
         if confidence_match:
@@ -106,42 +816,65 @@ CONFIDENCE: [0.0-1.0]
         else:
             confidence = 0.7  # Default confidence
         
-        return {
-            'problem_category': self.category,
-            'final_answer': answer,
-            'confidence': confidence,
-            'explanation': reasoning,  # Full reasoning without truncation
-            'raw_response': response_text
-        }
+        result = ReasoningResult(answer, confidence, response_text, parse_method, self.category)
+        
+        # Reasoning runs from its label up to the ANSWER label (a span of the
+        # response, not a copy); without a label it is the whole response
+        if reasoning_match:
+            end_match = _search(_ANSWER_LABELS, response_text, reasoning_match.end())
+            end = end_match.start() if end_match else len(response_text)
+            result.set_reasoning_span(reasoning_match.end(), end)
+        return result
 
 
 class MultiAgentReasoningSystem:
     """Coordinates multiple specialized agents"""
     
-    def __init__(self):
+    def __init__(self, compact: bool = COMPACT_REASONING, structured: bool = STRUCTURED_OUTPUT,
+                 hedge: bool = HEDGE_REQUESTS, option_filter: bool = OPTION_FILTER,
+                 engines: bool = LOCAL_ENGINES):
+        self.compact = compact
+        self.structured = structured
+        self.hedge = hedge
+        self.option_filter = option_filter
+        self.engines = engines
         self.llm = self._initialize_llm()
         self.agents = self._create_agents()
     
     def _initialize_llm(self):
-        """Initialize the language model"""
-        if OPENAI_API_KEY:
-            return ChatOpenAI(
-                model=GPT_MODEL,
-                temperature=TEMPERATURE,
-                api_key=OPENAI_API_KEY
-            )
-        else:
-            raise ValueError("No API key found. Set OPENAI_API_KEY in your .env file")
+        """Get the shared backend registry (current for the transport and specs) and return the default router"""
+        global _shared_backends
+        with _shared_lock:
+            if _shared_backends is None or _shared_backends.key != registry_key():
+                _shared_backends = BackendRegistry()
+                _shared_agents.clear()  # They route through the replaced registry
+            self.backends = _shared_backends
+        return self.backends.router_for(None)
     
     def _create_agents(self) -> Dict:
-        """Create specialized agents for each category"""
-        agents = {}
-        for category in CATEGORY_PROMPTS.keys():
-            agents[category] = SpecializedReasoningAgent(category, self.llm)
-        return agents
+        """
+        Specialized agents for each category, each on its category's router
+        
+        Created once per combination of settings and shared across systems.
+        """
+        key = (self.backends.key, self.compact, self.structured, self.hedge, self.option_filter, self.engines)
+        with _shared_lock:
+            if key not in _shared_agents:
+                _shared_agents[key] = {
+                    category: SpecializedReasoningAgent(
+                        category, self.backends.router_for(category),
+                        compact=self.compact, structured=self.structured, hedge=self.hedge,
+                        option_filter=self.option_filter,
+                        engine=ENGINES[category]() if self.engines and category in ENGINES else None
+                    )
+                    for category in CATEGORY_PROMPTS
+                }
+            return _shared_agents[key]
     
     def solve_problem(self, problem: str, options: Dict[str, str], 
-                     category: Optional[str] = None) -> Dict:
+                     category: Optional[str] = None,
+                     budget: Optional[UsageBudget] = None,
+                     tier: str = 'full') -> ReasoningResult:
         """
         Solve a problem using the appropriate specialized agent
         
@@ -149,22 +882,60 @@ class MultiAgentReasoningSystem:
             problem: Problem statement
             options: Answer options
             category: Known category (optional)
+            budget: Spending scope to charge (optional)
+            tier: Service tier under load (see SpecializedReasoningAgent.solve)
         
         Returns:
-            Solution dictionary
+            ReasoningResult (``agent_category`` names the agent used)
         """
-        # Get the appropriate agent
-        if category and category in self.agents:
-            agent = self.agents[category]
-        else:
-            # Use first agent as fallback
-            agent = list(self.agents.values())[0]
-        
-        # Solve the problem
-        solution = agent.solve(problem, options)
-        
-        # Add metadata
-        solution['category_used'] = agent.category
+        return self._agent_for(category).solve(problem, options, budget=budget, tier=tier)
+    
+    def solve_locally(self, problem: str, options: Dict[str, str],
+                      category: Optional[str] = None) -> Optional[ReasoningResult]:
+        """Engine answer with no LLM call at all, or None"""
+        agent = self._agent_for(category)
+        if agent.engine is None:
+            return None
+        return agent._solve_with_engine(problem, options, llm_extraction=False)
+    
+    def fallback_answer(self, problem: str, options: Dict[str, str], category: Optional[str],
+                        reason: str) -> ReasoningResult:
+        """Degraded answer without the LLM (see SpecializedReasoningAgent.fallback)"""
+        return self._agent_for(category).fallback(problem, options, reason)
+    
+    def verify_problem(self, problem: str, options: Dict[str, str], result: ReasoningResult,
+                       category: Optional[str] = None) -> Tuple[ReasoningResult, Optional[str]]:
+        """Re-check a returned answer with the category's agent (see SpecializedReasoningAgent.verify)"""
+        return self._agent_for(category).verify(problem, options, result)
+    
+    def plan_packs(self, items: List[Tuple[str, Dict[str, str]]],
+                   category: Optional[str] = None) -> List[List[int]]:
+        """Group same-category (problem, options) items into packs (indices into items)"""
+        return self._agent_for(category).plan_packs(items)
+    
+    def solve_pack(self, items: List[Tuple[str, Dict[str, str]]],
+                   category: Optional[str] = None,
+                   budget: Optional[UsageBudget] = None) -> List[ReasoningResult]:
+        """
+        Solve a pack of same-category problems with one LLM call
         
-        return solution
-
+        Returns:
+            Results in item order; items answered by the pack carry ``pack_size``
+        """
+        return self._agent_for(category).solve_pack(items, budget=budget)
+    
+    def _agent_for(self, category: Optional[str]) -> SpecializedReasoningAgent:
+        if category and category in self.agents:
+            return self.agents[category]
+        # Use first agent as fallback
+        return list(self.agents.values())[0]
+    
+    def metrics(self) -> Dict:
+        """Routing, hedging, option pre-filter, local engine and token/cost metrics for monitoring"""
+        return {
+            'routing': self.backends.snapshot(),
+            'hedging': hedge_metrics.snapshot(),
+            'option_filter': option_filter_metrics.snapshot(),
+            'engines': engine_metrics.snapshot(),
+            'usage': usage_ledger.totals()
+        }
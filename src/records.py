@@ -0,0 +1,152 @@
+"""
+Result records
+Slotted, typed prediction records passed from the agents through the pipeline,
+API and job runner, converted to dicts only at the output boundaries
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+from config import CATEGORY_PROMPTS
+
+# Category names are interned once; records hold a small integer id
+_category_names: List[str] = list(CATEGORY_PROMPTS) + ['Unknown']
+_category_ids: Dict[str, int] = {name: index for index, name in enumerate(_category_names)}
+_category_lock = threading.Lock()
+
+
+def category_id(name: Optional[str]) -> Optional[int]:
+    """Id of a category name, registering names not seen before"""
+    if name is None:
+        return None
+    index = _category_ids.get(name)
+    if index is None:
+        with _category_lock:
+            index = _category_ids.get(name)
+            if index is None:
+                index = len(_category_names)
+                _category_names.append(str(name))  # Classifier labels are numpy strings
+                _category_ids[_category_names[index]] = index
+    return index
+
+
+def category_name(index: Optional[int]) -> Optional[str]:
+    return _category_names[index] if index is not None else None
+
+
+def _strip_span(text: str, start: int, end: int):
+    """Bounds of text[start:end].strip() without building the substring"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class ReasoningResult:
+    """
+    One problem's prediction, from the agent's parse to the output writers
+
+    The reasoning is held as a span of ``raw_response``, so the response text is
+    stored once; reasoning from elsewhere (structured output, errors) is kept
+    as its own string. Categories are stored as interned ids.
+    """
+
+    __slots__ = ('predicted_answer', 'confidence', 'parse_method', 'raw_response',
+                 '_reasoning', '_reasoning_start', '_reasoning_end', '_category', '_agent_category',
+                 'category_confidence', 'usage', 'llm_latency_ms', 'budget_degraded',
+                 'option_shortlist', 'pack_size', 'row_index', 'error', 'verification', 'degraded')
+
+    def __init__(self, predicted_answer: Optional[int], confidence: float, raw_response: str = '',
+                 parse_method: Optional[str] = None, agent_category: Optional[str] = None):
+        self.predicted_answer = predicted_answer
+        self.confidence = confidence
+        self.parse_method = parse_method
+        self.raw_response = raw_response
+        self._reasoning = None
+        self._reasoning_start = 0
+        self._reasoning_end = len(raw_response)
+        self._category = None
+        self._agent_category = category_id(agent_category)  # Agent that solved it
+        self.category_confidence = 0.0
+        self.usage = None
+        self.llm_latency_ms = None
+        self.budget_degraded = False
+        self.option_shortlist = None
+        self.pack_size = None  # Set when answered by a packed call
+        self.row_index = None
+        self.error = None
+        self.verification = None  # 'pending', then 'confirmed', 'revised' or 'unresolved'
+        self.degraded = None  # Under load: 'near_duplicate', 'short' or 'fallback' (see load_shedding.py)
+
+    @classmethod
+    def failed(cls, error: str, row_index: Optional[int] = None) -> 'ReasoningResult':
+        """Default prediction for a problem that could not be solved"""
+        result = cls(3, 0.3, parse_method=None, agent_category=None)
+        result.reasoning = f'Error: {error}'
+        result.category = 'Unknown'
+        result.row_index = row_index
+        result.error = error
+        return result
+
+    def copy(self) -> 'ReasoningResult':
+        """Shallow copy (the response text and usage dict are shared)"""
+        result = ReasoningResult.__new__(ReasoningResult)
+        for name in self.__slots__:
+            setattr(result, name, getattr(self, name))
+        return result
+
+    def set_reasoning_span(self, start: int, end: int):
+        """Use raw_response[start:end], stripped, as the reasoning (empty = whole response)"""
+        start, end = _strip_span(self.raw_response, start, end)
+        if start == end:
+            start, end = 0, len(self.raw_response)
+        self._reasoning, self._reasoning_start, self._reasoning_end = None, start, end
+
+    @property
+    def reasoning(self) -> str:
+        if self._reasoning is not None:
+            return self._reasoning
+        return self.raw_response[self._reasoning_start:self._reasoning_end]
+
+    @reasoning.setter
+    def reasoning(self, text: str):
+        self._reasoning = text
+
+    @property
+    def category(self) -> Optional[str]:
+        return category_name(self._category)
+
+    @category.setter
+    def category(self, name: Optional[str]):
+        self._category = category_id(name)
+
+    @property
+    def agent_category(self) -> Optional[str]:
+        return category_name(self._agent_category)
+
+    def to_dict(self) -> Dict:
+        """Plain dict for JSON output (the detailed JSONL schema)"""
+        record = {
+            'predicted_answer': self.predicted_answer,
+            'confidence': self.confidence,
+            'reasoning': self.reasoning,
+            'category': self.category,
+            'category_confidence': self.category_confidence,
+            'raw_response': self.raw_response,
+            'usage': self.usage,
+            'llm_latency_ms': self.llm_latency_ms,
+            'parse_method': self.parse_method,
+            'budget_degraded': self.budget_degraded,
+            'option_shortlist': self.option_shortlist,
+            'pack_size': self.pack_size
+        }
+        if self.row_index is not None:
+            record['row_index'] = self.row_index
+        if self.error is not None:
+            record['error'] = self.error
+        if self.verification is not None:
+            record['verification'] = self.verification
+        if self.degraded is not None:
+            record['degraded'] = self.degraded
+        return record
@@ -0,0 +1,183 @@
+"""
+Streaming result output
+Writes detailed per-row results as (optionally gzip-compressed) JSONL and reads them back
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
+
+RAW_RESPONSE_MODES = ('inline', 'drop', 'blob')
+
+
+def _dumps(record: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(record, default=str).encode('utf-8')
+
+
+def _loads(line: bytes) -> Dict:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _is_gzip(path: str) -> bool:
+    return path.endswith('.gz')
+
+
+def blob_path_for(path: str) -> str:
+    """Sidecar blob file used for content-addressed raw responses"""
+    base = path[:-3] if _is_gzip(path) else path
+    return os.path.splitext(base)[0] + '.blobs'
+
+
+class ResultWriter:
+    """
+    Appends one JSON object per result to a JSONL file as results arrive
+
+    Nothing is buffered beyond the OS file buffer, so memory use is constant per
+    row and the file is readable while a run is still in progress.
+    """
+
+    def __init__(self, path: str, compress: Optional[bool] = None,
+                 raw_response: str = 'inline'):
+        """
+        Args:
+            path: Output path; a '.gz' suffix enables compression by default
+            compress: Force gzip compression on or off; the '.gz' suffix is
+                added or removed to match, since readers go by the suffix
+            raw_response: 'inline' keeps raw LLM text in each record, 'drop' omits
+                it, 'blob' stores it once per unique text in a sidecar blob file
+        """
+        if raw_response not in RAW_RESPONSE_MODES:
+            raise ValueError(f"raw_response must be one of {RAW_RESPONSE_MODES}")
+
+        if compress is None:
+            compress = _is_gzip(path)
+        if compress and not _is_gzip(path):
+            path += '.gz'
+        elif not compress and _is_gzip(path):
+            path = path[:-len('.gz')]
+
+        self.path = path
+        self.compress = compress
+        self.raw_response = raw_response
+        self.rows_written = 0
+
+        self._file = gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')
+        self._blob_file = None
+        self._blob_offsets = {}
+        if raw_response == 'blob':
+            self.blob_path = blob_path_for(path)
+            self._blob_file = open(self.blob_path, 'wb')
+
+    def _store_blob(self, text: str) -> Dict:
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        location = self._blob_offsets.get(digest)
+        if location is None:
+            payload = zlib.compress(data) if self.compress else data
+            location = (self._blob_file.tell(), len(payload))
+            self._blob_file.write(payload)
+            self._blob_offsets[digest] = location
+        return {'sha256': digest, 'offset': location[0], 'length': location[1]}
+
+    def write(self, result):
+        """Write a single result (a dict or a ReasoningResult)"""
+        if not isinstance(result, dict):
+            result = result.to_dict()
+        raw = result.get('raw_response')
+        if raw is not None and self.raw_response != 'inline':
+            result = {k: v for k, v in result.items() if k != 'raw_response'}
+            if self.raw_response == 'blob':
+                result['raw_response_ref'] = self._store_blob(raw)
+
+        self._file.write(_dumps(result) + b'\n')
+        self.rows_written += 1
+
+    def flush(self):
+        """Make everything written so far visible to readers (and decodable, when compressed)"""
+        if self.compress:
+            self._file.flush(zlib.Z_FULL_FLUSH)
+        else:
+            self._file.flush()
+        if self._blob_file is not None:
+            self._blob_file.flush()
+
+    def close(self):
+        self._file.close()
+        if self._blob_file is not None:
+            self._blob_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _complete_lines(f) -> Iterator[bytes]:
+    """Newline-terminated lines of f, stopping at a truncated line or gzip stream"""
+    try:
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            yield line
+    except (EOFError, gzip.BadGzipFile):
+        return  # Compressed stream without its end marker: the writer is still open
+
+
+def iter_results(path: str, fields: Optional[List[str]] = None,
+                 resolve_raw: bool = False) -> Iterator[Dict]:
+    """
+    Stream result records back from a (possibly compressed) JSONL file
+
+    A truncated final line, as left by a run that is still in progress, is
+    skipped; so is the unterminated tail of a gzip file that is still being
+    written (everything up to the writer's last ``flush`` is read).
+
+    Args:
+        path: JSONL or JSONL.gz path written by ResultWriter
+        fields: If given, only these keys are kept in each record
+        resolve_raw: If True, blob references are replaced by the raw response text
+    """
+    opener = gzip.open if _is_gzip(path) else open
+    blob_file = None
+    if resolve_raw and os.path.exists(blob_path_for(path)):
+        blob_file = open(blob_path_for(path), 'rb')
+
+    try:
+        with opener(path, 'rb') as f:
+            for line in _complete_lines(f):
+                record = _loads(line)
+
+                ref = record.get('raw_response_ref')
+                if blob_file is not None and ref is not None:
+                    blob_file.seek(ref['offset'])
+                    payload = blob_file.read(ref['length'])
+                    if _is_gzip(path):
+                        payload = zlib.decompress(payload)
+                    record['raw_response'] = payload.decode('utf-8')
+                    del record['raw_response_ref']
+
+                if fields is not None:
+                    record = {k: record.get(k) for k in fields}
+                yield record
+    finally:
+        if blob_file is not None:
+            blob_file.close()
+
+
+def read_results(path: str, fields: Optional[List[str]] = None):
+    """Load result records into a pandas DataFrame for analysis"""
+    import pandas as pd
+    return pd.DataFrame.from_records(iter_results(path, fields=fields))
@@ -0,0 +1,223 @@
+"""
+Priority-aware solve scheduler
+Separates interactive and bulk traffic with per-client fairness and bounded queues
+"""
+
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from config import (
+    SCHEDULER_WORKERS, SCHEDULER_RESERVED_INTERACTIVE, SCHEDULER_MAX_DEPTH
+)
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ('interactive', 'batch')
+
+
+class QueueFullError(Exception):
+    """Raised when a priority class has no room; carries a Retry-After hint in seconds"""
+
+    def __init__(self, priority: str, retry_after: int):
+        super().__init__(f"{priority} queue is full, retry after {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class Job:
+    """A scheduled call with its future and timing breakdown"""
+
+    __slots__ = ('fn', 'args', 'kwargs', 'priority', 'client_id', 'future', 'context',
+                 'enqueued_at', 'started_at', 'finished_at')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, priority: str, client_id: str):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.client_id = client_id
+        self.future = Future()
+        self.context = contextvars.copy_context()  # Carries the caller's trace span to the worker
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def queue_wait_ms(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.enqueued_at) * 1000
+
+    @property
+    def solve_ms(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at) * 1000
+
+
+class _FairQueue:
+    """Round-robin over clients within one priority class"""
+
+    def __init__(self):
+        self._clients = OrderedDict()
+        self.depth = 0
+
+    def push(self, job: Job):
+        self._clients.setdefault(job.client_id, deque()).append(job)
+        self.depth += 1
+
+    def pop(self) -> Job:
+        client_id, jobs = next(iter(self._clients.items()))
+        job = jobs.popleft()
+        if jobs:
+            self._clients.move_to_end(client_id)
+        else:
+            del self._clients[client_id]
+        self.depth -= 1
+        return job
+
+
+class SolveScheduler:
+    """
+    Runs solve calls on a fixed worker pool, interactive work first
+
+    Interactive jobs always win a free worker, and ``reserved_interactive``
+    workers never take batch jobs, so a large batch cannot starve users.
+    Within a class, clients are served round-robin. Each class has a bounded
+    depth; submitting beyond it raises QueueFullError with a Retry-After hint.
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS,
+                 reserved_interactive: int = SCHEDULER_RESERVED_INTERACTIVE,
+                 max_depth: Dict[str, int] = None):
+        self.workers = workers
+        self.batch_slots = max(workers - reserved_interactive, 1)
+        self.max_depth = dict(SCHEDULER_MAX_DEPTH if max_depth is None else max_depth)
+
+        self._queues = {priority: _FairQueue() for priority in PRIORITY_CLASSES}
+        self._running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._stats = {priority: {'completed': 0, 'rejected': 0, 'wait_ms': 0.0, 'solve_ms': 0.0}
+                       for priority in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._listeners: List[Callable] = []
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'scheduler-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def add_listener(self, fn: Callable[[Job], None]):
+        """Call ``fn(job)`` on the worker thread after each job finishes"""
+        self._listeners.append(fn)
+
+    def _retry_after(self, priority: str) -> int:
+        stats = self._stats[priority]
+        mean_solve_s = stats['solve_ms'] / stats['completed'] / 1000 if stats['completed'] else 1.0
+        slots = self.workers if priority == 'interactive' else self.batch_slots
+        return max(1, int(self._queues[priority].depth * mean_solve_s / slots + 0.5))
+
+    def submit_many(self, calls: List[tuple], priority: str = 'interactive',
+                    client_id: str = 'anonymous') -> List[Job]:
+        """
+        Enqueue several (fn, args, kwargs) calls atomically
+
+        Raises:
+            QueueFullError: If the class cannot take all of them
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        with self._cond:
+            queue = self._queues[priority]
+            if queue.depth + len(calls) > self.max_depth[priority]:
+                self._stats[priority]['rejected'] += len(calls)
+                raise QueueFullError(priority, self._retry_after(priority))
+            jobs = [Job(fn, tuple(args), dict(kwargs), priority, client_id)
+                    for fn, args, kwargs in calls]
+            for job in jobs:
+                queue.push(job)
+            self._cond.notify(len(jobs))
+        return jobs
+
+    def submit(self, fn: Callable, *args, priority: str = 'interactive',
+               client_id: str = 'anonymous', **kwargs) -> Job:
+        """Enqueue one call; see submit_many"""
+        return self.submit_many([(fn, args, kwargs)], priority, client_id)[0]
+
+    def _next_job(self) -> Optional[Job]:
+        if self._queues['interactive'].depth:
+            return self._queues['interactive'].pop()
+        if self._queues['batch'].depth and self._running['batch'] < self.batch_slots:
+            return self._queues['batch'].pop()
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running[job.priority] += 1
+
+            job.started_at = time.perf_counter()
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    result = job.context.run(job.fn, *job.args, **job.kwargs)
+                except BaseException as e:
+                    job.finished_at = time.perf_counter()
+                    job.future.set_exception(e)
+                else:
+                    job.finished_at = time.perf_counter()
+                    job.future.set_result(result)
+            else:
+                job.finished_at = job.started_at
+
+            with self._cond:
+                self._running[job.priority] -= 1
+                stats = self._stats[job.priority]
+                stats['completed'] += 1
+                stats['wait_ms'] += job.queue_wait_ms
+                stats['solve_ms'] += job.solve_ms
+                # A finished batch job may unblock a waiting worker
+                self._cond.notify()
+
+            for listener in self._listeners:
+                try:
+                    listener(job)
+                except Exception as e:
+                    print(f"✗ Scheduler listener failed: {e}")
+
+    def queue_fill(self, priority: str) -> float:
+        """Queued jobs of a class as a fraction of its maximum depth"""
+        with self._cond:
+            return self._queues[priority].depth / max(self.max_depth[priority], 1)
+
+    def snapshot(self) -> Dict:
+        """Queue depth, in-flight count and mean wait/solve time per class"""
+        with self._cond:
+            return {
+                priority: {
+                    'queued': self._queues[priority].depth,
+                    'running': self._running[priority],
+                    'max_depth': self.max_depth[priority],
+                    'completed': stats['completed'],
+                    'rejected': stats['rejected'],
+                    'mean_queue_wait_ms': stats['wait_ms'] / stats['completed'] if stats['completed'] else 0.0,
+                    'mean_solve_ms': stats['solve_ms'] / stats['completed'] if stats['completed'] else 0.0
+                }
+                for priority, stats in self._stats.items()
+            }
+
+    def shutdown(self):
+        """Stop workers once the queued jobs have drained"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
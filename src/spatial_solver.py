@@ -0,0 +1,377 @@
+"""
+Spatial solver
+Voxel-grid engine for "Spatial reasoning" counting problems (painted and cut
+cubes, removed layers and corners) and closed-form paths on a cube (diagonals,
+surface and edge walks)
+"""
+
+import argparse
+import ast
+import math
+import operator
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.messages import HumanMessage
+
+from config import SPATIAL_MAX_EDGE, TRAIN_FILE
+from engines import EngineOutcome, choose_option, engine_report, print_engine_report, rows_from_csv
+from option_filter import normalize_option, option_value
+
+CATEGORY = "Spatial reasoning"
+
+EXTRACTION_PROMPT = """Translate this spatial problem into a model for an exact solver. Do not solve it.
+
+Problem: {problem}
+
+Reply with only one JSON object, one of:
+{{"kind": "voxels", "shape": [<small cubes along each axis>], "painted": <outer surface painted first: true/false>,
+"removed": "outer_layer" | "corners" | null, "faces": <painted faces counted, or null to count every cube left>,
+"faces_op": "exactly" | "at_least", "probability": <answer is that count over the cubes left: true/false>}}
+{{"kind": "path", "edge": <edge length of the cube>, "grid": <small cubes per edge, 1 if not cut>,
+"path": "space_diagonal" | "face_diagonal" | "surface" | "edges", "count_edges": <answer in edges/moves, not length>}}
+{{"kind": "none"}} if the problem is neither, or has any rule these models cannot express."""
+
+Value = Union[Fraction, float]
+
+_NUMBERS = {'no': 0, 'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+            'single': 1, 'only one': 1}
+_COUNT = r'(\d+|no|zero|one|two|three|four|five|six|single|only one)'
+_LENGTH = r'(\d+(?:\.\d+)?)'
+
+# Anything the models below do not capture: pigeonhole draws, reassembly, partial paint, ...
+_UNMODELLED = re.compile(
+    r'\bensure\b|\bguarantee|\bminimum number of (?:small|smaller|cubes)|\bdraw|\breassembl|\bweigh|'
+    r'\bslice|\bbreaks into\b|\bfalls\b|\brubik|\bopposite to\b|\bexcept\b|\bonly (?:the )?(?:top|bottom|front)|'
+    r'\bpoint\b|\bsphere|\bvolume\b|\btouch(?:es)?\b|\bratio\b|\bmixed (?:up )?with\b',
+    re.IGNORECASE
+)
+_SHAPE = re.compile(r'\b(\d+)\s*[x×]\s*(\d+)\s*[x×]\s*(\d+)\b')
+_SIZED = re.compile(r'\b(\d+) cubes? long, (\d+) cubes? wide,? and (\d+) cubes? (?:tall|high|deep)\b')
+_PIECES = re.compile(r'\b(?:into|of|made (?:up )?(?:of|from)) (\d+) (?:\w+ ){0,3}?(?:cubes|pieces)\b'
+                     r'|\b(\d+) in total\b')
+_EDGE = re.compile(
+    rf'\b(?:edge|side)s?(?: length)?(?: of| measures?| measuring)?(?: length)? {_LENGTH}'
+    rf'|\b{_LENGTH}\s*(?:units?|meters?|cm|inch(?:es)?) along each edge'
+    rf'|\bside length of {_LENGTH}',
+    re.IGNORECASE
+)
+_UNIT_PIECES = re.compile(rf'\bcut into (?:smaller )?cubes (?:of|with) {_LENGTH} unit side', re.IGNORECASE)
+_PAINTED = re.compile(r'\bpaint(?:ed)?\b|\bdip', re.IGNORECASE)
+_OUTER_LAYER = re.compile(r'\bouter(?:most)? layer\b.*\bremov|\bremov\w* (?:the )?outer(?:most)? layer', re.IGNORECASE)
+_CORNERS = re.compile(r'\bremov\w* (?:\w+ ){0,6}?corners?\b', re.IGNORECASE)
+
+_FACES_EXACT = re.compile(
+    rf'\bexactly {_COUNT} (?:\w+ )?(?:sides?|faces?)\b'
+    rf'|\b{_COUNT} (?:\w+ )?(?:painted )?(?:sides?|faces?)(?: painted)?\b'
+    rf'|\b{_COUNT} painted (?:sides?|faces?)\b',
+    re.IGNORECASE
+)
+_FACES_AT_LEAST = re.compile(r'\bat least one (?:\w+ )?(?:sides?|faces?)\b|\bpaint on at least one\b', re.IGNORECASE)
+_UNPAINTED = re.compile(r'\bunpainted\b|\bno (?:\w+ )?paint\b|\bno (?:painted )?(?:sides?|faces?)\b'
+                        r'|\bnot painted\b', re.IGNORECASE)
+_REMAINING = re.compile(r'\bremain|\bleft\b', re.IGNORECASE)
+
+_CORNER_TO_CORNER = r'(?:\bopposite corner|\bdiagonally opposite)'
+_SPACE_DIAGONAL = re.compile(rf'\blongest (?:possible )?straight\b|\bspace diagonal\b|\btunnel\b.*{_CORNER_TO_CORNER}'
+                             rf'|\bstraight line\b.*{_CORNER_TO_CORNER}', re.IGNORECASE)
+_SURFACE = re.compile(rf'\b(?:walk|crawl|move)s? on (?:any |the )?(?:surface|faces?)\b.*{_CORNER_TO_CORNER}'
+                      rf'|{_CORNER_TO_CORNER}.*\b(?:walk|crawl)s? on (?:any |the )?(?:surface|faces?)\b',
+                      re.IGNORECASE)
+_ALONG_EDGES = re.compile(rf'\balong the edges\b.*{_CORNER_TO_CORNER}|{_CORNER_TO_CORNER}.*\balong the edges\b',
+                          re.IGNORECASE)
+_EDGE_COUNT = re.compile(r'\bnumber of (?:edges|moves)\b|\bhow many (?:edges|moves)\b|\bminimum number of moves\b',
+                         re.IGNORECASE)
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+              ast.Pow: operator.pow, ast.USub: operator.neg}
+
+
+def _count(text: str) -> int:
+    return int(text) if text.isdigit() else _NUMBERS[text.lower()]
+
+
+def _evaluate(node) -> float:
+    """Value of a parsed arithmetic expression (numbers, + - * / ^ and sqrt only)"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return float(node.value)  # Floats overflow instead of growing without bound
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.left), _evaluate(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'sqrt'
+            and len(node.args) == 1):
+        return math.sqrt(_evaluate(node.args[0]))
+    raise ValueError("Unsupported expression")
+
+
+def stated_number(text: str) -> Optional[float]:
+    """
+    Number an option states: a plain number, a fraction or a surd such as
+    "2√3 units" or "4 * sqrt(3)", with any trailing unit words; None otherwise
+    """
+    normalized = normalize_option(text)
+    value = option_value(normalized, normalized=True)
+    if value is not None:
+        return float(value)
+    expression = re.sub(r'(?:\s+[a-z]+)+$', '', normalized)  # Unit words
+    expression = re.sub(r'√\s*\(?(\d+(?:\.\d+)?)\)?', r'sqrt(\1)', expression)
+    expression = re.sub(r'(\d)\s*(?=sqrt)', r'\1*', expression).replace('^', '**')
+    if not expression or re.search(r'[^\d.\s+\-*/()sqrt]', expression):
+        return None
+    try:
+        return float(_evaluate(ast.parse(expression, mode='eval')))
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError):
+        return None
+
+
+def _same_number(stated: float, text: str, exact: Value) -> bool:
+    """Equal up to the precision the option is written with"""
+    decimals = re.search(r'\.(\d+)', text)
+    tolerance = 0.5 * 10 ** -len(decimals.group(1)) if decimals else 1e-9 * max(1.0, abs(float(exact)))
+    return abs(stated - float(exact)) <= tolerance
+
+
+def _format(value: Value) -> str:
+    if isinstance(value, Fraction):
+        return str(value.numerator) if value.denominator == 1 else f"{value.numerator}/{value.denominator}"
+    return f"{value:.4g}"
+
+
+class VoxelCube:
+    """
+    A box of unit cubes, optionally painted on its outer surface and then
+    stripped of its outer layer or corners, with a count asked of what is left
+    """
+
+    def __init__(self, shape: Tuple[int, int, int], painted: bool, removed: Optional[str],
+                 faces: Optional[int], faces_op: str = 'exactly', probability: bool = False):
+        self.shape = shape
+        self.painted = painted
+        self.removed = removed  # None, 'outer_layer' or 'corners'
+        self.faces = faces  # Painted faces a counted cube has; None counts every cube left
+        self.faces_op = faces_op
+        self.probability = probability
+
+    def painted_faces(self) -> np.ndarray:
+        """Painted face count of every unit cube"""
+        faces = np.zeros(self.shape, dtype=np.int8)
+        if not self.painted:
+            return faces
+        for axis, size in enumerate(self.shape):
+            index = np.arange(size)
+            exposed = (index == 0).astype(np.int8) + (index == size - 1)
+            faces += exposed.reshape([-1 if i == axis else 1 for i in range(3)])
+        return faces
+
+    def kept(self) -> np.ndarray:
+        """Mask of the unit cubes left after any removal"""
+        kept = np.ones(self.shape, dtype=bool)
+        if self.removed == 'outer_layer':
+            kept[:] = False
+            kept[1:-1, 1:-1, 1:-1] = True
+        elif self.removed == 'corners':
+            for corner in np.ndindex(2, 2, 2):
+                kept[tuple(-1 if end else 0 for end in corner)] = False
+        return kept
+
+    def value(self) -> Fraction:
+        kept = self.kept()
+        counted = kept
+        if self.faces is not None:
+            faces = self.painted_faces()
+            counted = kept & (faces >= self.faces if self.faces_op == 'at_least' else faces == self.faces)
+        count = int(counted.sum())
+        if self.probability:
+            total = int(kept.sum())
+            return Fraction(count, total) if total else None
+        return Fraction(count)
+
+    def explain(self, value: Fraction) -> str:
+        a, b, c = self.shape
+        text = f"Voxel grid of {a}x{b}x{c} unit cubes"
+        if self.painted:
+            text += ", painted outside"
+        if self.removed:
+            text += f", {self.removed.replace('_', ' ')} removed"
+        if self.faces is None:
+            counted = "cubes left"
+        else:
+            op = 'at least' if self.faces_op == 'at_least' else 'exactly'
+            counted = f"cubes with {op} {self.faces} painted faces"
+        return f"{text}: {'probability of ' if self.probability else ''}{counted} = {_format(value)}."
+
+
+class CubePath:
+    """A corner-to-opposite-corner path on a cube of a given edge length"""
+
+    PATHS = ('space_diagonal', 'face_diagonal', 'surface', 'edges')
+
+    def __init__(self, edge: Fraction, path: str, grid: int = 1, count_edges: bool = False):
+        self.edge = edge
+        self.path = path
+        self.grid = grid  # Unit cubes per edge when an edge walk counts moves along a cut cube
+        self.count_edges = count_edges
+
+    def value(self) -> Value:
+        if self.path == 'edges':
+            return Fraction(3 * self.grid) if self.count_edges else 3 * self.edge
+        factor = {'space_diagonal': 3, 'face_diagonal': 2, 'surface': 5}[self.path]
+        return float(self.edge) * math.sqrt(factor)
+
+    def explain(self, value: Value) -> str:
+        if self.path == 'edges':
+            unit = 'edges' if self.count_edges else 'units'
+            return f"Along the edges a corner is three edge runs from the opposite corner: {_format(value)} {unit}."
+        formula = {'space_diagonal': 'a·√3 (space diagonal)', 'face_diagonal': 'a·√2 (face diagonal)',
+                   'surface': 'a·√5 (two faces unfolded into a 1×2 rectangle)'}[self.path]
+        return f"For edge a = {_format(self.edge)}, the path is {formula} = {_format(value)}."
+
+
+def _question(problem: str) -> str:
+    sentences = re.split(r'(?<=[.?!])\s+', problem)
+    questions = [sentence for sentence in sentences if sentence.endswith('?')]
+    return questions[-1] if questions else sentences[-1]
+
+
+def _shape(problem: str) -> Optional[Tuple[int, int, int]]:
+    """Unit cubes along each axis, if every way the problem states it agrees"""
+    shapes = set()
+    for match in list(_SHAPE.finditer(problem)) + list(_SIZED.finditer(problem)):
+        shapes.add(tuple(int(size) for size in match.groups()))
+    shapes.discard((1, 1, 1))  # "made up of 1x1x1 cubes" names the unit, not the shape
+    for match in _PIECES.finditer(problem):
+        pieces = int(match.group(1) or match.group(2))
+        side = round(pieces ** (1 / 3))
+        if side ** 3 == pieces:
+            shapes.add((side, side, side))
+    unit_pieces = _UNIT_PIECES.search(problem)
+    edges = {Fraction(value) for match in _EDGE.finditer(problem) for value in match.groups() if value}
+    if unit_pieces and len(edges) == 1:
+        side = edges.pop() / Fraction(unit_pieces.group(1))
+        if side.denominator == 1:
+            shapes.add((int(side),) * 3)
+    if len(shapes) != 1:
+        return None
+    shape, = shapes
+    return shape if 0 < max(shape) <= SPATIAL_MAX_EDGE else None
+
+
+def _extract_voxels(problem: str) -> Optional[VoxelCube]:
+    shape = _shape(problem)
+    if shape is None:
+        return None
+    question = _question(problem)
+    painted = _PAINTED.search(problem) is not None
+    removed = 'outer_layer' if _OUTER_LAYER.search(problem) else 'corners' if _CORNERS.search(problem) else None
+    probability = re.search(r'\bprobability\b', question, re.IGNORECASE) is not None
+
+    faces, faces_op = None, 'exactly'
+    if painted and _UNPAINTED.search(question):
+        faces = 0
+    elif painted and _FACES_AT_LEAST.search(question):
+        faces, faces_op = 1, 'at_least'
+    elif painted and _FACES_EXACT.search(question):
+        match = _FACES_EXACT.search(question)
+        faces = _count(next(group for group in match.groups() if group))
+    elif not (removed and _REMAINING.search(question)):
+        return None
+    if painted and removed:
+        return None  # Whether paint or removal came first changes the count
+    return VoxelCube(shape, painted, removed, faces, faces_op, probability)
+
+
+def _extract_path(problem: str) -> Optional[CubePath]:
+    edges = {Fraction(value) for match in _EDGE.finditer(problem) for value in match.groups() if value}
+    if len(edges) != 1:
+        return None
+    edge, = edges
+    if _SPACE_DIAGONAL.search(problem):
+        return CubePath(edge, 'space_diagonal')
+    if _SURFACE.search(problem):
+        return CubePath(edge, 'surface')
+    if _ALONG_EDGES.search(problem):
+        return CubePath(edge, 'edges', count_edges=_EDGE_COUNT.search(_question(problem)) is not None)
+    return None
+
+
+@lru_cache(maxsize=1024)
+def extract_model(problem: str):
+    """VoxelCube or CubePath of a problem from its wording, or None"""
+    if not re.search(r'\bcubes?\b|\bcubic', problem, re.IGNORECASE) or _UNMODELLED.search(problem):
+        return None
+    return _extract_voxels(problem) or _extract_path(problem)
+
+
+def model_from_extraction(data: Dict):
+    """Model from the extraction JSON (see EXTRACTION_PROMPT), or None"""
+    try:
+        if data.get('kind') == 'voxels':
+            shape = tuple(int(size) for size in data['shape'])
+            if len(shape) != 3 or min(shape) < 1 or max(shape) > SPATIAL_MAX_EDGE:
+                return None
+            removed = data.get('removed')
+            faces = data.get('faces')
+            if removed not in (None, 'outer_layer', 'corners') or data.get('faces_op', 'exactly') not in (
+                    'exactly', 'at_least'):
+                return None
+            return VoxelCube(shape, bool(data.get('painted')), removed, None if faces is None else int(faces),
+                             data.get('faces_op', 'exactly'), bool(data.get('probability')))
+        if data.get('kind') == 'path':
+            if data.get('path') not in CubePath.PATHS:
+                return None
+            edge = Fraction(str(data['edge']))
+            grid = int(data.get('grid') or 1)
+            if edge <= 0 or not 0 < grid <= SPATIAL_MAX_EDGE:
+                return None
+            return CubePath(edge, data['path'], grid, bool(data.get('count_edges')))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    return None
+
+
+class SpatialEngine:
+    """Local engine for the spatial reasoning category (see engines.py for the protocol)"""
+
+    name = 'spatial'
+
+    def extract(self, problem: str):
+        return extract_model(problem)
+
+    def extraction_messages(self, problem: str) -> List:
+        return [HumanMessage(content=EXTRACTION_PROMPT.format(problem=problem))]
+
+    def model_from_extraction(self, data: Dict):
+        return model_from_extraction(data)
+
+    def answer(self, model, options: Dict[str, str]) -> EngineOutcome:
+        value = model.value()
+        if value is None:
+            return EngineOutcome(None, 'unsolvable')
+
+        def judge(text: str) -> Optional[bool]:
+            stated = stated_number(text)
+            return None if stated is None else _same_number(stated, normalize_option(text), value)
+
+        number, reason = choose_option(options, judge)
+        reasoning = model.explain(value)
+        if reason == 'catch_all':
+            reasoning += " None of the listed options states it."
+        return EngineOutcome(number, reason, reasoning)
+
+
+def main():
+    """Offline report of rules extraction on a labelled CSV (no LLM calls)"""
+    parser = argparse.ArgumentParser(description='Report how often the spatial solver answers locally')
+    parser.add_argument('--data', type=str, default=TRAIN_FILE, help='Labelled CSV file')
+    args = parser.parse_args()
+    print_engine_report(SpatialEngine.name, engine_report(SpatialEngine(), rows_from_csv(args.data, CATEGORY)))
+
+
+if __name__ == "__main__":
+    main()
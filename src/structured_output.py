@@ -0,0 +1,137 @@
+"""
+Structured output parsing
+JSON-schema answer format, a bounded incremental parser and the repair prompt
+"""
+
+import json
+import re
+from typing import Dict, Optional
+
+# Answer fields come first so generation can be stopped as soon as they arrive
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "integer", "enum": [1, 2, 3, 4, 5]},
+        "confidence": {"type": "number"},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["answer", "confidence", "reasoning"],
+    "additionalProperties": False
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "reasoning_answer", "strict": True, "schema": ANSWER_SCHEMA}
+}
+
+REPAIR_RESPONSE_FORMAT = {"type": "json_object"}
+
+STRUCTURED_FORMAT_INSTRUCTIONS = """
+Respond with a single JSON object with exactly these keys, in this order:
+"answer": the correct option number (1-5),
+"confidence": your confidence (0.0-1.0),
+"reasoning": a concise explanation of why that option is correct.
+"""
+
+REPAIR_PROMPT = """Below is the end of an answer to a multiple-choice question with options 1-5. \
+Its final choice could not be read automatically.
+
+{response}
+
+Reply with only JSON: {{"answer": <option number 1-5>, "confidence": <0.0-1.0>}}"""
+
+# Only the tail of a failed response is sent for repair; the conclusion lives there
+REPAIR_CONTEXT_CHARS = 2000
+
+_ANSWER_FIELD = re.compile(r'"answer"\s*:\s*"?([1-5])\b')
+_CONFIDENCE_FIELD = re.compile(r'"confidence"\s*:\s*"?([0-9]*\.?[0-9]+)(?=[\s",}])')
+_REASONING_FIELD = re.compile(r'"reasoning"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def _unescape_partial(fragment: str) -> str:
+    """Decode a JSON string body that may have been cut off mid-escape"""
+    for end in range(len(fragment), max(len(fragment) - 6, -1), -1):
+        try:
+            return json.loads(f'"{fragment[:end]}"')
+        except ValueError:
+            continue
+    return fragment
+
+
+def extract_answer_fields(text: str) -> Optional[Dict]:
+    """
+    Read answer, confidence and reasoning from a complete or truncated JSON response
+
+    Returns:
+        Dictionary with 'answer', 'confidence' and 'reasoning', or None if no
+        valid answer is present
+    """
+    try:
+        data = json.loads(text)
+        answer = int(data['answer'])
+        if 1 <= answer <= 5:
+            confidence = float(data.get('confidence', 0.7))
+            return {
+                'answer': answer,
+                'confidence': min(max(confidence, 0.0), 1.0),
+                'reasoning': str(data.get('reasoning', ''))
+            }
+    except (ValueError, TypeError, KeyError):
+        pass
+
+    answer_match = _ANSWER_FIELD.search(text)
+    if not answer_match:
+        return None
+    confidence_match = _CONFIDENCE_FIELD.search(text)
+    reasoning_match = _REASONING_FIELD.search(text)
+    return {
+        'answer': int(answer_match.group(1)),
+        'confidence': min(float(confidence_match.group(1)), 1.0) if confidence_match else 0.7,
+        'reasoning': _unescape_partial(reasoning_match.group(1)) if reasoning_match else ''
+    }
+
+
+class StreamingAnswerParser:
+    """
+    Incremental parser for streamed structured responses
+
+    The buffer is bounded by ``max_chars``; once the answer and confidence
+    fields have been seen the caller can stop consuming the stream.
+    """
+
+    def __init__(self, max_chars: int = 8000):
+        self.max_chars = max_chars
+        self._parts = []
+        self._size = 0
+        self.answer_ready = False
+        self.truncated = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add a streamed chunk; returns True once the answer fields are available"""
+        if self._size >= self.max_chars:
+            self.truncated = True
+            return self.answer_ready
+
+        chunk = chunk[:self.max_chars - self._size]
+        self._parts.append(chunk)
+        self._size += len(chunk)
+
+        if not self.answer_ready and ('answer' in chunk or 'confidence' in chunk or
+                                      ',' in chunk or '}' in chunk):
+            text = self.text
+            self.answer_ready = bool(_ANSWER_FIELD.search(text) and _CONFIDENCE_FIELD.search(text))
+        return self.answer_ready
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = [''.join(self._parts)]
+        return self._parts[0] if self._parts else ''
+
+    def result(self) -> Optional[Dict]:
+        return extract_answer_fields(self.text)
+
+
+def build_repair_prompt(response_text: str) -> str:
+    """Prompt asking only for the final answer of an unparseable response"""
+    return REPAIR_PROMPT.format(response=response_text[-REPAIR_CONTEXT_CHARS:])
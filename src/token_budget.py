@@ -0,0 +1,105 @@
+"""
+Token accounting and prompt compaction
+Local token counting plus helpers that keep prompts and completions within budget
+"""
+
+import re
+import sys
+from functools import lru_cache
+from typing import Dict, List
+
+from config import GPT_MODEL, CATEGORY_TOKEN_BUDGETS, DEFAULT_MAX_TOKENS, COMPACT_MAX_TOKENS
+from usage_ledger import call_cost
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character heuristic
+    tiktoken = None
+
+_ESCAPED_NEWLINE = re.compile(r'\\n')
+_INVISIBLE = re.compile('[\u00ad\u200b\u200c\u200d\ufeff]')
+_WHITESPACE = re.compile(r' [ \t\r\f\v]+|[\t\r\f\v][ \t\r\f\v]*')  # Single spaces are left alone
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding('o200k_base')
+        except Exception:
+            return None
+
+
+def count_tokens(text: str, model: str = GPT_MODEL) -> int:
+    """Count tokens with the model's local tokenizer (approximate without tiktoken)"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List, model: str = GPT_MODEL) -> int:
+    """Count prompt tokens for a list of chat messages (incl. per-message overhead)"""
+    return sum(count_tokens(message.content, model) + 4 for message in messages) + 2
+
+
+def compact_text(text: str) -> str:
+    """
+    Remove redundant characters from problem text without changing its meaning
+
+    Collapses runs of whitespace and blank lines, turns literal '\\n' escapes
+    (common in the dataset) into real newlines, and drops invisible characters.
+    """
+    text = _ESCAPED_NEWLINE.sub('\n', str(text))
+    text = _INVISIBLE.sub('', text)
+    text = _WHITESPACE.sub(' ', text)
+    text = _BLANK_LINES.sub('\n', text)
+    return text.strip()
+
+
+def get_max_tokens(category: str, compact: bool = False) -> int:
+    """Completion token budget for a category"""
+    budget = CATEGORY_TOKEN_BUDGETS.get(category, DEFAULT_MAX_TOKENS)
+    return min(budget, COMPACT_MAX_TOKENS) if compact else budget
+
+
+def usage_from_response(response, messages: List, response_text: str,
+                        model: str = GPT_MODEL) -> Dict:
+    """
+    Token usage for one LLM call
+
+    Uses the provider-reported usage when present, otherwise counts locally.
+    Includes cached prompt tokens, the serving model and the priced cost.
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    response_metadata = getattr(response, 'response_metadata', None) or {}
+    model = response_metadata.get('model_name') or model
+    if metadata:
+        usage = {
+            'prompt_tokens': metadata.get('input_tokens', 0),
+            'cached_tokens': (metadata.get('input_token_details') or {}).get('cache_read', 0) or 0,
+            'completion_tokens': metadata.get('output_tokens', 0),
+            'total_tokens': metadata.get('total_tokens', 0),
+            'source': 'provider'
+        }
+    else:
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = count_tokens(response_text, model)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': 0,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'source': 'local'
+        }
+    # Interned: every kept result refers to the same few model and backend names
+    usage['model'] = sys.intern(model)
+    backend = response_metadata.get('backend')
+    usage['backend'] = sys.intern(backend) if backend else backend
+    usage['cost_usd'] = call_cost(usage)
+    return usage
@@ -0,0 +1,243 @@
+"""
+Request tracing
+OpenTelemetry-style spans with W3C trace-context propagation, parent-based ratio
+sampling and an offline JSONL exporter
+"""
+
+import atexit
+import contextvars
+import json
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from config import TRACING_ENABLED, TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_FLUSH_SPANS
+
+# Span timestamps come from perf_counter (monotonic), shifted once to epoch nanoseconds
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def _now_ns() -> int:
+    return time.perf_counter_ns() + _EPOCH_OFFSET_NS
+
+
+def perf_to_epoch_ns(perf_seconds: float) -> int:
+    """Convert a time.perf_counter() reading to epoch nanoseconds"""
+    return int(perf_seconds * 1e9) + _EPOCH_OFFSET_NS
+
+
+class SpanContext:
+    """Identity of a span as carried in a W3C traceparent header"""
+
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def extract_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C traceparent header; None if it is absent or malformed"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if trace_id == 0 or span_id == 0:
+        return None
+    return SpanContext(parts[1].lower(), parts[2].lower(), bool(flags & 1))
+
+
+class Span:
+    """A timed operation; attributes are only kept for sampled spans"""
+
+    __slots__ = ('context', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes',
+                 'status', '_exporter', '_token', '_cpu_start')
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str],
+                 start_ns: int, attributes: Dict, exporter):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = 'OK'
+        self._exporter = exporter
+        self._token = None
+        self._cpu_start = None
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value):
+        if self.context.sampled:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict):
+        if self.context.sampled:
+            self.attributes.update(attributes)
+
+    def record_exception(self, error: BaseException):
+        if self.context.sampled:
+            self.status = 'ERROR'
+            self.attributes['exception.type'] = type(error).__name__
+            self.attributes['exception.message'] = str(error)
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or _now_ns()
+        if self.context.sampled:
+            self._exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        if self.context.sampled:
+            self._cpu_start = time.thread_time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        if self._cpu_start is not None:
+            # CPU used by this thread inside the span (excludes I/O and lock waits)
+            self.attributes['thread.cpu_ms'] = (time.thread_time_ns() - self._cpu_start) / 1e6
+        self.end()
+        _current_span.reset(self._token)
+        return False
+
+    def to_dict(self) -> Dict:
+        """OpenTelemetry span data model fields"""
+        return {
+            'trace_id': self.context.trace_id,
+            'span_id': self.context.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled; every operation is a no-op"""
+
+    recording = False
+    context = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, error):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """Buffers finished spans and appends them to a JSONL file, one span per line"""
+
+    def __init__(self, path: str = TRACE_FILE, flush_spans: int = TRACE_FLUSH_SPANS):
+        self.path = path
+        self.flush_spans = flush_spans
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) < self.flush_spans:
+                return
+            lines, self._buffer = self._buffer, []
+        self._write(lines)
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if lines:
+            self._write(lines)
+
+    def _write(self, lines):
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+class Tracer:
+    """
+    Creates spans under the current context (or an extracted remote parent)
+
+    Root spans are sampled by trace id ratio and children follow their parent's
+    decision, as with OpenTelemetry's ParentBased(TraceIdRatioBased) sampler.
+    While disabled, ``span`` returns a shared no-op span.
+    """
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, sample_rate: float = TRACE_SAMPLE_RATE,
+                 exporter: Optional[JsonlSpanExporter] = None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter or JsonlSpanExporter()
+
+    def _should_sample(self, trace_id: str) -> bool:
+        return int(trace_id[16:], 16) < self.sample_rate * 2 ** 64
+
+    def span(self, name: str, attributes: Optional[Dict] = None,
+             parent: Optional[SpanContext] = None, start_ns: Optional[int] = None):
+        """Start a span; use as a context manager to make it current"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+
+        if parent is None:
+            trace_id = f'{random.getrandbits(128):032x}'
+            sampled = self._should_sample(trace_id)
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+
+        return Span(
+            name, SpanContext(trace_id, f'{random.getrandbits(64):016x}', sampled),
+            parent.span_id if parent is not None else None,
+            start_ns or _now_ns(), dict(attributes or {}) if sampled else {}, self.exporter
+        )
+
+    def record_span(self, name: str, start_perf: float, end_perf: float,
+                    attributes: Optional[Dict] = None):
+        """Record an already-finished interval (perf_counter times) under the current span"""
+        span = self.span(name, attributes, start_ns=perf_to_epoch_ns(start_perf))
+        span.end(perf_to_epoch_ns(end_perf))
+
+    def flush(self):
+        self.exporter.flush()
+
+
+# Process-wide tracer
+tracer = Tracer()
+atexit.register(tracer.flush)
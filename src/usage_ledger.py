@@ -0,0 +1,252 @@
+"""
+Token and cost accounting
+Per-call usage ledger with in-memory totals, flushed to SQLite or Parquet,
+and spending budgets that push solves onto cheaper paths
+"""
+
+import atexit
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from config import MODEL_PRICING, USAGE_LEDGER_FILE, USAGE_FLUSH_ROWS
+
+LEDGER_FIELDS = ('timestamp', 'scope', 'category', 'purpose', 'model', 'prompt_tokens',
+                 'cached_tokens', 'completion_tokens', 'latency_ms', 'cost_usd')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    timestamp REAL NOT NULL,
+    scope TEXT,
+    category TEXT,
+    purpose TEXT,
+    model TEXT,
+    prompt_tokens INTEGER,
+    cached_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms REAL,
+    cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS usage_scope ON usage (scope);
+"""
+
+
+def _pricing_for(model: Optional[str]) -> Optional[Dict]:
+    """Longest configured prefix of the model name (provider names carry date suffixes)"""
+    if not model:
+        return None
+    matches = [name for name in MODEL_PRICING if model.startswith(name)]
+    return MODEL_PRICING[max(matches, key=len)] if matches else None
+
+
+def call_cost(usage: Dict) -> float:
+    """USD cost of one call from its usage dictionary"""
+    pricing = _pricing_for(usage.get('model'))
+    if pricing is None:
+        return 0.0
+    cached = usage.get('cached_tokens', 0)
+    uncached = max(usage.get('prompt_tokens', 0) - cached, 0)
+    return (uncached * pricing['input']
+            + cached * pricing.get('cached_input', pricing['input'])
+            + usage.get('completion_tokens', 0) * pricing['output']) / 1_000_000
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """Upper-bound cost of a call before it is made"""
+    return call_cost({'model': model, 'prompt_tokens': prompt_tokens,
+                      'completion_tokens': completion_tokens})
+
+
+class UsageBudget:
+    """
+    Token and cost spending for one accounting scope (a request, job or run)
+
+    Limits are optional; without them the budget only tallies spending.
+    """
+
+    def __init__(self, max_cost: Optional[float] = None, max_tokens: Optional[int] = None,
+                 scope: Optional[str] = None, spent_cost: float = 0.0, spent_tokens: int = 0):
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.scope = scope or f'request:{uuid.uuid4().hex[:12]}'
+        self.spent_cost = spent_cost
+        self.spent_tokens = spent_tokens
+        self.degraded_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.max_cost is not None or self.max_tokens is not None
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.allows(0, 0.0)
+
+    def allows(self, tokens: int, cost: float) -> bool:
+        """Whether spending ``tokens``/``cost`` more stays within the limits"""
+        if self.max_tokens is not None and self.spent_tokens + tokens > self.max_tokens:
+            return False
+        if self.max_cost is not None and self.spent_cost + cost > self.max_cost:
+            return False
+        return True
+
+    def affordable_completion_tokens(self, prompt_tokens: int, model: Optional[str]) -> Optional[int]:
+        """Largest completion that keeps a call within the limits (None when unlimited)"""
+        limits = []
+        if self.max_tokens is not None:
+            limits.append(self.max_tokens - self.spent_tokens - prompt_tokens)
+        if self.max_cost is not None:
+            per_token = estimate_cost(model, 0, 1)
+            if per_token > 0:
+                left = self.max_cost - self.spent_cost - estimate_cost(model, prompt_tokens, 0)
+                limits.append(int(left / per_token))
+        return max(min(limits), 0) if limits else None
+
+    def charge(self, usage: Dict):
+        with self._lock:
+            self.spent_tokens += usage.get('total_tokens', 0)
+            self.spent_cost += usage.get('cost_usd', 0.0)
+
+    def note_degraded(self):
+        with self._lock:
+            self.degraded_calls += 1
+
+    def snapshot(self) -> Dict:
+        return {
+            'scope': self.scope,
+            'max_cost': self.max_cost,
+            'max_tokens': self.max_tokens,
+            'spent_cost': self.spent_cost,
+            'spent_tokens': self.spent_tokens,
+            'degraded_calls': self.degraded_calls
+        }
+
+
+class UsageLedger:
+    """
+    Records every LLM call and keeps running totals per category and model
+
+    Call records are buffered and appended to SQLite (or Parquet part files when
+    ``path`` ends in .parquet) every ``flush_rows`` calls and at exit.
+    """
+
+    def __init__(self, path: str = USAGE_LEDGER_FILE, flush_rows: int = USAGE_FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self._pending = []
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._conn = None
+        self._parts = 0
+
+    def record(self, usage: Dict, category: str, latency_ms: float,
+               scope: Optional[str] = None, purpose: str = 'solve'):
+        """Record one call; ``usage`` comes from token_budget.usage_from_response"""
+        row = {
+            'timestamp': time.time(),
+            'scope': scope,
+            'category': category,
+            'purpose': purpose,
+            'model': usage.get('model'),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'cached_tokens': usage.get('cached_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'latency_ms': latency_ms,
+            'cost_usd': usage.get('cost_usd', 0.0)
+        }
+        with self._lock:
+            self._pending.append(row)
+            totals = self._totals[(category, row['model'])]
+            totals['calls'] += 1
+            for field in ('prompt_tokens', 'cached_tokens', 'completion_tokens', 'latency_ms', 'cost_usd'):
+                totals[field] += row[field]
+            should_flush = len(self._pending) >= self.flush_rows
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Persist buffered records"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self._flush_lock:
+            if self.path.endswith('.parquet'):
+                self._flush_parquet(rows)
+            else:
+                self._flush_sqlite(rows)
+
+    def _flush_sqlite(self, rows: List[Dict]):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO usage ({', '.join(LEDGER_FIELDS)}) VALUES ({', '.join('?' * len(LEDGER_FIELDS))})",
+                [tuple(row[field] for field in LEDGER_FIELDS) for row in rows]
+            )
+
+    def _flush_parquet(self, rows: List[Dict]):
+        import pandas as pd  # Parquet output needs pyarrow (or fastparquet)
+        os.makedirs(self.path, exist_ok=True)
+        self._parts += 1
+        part = os.path.join(self.path, f'part-{os.getpid()}-{int(time.time())}-{self._parts:05d}.parquet')
+        pd.DataFrame(rows, columns=list(LEDGER_FIELDS)).to_parquet(part, index=False)
+
+    def totals(self) -> Dict:
+        """Aggregates since start-up, per category/model and overall"""
+        with self._lock:
+            by_key = {key: dict(values) for key, values in self._totals.items()}
+        overall = defaultdict(float)
+        by_category = defaultdict(lambda: defaultdict(float))
+        by_model = defaultdict(lambda: defaultdict(float))
+        for (category, model), values in by_key.items():
+            for field, value in values.items():
+                overall[field] += value
+                by_category[category][field] += value
+                by_model[model or 'unknown'][field] += value
+        return {
+            'overall': dict(overall),
+            'by_category': {category: dict(values) for category, values in by_category.items()},
+            'by_model': {model: dict(values) for model, values in by_model.items()}
+        }
+
+
+# Process-wide ledger shared by all agents
+usage_ledger = UsageLedger()
+atexit.register(usage_ledger.flush)
+
+# (budget, category) of the solve making LLM calls in this context, so calls the
+# agent never sees (a router hedge that lost its race) are still charged
+_active_usage = contextvars.ContextVar('active_usage', default=(None, None))
+
+
+@contextmanager
+def charging(budget: Optional[UsageBudget], category: Optional[str]):
+    """Make ``budget`` and ``category`` the active spending scope inside the block"""
+    token = _active_usage.set((budget, category))
+    try:
+        yield
+    finally:
+        _active_usage.reset(token)
+
+
+def active_usage() -> Tuple[Optional[UsageBudget], Optional[str]]:
+    return _active_usage.get()
+
+
+def record_call(usage: Dict, latency_ms: float, purpose: str,
+                scope: Tuple[Optional[UsageBudget], Optional[str]]):
+    """Record a call made on behalf of ``scope`` (from ``active_usage``) and charge its budget"""
+    budget, category = scope
+    usage_ledger.record(usage, category, latency_ms,
+                        scope=budget.scope if budget is not None else None, purpose=purpose)
+    if budget is not None:
+        budget.charge(usage)
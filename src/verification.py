@@ -0,0 +1,240 @@
+"""
+Asynchronous verification
+Low-confidence answers are returned at once and re-checked off the critical
+path; verified results replace the originals in a response cache (and, through
+listeners, in the job store), so repeat and batch traffic get them for free
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import RESPONSE_CACHE_SIZE, VERIFY_QUEUE_SIZE, VERIFY_WORKERS
+from records import ReasoningResult
+
+CacheKey = Tuple[str, Tuple[str, ...]]
+
+
+def cache_key(problem: str, options: Iterable[str]) -> CacheKey:
+    """Key of a (problem, options in order) pair"""
+    return problem, tuple(str(option) for option in options)
+
+
+def _normalize(text: str) -> str:
+    """
+    Lowercase with whitespace collapsed
+
+    Punctuation is kept: operators, signs and decimal points change the
+    problem ('5 - 3' vs '5 + 3'), so only case and spacing may differ.
+    """
+    return ' '.join(text.lower().split())
+
+
+def _similar_key(key: CacheKey) -> Tuple[str, Tuple[str, ...]]:
+    """Key shared by near-duplicates: normalized problem and the set of normalized options"""
+    problem, options = key
+    return _normalize(problem), tuple(sorted(_normalize(option) for option in options))
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU of solved problems; entries are copied in and out
+
+    Entries are also indexed by a normalized form of the problem and options,
+    so ``find_similar`` can serve a near-duplicate (different case, spacing
+    or option order) when the service is degraded.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._similar = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similar_hits = 0
+
+    def get(self, key: CacheKey) -> Optional[ReasoningResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result.copy()
+
+    def peek(self, key: CacheKey) -> Optional[ReasoningResult]:
+        """Like ``get`` but without touching recency or hit counts"""
+        with self._lock:
+            result = self._entries.get(key)
+            return result.copy() if result is not None else None
+
+    def find_similar(self, key: CacheKey) -> Optional[ReasoningResult]:
+        """
+        Cached result of a near-duplicate of ``key``, with its answer renumbered
+        to the position of the same option text in ``key``; None if there is none
+        """
+        similar = _similar_key(key)
+        with self._lock:
+            found = self._similar.get(similar)
+            if found is None:
+                return None
+            result = self._entries[found].copy()
+        if not 1 <= (result.predicted_answer or 0) <= len(found[1]):
+            return None
+        answer = _normalize(found[1][result.predicted_answer - 1])
+        positions = [index for index, option in enumerate(key[1], 1) if _normalize(option) == answer]
+        if len(positions) != 1:
+            return None
+        result.predicted_answer = positions[0]
+        with self._lock:
+            self.similar_hits += 1
+        return result
+
+    def put(self, key: CacheKey, result: ReasoningResult):
+        with self._lock:
+            self._entries[key] = result.copy()
+            self._entries.move_to_end(key)
+            self._similar[_similar_key(key)] = key
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                similar = _similar_key(evicted)
+                if self._similar.get(similar) == evicted:
+                    del self._similar[similar]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'similar_hits': self.similar_hits}
+
+
+class VerificationMetrics:
+    """Counts of queued, dropped and finished verifications by outcome"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.outcomes = {}
+        self.methods = {}
+        self.elapsed_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record_submit(self, accepted: bool):
+        with self._lock:
+            if accepted:
+                self.submitted += 1
+            else:
+                self.dropped += 1
+
+    def record(self, outcome: str, method: Optional[str], elapsed_ms: float):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if method is not None:
+                self.methods[method] = self.methods.get(method, 0) + 1
+            self.elapsed_ms += elapsed_ms
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            finished = sum(self.outcomes.values())
+            return {
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'finished': finished,
+                'outcomes': dict(self.outcomes),
+                'methods': dict(self.methods),
+                'revised_rate': self.outcomes.get('revised', 0) / finished if finished else 0.0,
+                'mean_ms': self.elapsed_ms / finished if finished else 0.0
+            }
+
+
+# Process-wide counters shared by all verification queues
+verification_metrics = VerificationMetrics()
+
+
+class VerificationQueue:
+    """
+    Background re-checks of answers that were already returned
+
+    ``verify_fn(problem, options, result, category)`` returns the verified
+    result, whose ``verification`` is 'confirmed', 'revised' or 'unresolved',
+    and the method that decided it ('engine', 'llm' or None).
+    The queue is bounded and ``submit`` never blocks: when it is full the
+    answer simply stays unverified. Each problem is queued at most once at a
+    time. Finished results go into the cache and then to every listener
+    ``fn(key, result)``.
+    """
+
+    def __init__(self, verify_fn: Callable, cache: ResponseCache, workers: int = VERIFY_WORKERS,
+                 max_pending: int = VERIFY_QUEUE_SIZE):
+        self.verify_fn = verify_fn
+        self.cache = cache
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable] = []
+        self._threads = [threading.Thread(target=self._work, name=f'verify-{index}', daemon=True)
+                         for index in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def add_listener(self, fn: Callable[[CacheKey, ReasoningResult], None]):
+        self._listeners.append(fn)
+
+    def submit(self, key: CacheKey, problem: str, options: Dict[str, str], result: ReasoningResult,
+               category: Optional[str]) -> bool:
+        """Queue a result for verification; False if the queue is full"""
+        with self._lock:
+            if key in self._pending:
+                return True
+            try:
+                self._queue.put_nowait((key, problem, options, result, category))
+            except queue.Full:
+                verification_metrics.record_submit(False)
+                return False
+            self._pending.add(key)
+        verification_metrics.record_submit(True)
+        return True
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, problem, options, result, category = item
+            start = time.perf_counter()
+            try:
+                verified, method = self.verify_fn(problem, options, result, category)
+            except Exception:
+                verified, method = result.copy(), None
+                verified.verification = 'unresolved'
+            verification_metrics.record(verified.verification, method, (time.perf_counter() - start) * 1000)
+            self.cache.put(key, verified)
+            with self._lock:
+                self._pending.discard(key)
+            for listener in self._listeners:
+                try:
+                    listener(key, verified.copy())
+                except Exception as e:
+                    print(f"✗ Verification listener failed: {e}")
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def snapshot(self) -> Dict:
+        return {**verification_metrics.snapshot(), 'pending': self.pending(), 'cache': self.cache.snapshot()}
+
+    def shutdown(self):
+        """Stop the workers once they finish their current item (queued checks are dropped)"""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self._threads:
+            self._queue.put(None)
@@ -0,0 +1,8 @@
+"""Test setup: the modules under src/ import each other by flat name"""
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,78 @@
+"""Hard budget caps: a solve the budget cannot pay for makes no LLM call"""
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import usage_ledger as usage_ledger_module
+from reasoning_agents import SpecializedReasoningAgent
+from token_budget import count_message_tokens
+from usage_ledger import UsageBudget, UsageLedger
+
+OPTIONS = {f'option_{number}': f'{number * 10} minutes' for number in range(1, 5)}
+OPTIONS['option_5'] = 'Another answer'
+PROBLEM = 'A task takes some minutes on each machine. How long does the whole job take?'
+
+
+class CountingLLM:
+    """Chat model that answers option 2 and reports its usage as the cap it was given"""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages, max_tokens=None, **kwargs):
+        self.calls.append(max_tokens)
+        prompt_tokens = count_message_tokens(messages)
+        return AIMessage(content='REASONING: r\nANSWER: 2\nCONFIDENCE: 0.9\n',
+                         usage_metadata={'input_tokens': prompt_tokens, 'output_tokens': max_tokens,
+                                         'total_tokens': prompt_tokens + max_tokens})
+
+
+@pytest.fixture(autouse=True)
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_ledger_module, 'usage_ledger', UsageLedger(path=str(tmp_path / 'usage.db')))
+
+
+def _agent(llm):
+    return SpecializedReasoningAgent('Logic', llm, structured=False, hedge=False, option_filter=False)
+
+
+def _compact_prompt_tokens(agent) -> int:
+    prompt = agent.prompt_template.format(problem=PROBLEM, **OPTIONS)
+    return count_message_tokens(agent._build_messages(prompt, compact=True))
+
+
+def test_exhausted_budget_makes_no_call():
+    llm = CountingLLM()
+    budget = UsageBudget(max_tokens=1000, spent_tokens=1000)
+
+    result = _agent(llm).solve(PROBLEM, OPTIONS, budget=budget)
+
+    assert llm.calls == []
+    assert result.degraded == 'fallback' and result.budget_degraded
+    assert result.predicted_answer == 3  # Middle value: the best cheap score
+    assert budget.spent_tokens == 1000 and budget.degraded_calls == 1
+
+
+def test_call_stays_within_the_cap():
+    llm = CountingLLM()
+    agent = _agent(llm)
+    # Room for the compact prompt and a little more than the minimum completion
+    budget = UsageBudget(max_tokens=_compact_prompt_tokens(agent) + 100)
+
+    result = agent.solve(PROBLEM, OPTIONS, budget=budget)
+
+    assert result.predicted_answer == 2 and result.budget_degraded
+    assert budget.spent_tokens <= budget.max_tokens
+
+    # The next solve cannot afford BUDGET_MIN_COMPLETION_TOKENS and makes no call
+    assert agent.solve(PROBLEM, OPTIONS, budget=budget).degraded == 'fallback'
+    assert len(llm.calls) == 1 and budget.spent_tokens <= budget.max_tokens
+
+
+def test_short_tier_respects_the_budget():
+    llm = CountingLLM()
+    budget = UsageBudget(max_tokens=50)
+
+    result = _agent(llm).solve(PROBLEM, OPTIONS, budget=budget, tier='short')
+
+    assert llm.calls == [] and result.degraded == 'fallback'
@@ -0,0 +1,42 @@
+"""Classifier compression: pruned vocabulary and the direct TF-IDF transform"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from category_classifier import CategoryClassifier, CompressedTfidfVectorizer, split_validation
+from config import TRAIN_FILE
+from data_loader import read_columns
+
+
+@pytest.fixture(scope='module')
+def data():
+    train_df = read_columns(TRAIN_FILE, ['problem_statement', 'topic'])
+    return train_df, split_validation(train_df)[1]
+
+
+def test_compress_drops_long_terms(data):
+    train_df, _ = data
+    classifier = CategoryClassifier()
+    classifier.train(train_df)
+
+    summary = classifier.compress(keep_features=500, max_ngram=2)
+
+    assert summary['ngram_range'] == (1, 2) and summary['kept_features'] == 500
+    assert all(len(term.split(' ')) <= 2 for term in classifier.vectorizer.get_feature_names_out())
+
+
+def test_direct_transform_matches_sklearn(data):
+    train_df, X_val = data
+    classifier = CategoryClassifier()
+    classifier.train(train_df)
+    classifier.compress()
+    vectorizer = classifier.vectorizer
+    assert isinstance(vectorizer, CompressedTfidfVectorizer)
+
+    expected = vectorizer.vectorizer.transform(X_val).toarray()
+    np.testing.assert_allclose(vectorizer.transform(X_val).toarray(), expected, atol=1e-6)
+    restored = pickle.loads(pickle.dumps(vectorizer))
+    np.testing.assert_allclose(restored.transform(X_val).toarray(), expected, atol=1e-6)
+    assert vectorizer.transform(['qqq zzz']).nnz == 0
@@ -0,0 +1,119 @@
+"""Coordinator and local worker processes on the local and file queues, with a stub pipeline"""
+
+import csv
+import json
+import os
+import time
+
+import pytest
+
+from distributed import make_queue, run_coordinator, spawn_local_workers
+from records import ReasoningResult
+
+ROWS = 40
+SHARD_SIZE = 5
+
+
+class StubPipeline:
+    """
+    Answers row ``i`` with ``i % 5 + 1`` without any model
+
+    Problem text steers the stub: 'slow' rows delay their shard so shards
+    finish out of order, 'fail-once' raises the first time any worker sees
+    it and 'hang' never returns in time.
+    """
+
+    def __init__(self, marker_dir: str):
+        self.marker_dir = marker_dir
+
+    def _process_row(self, row):
+        index, problem, options = row
+        if problem == 'slow':
+            time.sleep(0.3)
+        elif problem == 'fail-once':
+            try:
+                os.close(os.open(os.path.join(self.marker_dir, f'failed-{index}'), os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                pass
+            else:
+                raise RuntimeError('worker crashed')
+        elif problem == 'hang':
+            time.sleep(30)
+        result = ReasoningResult(index % 5 + 1, 0.9, f'ANSWER: {index % 5 + 1}', 'stub', 'Logic')
+        result.row_index = index
+        return result
+
+
+def _write_test_csv(path: str, special: dict) -> str:
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['problem_statement'] + [f'answer_option_{i}' for i in range(1, 6)])
+        for index in range(ROWS):
+            writer.writerow([special.get(index, f'problem {index}')] + [f'option {i}' for i in range(1, 6)])
+    return path
+
+
+def _expected(index: int) -> int:
+    return index % 5 + 1
+
+
+@pytest.fixture(params=['local', 'file'])
+def run(request, tmp_path):
+    """Run a coordinator with two spawned workers; returns (summary, answers, detailed rows)"""
+    processes = []
+
+    def run_distributed(special=None, **coordinator_kwargs):
+        work_queue = make_queue(request.param, str(tmp_path / 'queue'))
+        work_queue.reset()
+        processes.extend(spawn_local_workers(work_queue, 2, max_workers=2,
+                                             pipeline=StubPipeline(str(tmp_path))))
+        output = str(tmp_path / 'output.csv')
+        summary = run_coordinator(_write_test_csv(str(tmp_path / 'test.csv'), special or {}),
+                                  work_queue, output, shard_size=SHARD_SIZE, **coordinator_kwargs)
+        with open(output) as f:
+            answers = [int(row['predicted_answer']) for row in csv.DictReader(f)]
+        with open(output.replace('.csv', '_detailed.jsonl')) as f:
+            detailed = [json.loads(line) for line in f]
+        return summary, answers, detailed
+
+    yield run_distributed
+    for process in processes:
+        process.join(timeout=3)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def test_results_are_merged_in_row_order(run):
+    # The first shard is the slowest, so later shards finish before it
+    summary, answers, detailed = run(special={index: 'slow' for index in range(SHARD_SIZE)})
+
+    assert answers == [_expected(index) for index in range(ROWS)]
+    assert [row['row_index'] for row in detailed] == list(range(ROWS))
+    assert summary == {'rows': ROWS, 'shards': ROWS // SHARD_SIZE, 'retries': 0, 'failed_shards': 0}
+
+
+def test_failed_shard_is_retried(run):
+    summary, answers, _ = run(special={12: 'fail-once'})
+
+    assert answers == [_expected(index) for index in range(ROWS)]
+    assert summary['retries'] == 1 and summary['failed_shards'] == 0
+
+
+def test_timed_out_shard_falls_back_to_defaults(run):
+    summary, answers, detailed = run(special={7: 'hang'}, shard_timeout=1.0, max_attempts=1)
+
+    timed_out = range(SHARD_SIZE, 2 * SHARD_SIZE)
+    default = ReasoningResult.failed('').predicted_answer
+    assert answers == [default if index in timed_out else _expected(index) for index in range(ROWS)]
+    assert all('timed out' in detailed[index]['error'] for index in timed_out)
+    assert [row['row_index'] for row in detailed] == list(range(ROWS))
+    assert summary['failed_shards'] == 1 and summary['rows'] == ROWS
+
+
+def test_throughput_scales_with_workers():
+    from benchmark import run_distributed_benchmark
+    results = run_distributed_benchmark((1, 4), rows=80, latency_ms=20.0, threads=1, shard_size=5)
+
+    # Ideal is 4x; allow for process start-up and coordinator polling
+    assert results[4]['speedup'] >= 2.5
@@ -0,0 +1,67 @@
+"""run_hedged: the hedge wins a slow primary, and a streamed losing attempt really stops"""
+
+import threading
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+from hedging import HedgeBudget, HedgeMetrics, LatencyTracker, in_hedged_call, run_hedged
+from reasoning_agents import SpecializedReasoningAgent
+
+ANSWER = "REASONING: r\nANSWER: 2\nCONFIDENCE: 0.9\n"
+
+
+def _tracker(latency_ms: float) -> LatencyTracker:
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(5):
+        tracker.record(latency_ms)
+    return tracker
+
+
+class SlowFirstStream:
+    """Chat model whose first stream is slow (one chunk per 20 ms) and the rest fast"""
+
+    def __init__(self):
+        self.streams = 0
+        self.chunks_sent = []
+        self.closed = []
+        self._lock = threading.Lock()
+
+    def stream(self, messages, **kwargs):
+        with self._lock:
+            number, self.streams = self.streams, self.streams + 1
+        self.chunks_sent.append(0)
+        try:
+            for char in ANSWER * (50 if number == 0 else 1):
+                if number == 0:
+                    time.sleep(0.02)
+                self.chunks_sent[number] += 1
+                yield AIMessageChunk(content=char)
+        finally:
+            self.closed.append(number)
+
+    def invoke(self, messages, **kwargs):
+        raise AssertionError('hedged attempts must stream')
+
+
+def test_losing_streamed_attempt_is_closed():
+    llm = SlowFirstStream()
+    agent = SpecializedReasoningAgent('Logic', llm, structured=False, hedge=True, option_filter=False)
+    messages = agent._build_messages('Which option?', compact=True)
+    metrics = HedgeMetrics()
+
+    result = run_hedged(lambda cancel: agent._attempt(messages, cancel), _tracker(30.0), 95,
+                        budget=HedgeBudget(10), metrics=metrics)
+
+    assert result.predicted_answer == 2
+    assert metrics.hedge_wins == 1
+    deadline = time.monotonic() + 2
+    while 0 not in llm.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 0 in llm.closed  # The slow primary's stream was closed...
+    assert llm.chunks_sent[0] < len(ANSWER) * 50  # ...long before it finished
+
+
+def test_attempts_are_marked_as_hedged():
+    seen = run_hedged(lambda cancel: in_hedged_call(), LatencyTracker(), 95, budget=HedgeBudget(0))
+    assert seen is True and not in_hedged_call()
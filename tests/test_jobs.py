@@ -0,0 +1,137 @@
+"""JobRunner: items run through the scheduler, runner failures and completion callbacks"""
+
+import json
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jobs import JobRunner, JobStore
+from records import ReasoningResult
+
+ITEMS = [(f'problem {index}', [f'option {i}' for i in range(1, 6)]) for index in range(5)]
+
+
+class _Job:
+    def __init__(self, future):
+        self.future = future
+
+
+class InlineScheduler:
+    """Runs each solve on submit; ``fail_after`` submits later it raises instead"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.submitted = 0
+
+    def submit(self, fn, *args, priority='interactive', client_id=None):
+        if self.fail_after is not None and self.submitted >= self.fail_after:
+            raise RuntimeError('scheduler is shut down')
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return _Job(future)
+
+
+def _solve(problem, options, budget):
+    return ReasoningResult(2, 0.9, 'ANSWER: 2', 'stub', 'Logic')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def _run(store, scheduler, callback_url=None):
+    job_id = store.create_job(ITEMS, callback_url=callback_url)
+    runner = JobRunner(store, scheduler, _solve, max_in_flight=2, callback_backoff=0.0)
+    runner.start(job_id)
+    thread = runner._threads.get(job_id)  # None once the job has already finished
+    if thread is not None:
+        thread.join(timeout=5)
+    return store.get_job(job_id), runner
+
+
+def test_job_completes(store):
+    job, runner = _run(store, InlineScheduler())
+
+    assert job['status'] == 'completed' and job['error'] is None
+    assert job['completed'] == len(ITEMS) and job['progress'] == 1.0
+    assert runner._threads == {}
+
+
+def test_runner_failure_marks_job_failed(store):
+    job, runner = _run(store, InlineScheduler(fail_after=3))
+
+    assert job['status'] == 'failed'
+    assert job['error'] == 'scheduler is shut down'
+    assert job['completed'] == 2  # Items persisted before the failure are kept
+    assert runner._threads == {}
+    assert job['id'] not in store.unfinished_jobs()
+
+
+class CallbackReceiver:
+    """Webhook endpoint that answers with the queued status codes (then 200)"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.payloads = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                receiver.payloads.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(receiver.statuses.pop(0) if receiver.statuses else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/hook'
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def receiver():
+    receivers = []
+
+    def start(statuses=()):
+        receivers.append(CallbackReceiver(statuses))
+        return receivers[-1]
+
+    yield start
+    for started in receivers:
+        started.close()
+
+
+def test_callback_is_retried_until_delivered(store, receiver):
+    hook = receiver(statuses=[503, 500])
+    job, _ = _run(store, InlineScheduler(), callback_url=hook.url)
+
+    assert len(hook.payloads) == 3  # Two server errors, then delivered
+    assert hook.payloads[-1]['id'] == job['id']
+    assert hook.payloads[-1]['status'] == 'completed' and hook.payloads[-1]['completed'] == len(ITEMS)
+
+
+def test_callback_reports_a_failed_job(store, receiver):
+    hook = receiver()
+    _run(store, InlineScheduler(fail_after=3), callback_url=hook.url)
+
+    assert [(p['status'], p['error']) for p in hook.payloads] == [('failed', 'scheduler is shut down')]
+
+
+def test_callback_gives_up_after_bounded_attempts(store, receiver):
+    always_down = receiver(statuses=[500] * 10)
+    _run(store, InlineScheduler(), callback_url=always_down.url)
+    assert len(always_down.payloads) == 3
+
+    rejected = receiver(statuses=[404])
+    _run(store, InlineScheduler(), callback_url=rejected.url)
+    assert len(rejected.payloads) == 1  # Client errors are not retried
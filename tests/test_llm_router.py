@@ -0,0 +1,243 @@
+"""LLMRouter against two local OpenAI-compatible mock servers: failover, hedging, selection"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+import usage_ledger as usage_ledger_module
+from hedging import HedgeBudget, LatencyTracker, run_hedged
+from llm_router import LLMBackend, LLMRouter
+from usage_ledger import UsageBudget, UsageLedger, charging
+
+MESSAGES = [HumanMessage(content='Which option is correct?')]
+
+
+class MockServer:
+    """Chat completions endpoint with a configurable delay and failure mode"""
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.requests += 1
+                time.sleep(server.delay)
+                if server.fail:
+                    body, status = {'error': {'message': 'backend down', 'type': 'server_error'}}, 500
+                else:
+                    body, status = {
+                        'id': f'chatcmpl-{server.name}',
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': 'mock-model',
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': f'ANSWER: 1 ({server.name})'}}],
+                        'usage': {'prompt_tokens': 12, 'completion_tokens': 8, 'total_tokens': 20}
+                    }, 200
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}/v1'
+
+    def backend(self) -> LLMBackend:
+        client = ChatOpenAI(model='mock-model', api_key='not-needed', base_url=self.url,
+                            timeout=10, max_retries=0)
+        return LLMBackend(self.name, client)
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def servers():
+    started = {}
+
+    def start(name, **kwargs):
+        started[name] = MockServer(name, **kwargs)
+        return started[name]
+
+    yield start
+    for server in started.values():
+        server.close()
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = UsageLedger(path=str(tmp_path / 'usage.db'))
+    monkeypatch.setattr(usage_ledger_module, 'usage_ledger', ledger)
+    return ledger
+
+
+def _seed(backend: LLMBackend, latency_ms: float, samples: int = 20):
+    for _ in range(samples):
+        backend.stats.record(latency_ms, error=False)
+
+
+def test_failover_to_next_backend(servers):
+    down, up = servers('down', fail=True).backend(), servers('up').backend()
+    router = LLMRouter([down, up], hedge=False)
+
+    response = router.invoke(MESSAGES)
+
+    assert response.response_metadata['backend'] == 'up'
+    assert router.snapshot()['failovers'] == 1
+    assert down.stats.errors == 1 and up.stats.errors == 0
+
+
+def test_fallbacks_only_after_primaries_fail(servers):
+    down, spare = servers('down', fail=True).backend(), servers('spare').backend()
+    router = LLMRouter([down], fallbacks=[spare])
+
+    assert router.invoke(MESSAGES).response_metadata['backend'] == 'spare'
+    assert router.fallback_calls == 1
+
+
+def test_selects_lower_latency_backend(servers):
+    slow, fast = servers('slow', delay=0.2).backend(), servers('fast').backend()
+    router = LLMRouter([slow, fast], hedge=False)
+    slow.invoke(MESSAGES)
+    fast.invoke(MESSAGES)
+    assert fast.stats.ewma_latency_ms < slow.stats.ewma_latency_ms
+
+    for _ in range(3):
+        assert router.invoke(MESSAGES).response_metadata['backend'] == 'fast'
+    assert slow.stats.calls == 1
+
+
+def test_hedge_wins_and_loser_is_charged(servers, ledger):
+    slow_server = servers('slow', delay=0.5)
+    slow, fast = slow_server.backend(), servers('fast').backend()
+    # The slow backend ranks first on its history, and its p95 (10 ms) sets the hedge delay
+    _seed(slow, 10.0)
+    _seed(fast, 50.0)
+    router = LLMRouter([slow, fast])
+    budget = UsageBudget(scope='test')
+
+    with charging(budget, 'logic'):
+        started = time.perf_counter()
+        response = router.invoke(MESSAGES)
+        elapsed = time.perf_counter() - started
+
+    assert response.response_metadata['backend'] == 'fast'
+    assert elapsed < slow_server.delay
+    assert router.hedged_calls == 1
+    assert slow_server.requests == 1
+
+    # The slow call keeps running; its tokens land on the budget once it completes
+    deadline = time.monotonic() + 5
+    while budget.spent_tokens == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert budget.spent_tokens == 20
+    totals = ledger.totals()['by_category']['logic']
+    assert totals['calls'] == 1 and totals['completion_tokens'] == 8
+    ledger.flush()
+    purposes = ledger._conn.execute('SELECT scope, purpose FROM usage').fetchall()
+    assert purposes == [('test', 'hedge_loser')]
+
+
+def test_no_hedge_before_enough_samples(servers):
+    slow_server, fast_server = servers('slow', delay=0.1), servers('fast')
+    router = LLMRouter([slow_server.backend(), fast_server.backend()])
+
+    assert router.invoke(MESSAGES).response_metadata['backend'] == 'slow'
+    assert router.hedged_calls == 0
+    assert fast_server.requests == 0
+
+
+class _StreamingClient:
+    def __init__(self, chunks, delay):
+        self.chunks, self.delay = chunks, delay
+
+    def stream(self, messages, **kwargs):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+
+def test_stream_tracks_first_chunk_separately():
+    backend = LLMBackend('streaming', _StreamingClient(['a', 'b', 'c', 'd'], delay=0.02))
+    router = LLMRouter([backend])
+
+    assert list(router.stream(MESSAGES)) == ['a', 'b', 'c', 'd']
+    assert len(backend.stats.first_chunk) == 1 and len(backend.stats.latencies) == 1
+    assert backend.stats.ewma_latency_ms >= 4 * 20
+
+    # A stream the consumer stops early counts as a success with no duration sample
+    stream = router.stream(MESSAGES)
+    next(stream)
+    stream.close()
+    assert backend.stats.calls == 2 and backend.stats.errors == 0
+    assert len(backend.stats.latencies) == 1 and len(backend.stats.first_chunk) == 2
+
+
+def _hedge_ready_pair(servers):
+    """A slow backend that ranks first with a 10 ms p95, and a fast one to hedge to"""
+    slow_server, fast_server = servers('slow', delay=0.3), servers('fast')
+    slow, fast = slow_server.backend(), fast_server.backend()
+    _seed(slow, 10.0)
+    _seed(fast, 50.0)
+    return slow, fast, fast_server
+
+
+def test_hedges_draw_on_the_hedge_budget(servers):
+    slow, fast, fast_server = _hedge_ready_pair(servers)
+    router = LLMRouter([slow, fast], hedge_budget=HedgeBudget(per_minute=1))
+
+    assert router.invoke(MESSAGES).response_metadata['backend'] == 'fast'
+    assert router.invoke(MESSAGES).response_metadata['backend'] == 'slow'  # Budget spent
+    assert (router.hedged_calls, router.hedges_denied, fast_server.requests) == (1, 1, 1)
+
+
+def test_no_router_hedge_inside_an_agent_hedge(servers):
+    slow, fast, fast_server = _hedge_ready_pair(servers)
+    router = LLMRouter([slow, fast], hedge_budget=HedgeBudget(per_minute=100))
+    tracker = LatencyTracker(min_samples=1000)  # Never hedges at the agent level
+
+    response = run_hedged(lambda cancel: router.invoke(MESSAGES), tracker, 95, budget=HedgeBudget(0))
+
+    assert response.response_metadata['backend'] == 'slow'
+    assert router.hedged_calls == 0 and fast_server.requests == 0
+
+
+def test_reconfigured_transport_gets_new_backends(tmp_path, monkeypatch):
+    from llm_transport import ReplayClient, llm_transport
+    from reasoning_agents import MultiAgentReasoningSystem
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    previous = llm_transport.mode
+    live = MultiAgentReasoningSystem()
+
+    llm_transport.configure('replay', str(tmp_path / 'archive.db'))
+    try:
+        replay = MultiAgentReasoningSystem()
+    finally:
+        llm_transport.configure(previous)
+
+    assert replay.backends is not live.backends
+    assert all(isinstance(backend.client, ReplayClient) for backend in replay.backends.backends.values())
+    assert not any(isinstance(backend.client, ReplayClient) for backend in live.backends.backends.values())
+    assert replay.agents is not live.agents
+    assert MultiAgentReasoningSystem().backends is not replay.backends  # Back to the previous mode
@@ -0,0 +1,150 @@
+"""LoadMonitor tier selection, hold and probe timing, and the queue-full local answer"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import load_shedding
+from config import LOAD_ERROR_RATE, LOAD_QUEUE_FILL
+from load_shedding import LoadMonitor
+from main import MLReasoningPipeline
+from records import ReasoningResult
+from verification import ResponseCache, cache_key
+
+OPTIONS = ['1', '2', '8', '15', 'None of the above']
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.fill = 0.0
+        self.listeners = []
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def queue_fill(self, priority):
+        return self.fill
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(load_shedding.time, 'monotonic', clock)
+    return clock
+
+
+def _monitor(error_rate=0.0, **kwargs):
+    stats = SimpleNamespace(ewma_error_rate=error_rate, calls=10)
+    backends = SimpleNamespace(backends={'primary': SimpleNamespace(stats=stats)})
+    monitor = LoadMonitor(FakeScheduler(), backends, hold=10.0, probe_interval=5.0, **kwargs)
+    return monitor, stats
+
+
+def test_tier_follows_the_worst_signal(clock):
+    monitor, stats = _monitor()
+    assert monitor.tier() == 'full'
+
+    monitor.scheduler.fill = LOAD_QUEUE_FILL
+    assert monitor.tier() == 'short'  # A deep queue alone never skips the LLM
+
+    stats.ewma_error_rate = LOAD_ERROR_RATE['local']
+    monitor._last_probe = clock.now  # No probe due yet
+    assert monitor.tier() == 'local'
+
+
+def test_slo_breaches_raise_the_tier(clock):
+    monitor, _ = _monitor(slo_ms=1000, window=10)
+    job = SimpleNamespace(priority='interactive', queue_wait_ms=800.0, solve_ms=400.0)
+    for listener in monitor.scheduler.listeners:
+        for _ in range(5):
+            listener(job)
+
+    assert monitor.signals()['slo_breach_rate'] == 1.0
+    assert monitor.tier() == 'short'
+
+
+def test_raised_tier_is_held_before_stepping_down(clock):
+    monitor, _ = _monitor()
+    monitor.scheduler.fill = 1.0
+    assert monitor.tier() == 'short'
+
+    monitor.scheduler.fill = 0.0
+    clock.now += 9.0
+    assert monitor.tier() == 'short'
+    clock.now += 1.0
+    assert monitor.tier() == 'full'
+    assert monitor.snapshot()['tiers'] == {'full': 1, 'short': 2, 'local': 0}
+
+
+def test_failing_backends_are_probed_at_the_short_tier(clock):
+    monitor, stats = _monitor(error_rate=1.0)
+
+    assert monitor.tier() == 'short'  # First solve after the failure probes the backends
+    assert monitor.tier() == 'local'
+    clock.now += 4.9
+    assert monitor.tier() == 'local'
+    clock.now += 0.1
+    assert monitor.tier() == 'short'
+    assert monitor.tier() == 'local'
+
+    # Recovered backends: the local tier is held, then steps down
+    stats.ewma_error_rate = 0.0
+    assert monitor.tier() == 'local'
+    clock.now += 10.0
+    assert monitor.tier() == 'full'
+
+
+class _ReasoningSystem:
+    def __init__(self, local_answer=None):
+        self.local_answer = local_answer
+
+    def solve_locally(self, problem, options, category=None):
+        return self.local_answer.copy() if self.local_answer is not None else None
+
+
+def _pipeline(local_answer=None) -> MLReasoningPipeline:
+    """Pipeline with just the parts answer_without_queue uses (no model, no LLM)"""
+    pipeline = MLReasoningPipeline.__new__(MLReasoningPipeline)
+    pipeline.response_cache = ResponseCache()
+    pipeline.reasoning_system = _ReasoningSystem(local_answer)
+    pipeline.load_monitor, _ = _monitor()
+    pipeline._classify = lambda problem: ('Math', 0.8)
+    return pipeline
+
+
+def test_queue_full_serves_a_near_duplicate():
+    pipeline = _pipeline()
+    pipeline.response_cache.put(cache_key('What is 5 - 3?', OPTIONS),
+                                ReasoningResult(2, 0.9, 'ANSWER: 2', 'regex', 'Math'))
+
+    result = pipeline.answer_without_queue('what is 5 - 3?', list(reversed(OPTIONS)))
+
+    assert result.degraded == 'near_duplicate' and result.predicted_answer == 4
+    assert pipeline.load_monitor.snapshot()['degraded'] == {'near_duplicate': 1}
+
+
+def test_queue_full_uses_the_local_engine():
+    engine_answer = ReasoningResult(3, 0.95, '', 'engine', 'Math')
+    pipeline = _pipeline(local_answer=engine_answer)
+
+    result = pipeline.answer_without_queue('What is 5 + 3?', OPTIONS)
+
+    assert result.predicted_answer == 3 and result.parse_method == 'engine'
+    assert result.category == 'Math' and result.category_confidence == 0.8
+
+
+def test_queue_full_sheds_what_nothing_can_answer():
+    pipeline = _pipeline()
+    pipeline.response_cache.put(cache_key('What is 5 - 3?', OPTIONS),
+                                ReasoningResult(2, 0.9, 'ANSWER: 2', 'regex', 'Math'))
+
+    assert pipeline.answer_without_queue('What is 5 + 3?', OPTIONS) is None
+    assert pipeline.load_monitor.snapshot()['shed'] == 1
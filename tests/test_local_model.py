@@ -0,0 +1,187 @@
+"""ContinuousBatcher scheduling against a small fake batched-decode model"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import local_model
+from local_model import ContinuousBatcher, LlamaCppModel
+
+EOG = 0
+STOP_TOKEN = 27  # '!': the token after it is end-of-generation
+
+
+class FakeModel:
+    """
+    Letters a-z are tokens 1-26; each step predicts the letter after the last
+    input token (z wraps to a), and '!' is followed by end-of-generation.
+
+    The fake keeps a KV cell count per sequence and checks that every decode
+    continues its sequence at the right position and stays within ``n_ctx``.
+    """
+
+    def __init__(self, n_ctx: int = 256, step_delay: float = 0.0):
+        self.n_ctx = n_ctx
+        self.step_delay = step_delay
+        self.cells = {}
+        self.calls = []
+        self.released = []
+        self.max_sequences = 0
+        self._lock = threading.Lock()
+
+    def tokenize(self, text: str):
+        return [STOP_TOKEN if char == '!' else ord(char) - ord('a') + 1 for char in text]
+
+    def token_bytes(self, token: int) -> bytes:
+        return b'!' if token == STOP_TOKEN else bytes([ord('a') + token - 1])
+
+    def is_eog(self, token: int) -> bool:
+        return token == EOG
+
+    def decode(self, entries):
+        time.sleep(self.step_delay)
+        rows = []
+        with self._lock:
+            self.calls.append([(seq_id, list(tokens), start) for seq_id, tokens, start in entries])
+            for seq_id, tokens, start in entries:
+                assert start == self.cells.get(seq_id, 0), 'decode must continue the sequence'
+                self.cells[seq_id] = start + len(tokens)
+                last = tokens[-1]
+                row = np.zeros(STOP_TOKEN + 1, dtype=np.float32)
+                row[EOG if last == STOP_TOKEN else last % 26 + 1] = 1.0
+                rows.append(row)
+            assert sum(self.cells.values()) <= self.n_ctx
+            self.max_sequences = max(self.max_sequences, len(self.cells))
+        return np.stack(rows)
+
+    def release(self, seq_id: int):
+        with self._lock:
+            self.cells.pop(seq_id, None)
+            self.released.append(seq_id)
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+
+    def make(model, **kwargs):
+        batchers.append(ContinuousBatcher(model, seed=0, **kwargs))
+        return batchers[-1]
+
+    yield make
+    for batcher in batchers:
+        batcher.shutdown()
+
+
+def _wait(requests, timeout: float = 5.0):
+    for request in requests:
+        assert request.done.wait(timeout), 'generation did not finish'
+
+
+def _assert_released(batcher, model):
+    assert model.cells == {}
+    assert sorted(batcher._free_slots) == list(range(batcher.max_batch))
+    assert batcher._reserved == 0 and batcher._active == []
+
+
+def test_generates_until_max_tokens_or_end_of_generation(make_batcher):
+    model = FakeModel()
+    batcher = make_batcher(model, max_batch=2)
+
+    long = batcher.submit(model.tokenize('ab'), max_tokens=5)
+    ended = batcher.submit(model.tokenize('ab!'), max_tokens=5)
+    _wait([long, ended])
+
+    assert (long.text, long.finish_reason, long.generated) == ('cdefg', 'length', 5)
+    assert (ended.text, ended.finish_reason, ended.generated) == ('', 'stop', 0)
+
+
+def test_admission_respects_kv_reservation(make_batcher):
+    # Each request reserves 4 prompt + 10 completion cells; only two fit in 30
+    model = FakeModel(n_ctx=30, step_delay=0.002)
+    batcher = make_batcher(model, max_batch=4)
+
+    requests = [batcher.submit(model.tokenize('abcd'), max_tokens=10) for _ in range(5)]
+    _wait(requests)
+
+    assert model.max_sequences == 2
+    assert all(request.text == 'efghijklmn' for request in requests)
+    with pytest.raises(ValueError):
+        batcher.submit(model.tokenize('abcd'), max_tokens=40)
+    _assert_released(batcher, model)
+
+
+def test_prefill_is_chunked_and_interleaved_with_decode(make_batcher):
+    model = FakeModel(step_delay=0.002)
+    batcher = make_batcher(model, max_batch=2, prefill_chunk=4)
+
+    running = batcher.submit(model.tokenize('a'), max_tokens=40)
+    while running.generated == 0:
+        time.sleep(0.001)
+    joining = batcher.submit(model.tokenize('abcdefghijklmnop'), max_tokens=3)
+    _wait([running, joining])
+
+    prefill_steps = [call for call in model.calls
+                     if any(seq_id == joining.seq_id and len(tokens) > 1 for seq_id, tokens, _ in call)]
+    assert len(prefill_steps) == 4  # 16 prompt tokens in chunks of 4
+    for call in prefill_steps:
+        assert sum(len(tokens) for seq_id, tokens, _ in call if seq_id == joining.seq_id) == 4
+        # The running sequence keeps decoding one token per step alongside the prefill
+        assert [len(tokens) for seq_id, tokens, _ in call if seq_id == running.seq_id] == [1]
+    assert joining.text == 'qrs'
+    assert running.finish_reason == 'length'
+
+
+def test_stop_string_truncates_text_and_stream(make_batcher):
+    model = FakeModel()
+    batcher = make_batcher(model, max_batch=2)
+
+    request = batcher.submit(model.tokenize('a'), max_tokens=20, stop=['fg'], stream=True)
+    chunks = []
+    while (chunk := request.chunks.get(timeout=5)) is not None:
+        chunks.append(chunk)
+
+    assert request.finish_reason == 'stop'
+    assert request.text == ''.join(chunks) == 'bcde'
+    _assert_released(batcher, model)
+
+
+def test_cancel_frees_the_slot_for_waiting_requests(make_batcher):
+    model = FakeModel(step_delay=0.002)
+    batcher = make_batcher(model, max_batch=1)
+
+    cancelled = batcher.submit(model.tokenize('a'), max_tokens=200)
+    waiting = batcher.submit(model.tokenize('a'), max_tokens=3)
+    while cancelled.generated < 3:
+        time.sleep(0.001)
+    assert waiting.seq_id is None  # No free slot while the first request runs
+
+    batcher.cancel(cancelled)
+    _wait([cancelled, waiting])
+
+    assert cancelled.finish_reason == 'cancelled' and cancelled.generated < 200
+    assert waiting.seq_id == cancelled.seq_id and waiting.text == 'bcd'
+    assert model.released == [cancelled.seq_id, waiting.seq_id]
+    _assert_released(batcher, model)
+
+
+def test_shutdown_fails_unfinished_requests():
+    model = FakeModel(step_delay=0.002)
+    batcher = ContinuousBatcher(model, max_batch=1)
+    running = batcher.submit(model.tokenize('a'), max_tokens=200)
+    queued = batcher.submit(model.tokenize('a'), max_tokens=5)
+
+    batcher.shutdown()
+
+    assert running.done.is_set() and queued.done.is_set()
+    assert isinstance(running.error, RuntimeError) and queued.finish_reason == 'cancelled'
+    with pytest.raises(RuntimeError):
+        batcher.submit(model.tokenize('a'), max_tokens=5)
+
+
+@pytest.mark.skipif(local_model.llama_cpp is not None, reason='llama-cpp-python is installed')
+def test_llama_model_needs_llama_cpp():
+    with pytest.raises(ImportError, match='requirements-local.txt'):
+        LlamaCppModel('model.gguf')
@@ -0,0 +1,48 @@
+"""Option pre-filter: dedupe, range checks, sequence extrapolation and the cheap score"""
+
+from option_filter import analyze_options, option_value
+
+
+def _options(*texts):
+    return {f'option_{number}': text for number, text in enumerate(texts, 1)}
+
+
+def test_probability_options_outside_zero_to_one_are_dropped():
+    analysis = analyze_options('Two dice are rolled. What is the probability that both show a six?',
+                               _options('1/36', '1.2', '140%', '1/6', 'Another answer'))
+
+    assert analysis.candidates == [1, 4, 5]
+    assert analysis.eliminated == {2: 'out of range for a probability', 3: 'out of range for a probability'}
+    assert option_value('1/36') == option_value('1/36 chance')
+
+
+def test_probability_mentioned_in_a_count_question_is_not_a_range():
+    analysis = analyze_options('If the probability of drawing a red marble is 1/3, how many marbles are in the bag?',
+                               _options('9 marbles', '12 marbles', '15 marbles', '18 marbles', 'Another answer'))
+
+    assert analysis.candidates == [1, 2, 3, 4, 5] and not analysis.shortlisted
+
+
+def test_whole_count_drops_fractions_and_shortlists():
+    analysis = analyze_options('Gear A turns once. How many full rotations does gear C complete?',
+                               _options('2/3 rotations', '1/6 rotations', '1 full rotation', '-1 rotations',
+                                        'Another answer'))
+
+    assert analysis.candidates == [3, 5] and analysis.reason == 'range'
+    assert analysis.eliminated[4] == 'negative count'
+
+
+def test_sequence_check_and_duplicates():
+    analysis = analyze_options('What comes next: 2, 4, 6, 8, ___?',
+                               _options('10', '10.', '12', '14', 'Another answer'))
+
+    assert analysis.eliminated[2] == 'duplicate of option 1'
+    assert analysis.candidates == [1, 5] and analysis.reason == 'sequence'
+
+
+def test_score_prefers_middle_values():
+    analysis = analyze_options('How long does the whole job take?',
+                               _options('20 minutes', '22 minutes', '23 minutes', '25 minutes', 'Another answer'))
+
+    assert analysis.scores == {1: -1, 2: 0, 3: 0, 4: -1, 5: 0}
+    assert analysis.best() == 3 and analysis.best(default=1) == 2
@@ -0,0 +1,61 @@
+"""ResultWriter / iter_results: reading output while a run is still writing it"""
+
+import pytest
+
+from result_writer import ResultWriter, iter_results
+
+
+def _record(index: int) -> dict:
+    return {'row_index': index, 'predicted_answer': index % 5 + 1, 'raw_response': f'ANSWER: {index}'}
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_partial_output_is_readable_mid_run(tmp_path, compress):
+    writer = ResultWriter(str(tmp_path / 'results.jsonl'), compress=compress)
+    try:
+        for index in range(50):
+            writer.write(_record(index))
+        writer.flush()
+        assert [r['row_index'] for r in iter_results(writer.path)] == list(range(50))
+
+        # More rows after the flush are not visible yet, but must not break the reader
+        for index in range(50, 60):
+            writer.write(_record(index))
+        rows = [r['row_index'] for r in iter_results(writer.path)]
+        assert rows[:50] == list(range(50))
+        assert rows == list(range(len(rows)))
+
+        writer.flush()
+        assert len(list(iter_results(writer.path))) == 60
+    finally:
+        writer.close()
+    assert len(list(iter_results(writer.path))) == 60
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    with ResultWriter(str(path)) as writer:
+        writer.write(_record(0))
+    with open(path, 'ab') as f:
+        f.write(b'{"row_index": 1, "pred')
+    assert [r['row_index'] for r in iter_results(str(path))] == [0]
+
+
+def test_blob_references_resolve_in_compressed_output(tmp_path):
+    with ResultWriter(str(tmp_path / 'results.jsonl.gz'), raw_response='blob') as writer:
+        for index in range(3):
+            writer.write(_record(index))
+    records = list(iter_results(writer.path, resolve_raw=True))
+    assert [r['raw_response'] for r in records] == ['ANSWER: 0', 'ANSWER: 1', 'ANSWER: 2']
+
+
+@pytest.mark.parametrize('name, compress, written', [
+    ('results.jsonl.gz', False, 'results.jsonl'),
+    ('results.jsonl', True, 'results.jsonl.gz')
+])
+def test_suffix_follows_compression(tmp_path, name, compress, written):
+    with ResultWriter(str(tmp_path / name), compress=compress) as writer:
+        writer.write(_record(0))
+
+    assert writer.path == str(tmp_path / written)
+    assert [r['row_index'] for r in iter_results(writer.path)] == [0]
@@ -0,0 +1,32 @@
+"""ResponseCache near-duplicate lookup"""
+
+from records import ReasoningResult
+from verification import ResponseCache, cache_key
+
+OPTIONS = ['1', '2', '8', '15', 'None of the above']
+
+
+def _cache_with(problem: str, options, answer: int) -> ResponseCache:
+    cache = ResponseCache(max_size=8)
+    cache.put(cache_key(problem, options), ReasoningResult(answer, 0.9, f'ANSWER: {answer}', 'regex', 'Math'))
+    return cache
+
+
+def test_near_duplicate_ignores_case_spacing_and_option_order():
+    cache = _cache_with('What is 5 - 3?', OPTIONS, answer=2)
+    reordered = ['None of the above', '15', '8', '2', '1']
+
+    found = cache.find_similar(cache_key('  what IS 5  -   3?', reordered))
+
+    assert found is not None
+    assert reordered[found.predicted_answer - 1] == '2'  # Renumbered to the same option text
+    assert cache.snapshot()['similar_hits'] == 1
+
+
+def test_operators_signs_and_decimals_are_not_normalized_away():
+    cache = _cache_with('What is 5 - 3?', OPTIONS, answer=2)
+
+    assert cache.find_similar(cache_key('What is 5 + 3?', OPTIONS)) is None
+    assert cache.find_similar(cache_key('What is -5 - 3?', OPTIONS)) is None
+    assert cache.find_similar(cache_key('What is 5 - 3.5?', OPTIONS)) is None
+    assert cache.find_similar(cache_key('What is 5 - 3?', ['1', '2', '8', '1.5', 'None of the above'])) is None